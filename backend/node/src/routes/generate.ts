@@ -48,10 +48,16 @@ router.post('/generate-designs', upload.single('productImage'), async (req: Requ
     if (headline) pythonFormData.append('headline', headline);
 
     // Add product image
-    pythonFormData.append('product_image', fs.createReadStream(req.file.path), {
-      filename: req.file.originalname,
-      contentType: req.file.mimetype
-    });
+    const byReference = ['1', 'true', 'yes'].includes((process.env.PYTHON_IMAGE_BY_REFERENCE || '').toLowerCase());
+    if (byReference) {
+      // Python reads the stored upload from the shared uploads directory (its UPLOAD_ROOT)
+      pythonFormData.append('image_ref', req.file.filename);
+    } else {
+      pythonFormData.append('product_image', fs.createReadStream(req.file.path), {
+        filename: req.file.originalname,
+        contentType: req.file.mimetype
+      });
+    }
 
     const pythonUrl = process.env.PYTHON_AI_URL || 'http://localhost:8000';
     console.log(`[Generate] Calling Python API at ${pythonUrl}/generate`);
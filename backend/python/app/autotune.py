@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import platform
+from typing import Any, Dict, List, Optional, Tuple
+import torch
+
+logger = logging.getLogger(__name__)
+
+ATTENTION_CANDIDATES = ("sdpa", "xformers", "sliced", "default")
+
+def get_default_cache_path() -> str:
+    """Get default path of the autotune results cache (~/.cache/adgen/autotune.json)"""
+    return os.getenv("AUTOTUNE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "adgen", "autotune.json"))
+
+def parse_resolutions(value: str) -> List[Tuple[int, int]]:
+    """Parse resolution buckets such as "1024x1024,832x1216" into (width, height) pairs"""
+    resolutions = []
+    for item in value.split(","):
+        width, height = item.strip().lower().split("x")
+        resolutions.append((int(width), int(height)))
+    return resolutions
+
+def _xformers_available() -> bool:
+    try:
+        import xformers  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def apply_attention(pipeline, attention: str):
+    """Set the attention implementation on the UNet and ControlNet of a pipeline"""
+    from diffusers.models.attention_processor import AttnProcessor, AttnProcessor2_0, XFormersAttnProcessor
+
+    for module in (pipeline.unet, pipeline.controlnet):
+        if attention == "sdpa":
+            module.set_attn_processor(AttnProcessor2_0())
+        elif attention == "xformers":
+            module.set_attn_processor(XFormersAttnProcessor())
+        elif attention == "sliced":
+            module.set_attention_slice("auto")
+        elif attention == "default":
+            module.set_attn_processor(AttnProcessor())
+        else:
+            raise ValueError(f"Unknown attention implementation '{attention}'")
+
+class AttentionAutotuner:
+    """
+    Pick the fastest attention implementation and thread count for this machine.
+
+    Times a few UNet + ControlNet denoising steps per candidate at each
+    resolution bucket, discards candidates that run out of memory, and
+    caches the winner under a machine fingerprint so restarts skip trials.
+    """
+
+    def __init__(self,
+                 pipeline,
+                 device: str,
+                 torch_dtype: torch.dtype,
+                 resolutions: Optional[List[Tuple[int, int]]] = None,
+                 trial_steps: int = 2,
+                 cache_path: str = None,
+                 memory_fraction: float = 0.9):
+        self.pipeline = pipeline
+        self.device = device
+        self.torch_dtype = torch_dtype
+        self.resolutions = resolutions or parse_resolutions(os.getenv("AUTOTUNE_RESOLUTIONS", "1024x1024"))
+        self.trial_steps = trial_steps
+        self.cache_path = cache_path or get_default_cache_path()
+        self.memory_fraction = memory_fraction
+
+    def _candidates(self) -> List[str]:
+        candidates = list(ATTENTION_CANDIDATES)
+        # xformers kernels are CUDA only
+        if self.device != "cuda" or not _xformers_available():
+            candidates.remove("xformers")
+        return candidates
+
+    def _thread_candidates(self) -> List[int]:
+        if self.device == "cuda":
+            return [torch.get_num_threads()]
+        logical = os.cpu_count() or 1
+        return sorted({torch.get_num_threads(), logical, max(1, logical // 2)})
+
+    def fingerprint(self) -> str:
+        """Hash of everything that can change which configuration wins"""
+        import diffusers
+
+        info = {
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpuCount": os.cpu_count(),
+            "torch": torch.__version__,
+            "diffusers": diffusers.__version__,
+            "device": self.device,
+            "dtype": str(self.torch_dtype),
+            "model": getattr(self.pipeline, "name_or_path", None) or self.pipeline.config.get("_name_or_path"),
+            "resolutions": self.resolutions,
+            "candidates": self._candidates()
+        }
+        if self.device == "cuda":
+            properties = torch.cuda.get_device_properties(0)
+            info.update({"gpu": properties.name, "gpuMemory": properties.total_memory, "cuda": torch.version.cuda})
+        return hashlib.sha256(json.dumps(info, sort_keys=True).encode()).hexdigest()[:16]
+
+    def _load_cache(self) -> Dict[str, Any]:
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache: Dict[str, Any]):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, "w") as f:
+                json.dump(cache, f, indent=2)
+        except OSError as e:
+            logger.warning(f"Could not save autotune results: {e}")
+
+    def _dummy_inputs(self, width: int, height: int) -> Dict[str, torch.Tensor]:
+        pipeline = self.pipeline
+        kwargs = {"device": self.device, "dtype": self.torch_dtype}
+        seq_len = pipeline.text_encoder.config.max_position_embeddings
+        hidden_dim = pipeline.text_encoder.config.hidden_size + pipeline.text_encoder_2.config.hidden_size
+        scale = pipeline.vae_scale_factor
+        # Classifier-free guidance doubles the batch
+        return {
+            "sample": torch.randn((2, pipeline.unet.config.in_channels, height // scale, width // scale), **kwargs),
+            "encoder_hidden_states": torch.randn((2, seq_len, hidden_dim), **kwargs),
+            "controlnet_cond": torch.rand((2, 3, height, width), **kwargs),
+            "added_cond_kwargs": {
+                "text_embeds": torch.randn((2, pipeline.text_encoder_2.config.projection_dim), **kwargs),
+                "time_ids": torch.tensor([[height, width, 0, 0, height, width]] * 2, **kwargs)
+            }
+        }
+
+    def _denoising_step(self, inputs: Dict[str, Any]):
+        timestep = torch.tensor(999, device=self.device)
+        down_residuals, mid_residual = self.pipeline.controlnet(
+            inputs["sample"],
+            timestep,
+            encoder_hidden_states=inputs["encoder_hidden_states"],
+            controlnet_cond=inputs["controlnet_cond"],
+            added_cond_kwargs=inputs["added_cond_kwargs"],
+            return_dict=False
+        )
+        self.pipeline.unet(
+            inputs["sample"],
+            timestep,
+            encoder_hidden_states=inputs["encoder_hidden_states"],
+            added_cond_kwargs=inputs["added_cond_kwargs"],
+            down_block_additional_residuals=down_residuals,
+            mid_block_additional_residual=mid_residual,
+            return_dict=False
+        )
+
+    def _time_trial(self) -> Optional[float]:
+        """Seconds per denoising step summed over all resolution buckets, or None if it does not fit"""
+        total = 0.0
+        try:
+            with torch.no_grad():
+                for width, height in self.resolutions:
+                    inputs = self._dummy_inputs(width, height)
+                    if self.device == "cuda":
+                        torch.cuda.reset_peak_memory_stats()
+
+                    # Warm-up step so kernel selection is not timed
+                    self._denoising_step(inputs)
+                    if self.device == "cuda":
+                        torch.cuda.synchronize()
+
+                    start = time.perf_counter()
+                    for _ in range(self.trial_steps):
+                        self._denoising_step(inputs)
+                    if self.device == "cuda":
+                        torch.cuda.synchronize()
+                    total += (time.perf_counter() - start) / self.trial_steps
+
+                    if self.device == "cuda":
+                        limit = torch.cuda.get_device_properties(0).total_memory * self.memory_fraction
+                        if torch.cuda.max_memory_allocated() > limit:
+                            return None
+            return total
+
+        except torch.cuda.OutOfMemoryError:
+            return None
+        finally:
+            if self.device == "cuda":
+                torch.cuda.empty_cache()
+
+    def cached(self) -> Optional[Dict[str, Any]]:
+        """Configuration previously found by run() on this machine, or None"""
+        return self._load_cache().get(self.fingerprint())
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Find the best configuration, from the cache when available
+
+        Returns:
+            Dictionary with the chosen attention, numThreads and trial timings
+        """
+        fingerprint = self.fingerprint()
+        cache = self._load_cache()
+        if fingerprint in cache:
+            logger.info(f"Using cached autotune results (fingerprint: {fingerprint})")
+            return cache[fingerprint]
+
+        logger.info(f"Autotuning attention at {self.resolutions} (fingerprint: {fingerprint})...")
+        attention_timings: Dict[str, Optional[float]] = {}
+        for attention in self._candidates():
+            try:
+                apply_attention(self.pipeline, attention)
+            except Exception as e:
+                logger.warning(f"Attention '{attention}' unavailable: {e}")
+                continue
+            attention_timings[attention] = self._time_trial()
+            logger.info(f"Attention '{attention}': {attention_timings[attention]}s per step")
+
+        fitting = {name: t for name, t in attention_timings.items() if t is not None}
+        if not fitting:
+            raise RuntimeError("No attention implementation fits in memory")
+        best_attention = min(fitting, key=fitting.get)
+        apply_attention(self.pipeline, best_attention)
+
+        # Thread count only matters for CPU inference
+        default_threads = torch.get_num_threads()
+        thread_timings: Dict[str, Optional[float]] = {}
+        thread_candidates = self._thread_candidates()
+        if len(thread_candidates) > 1:
+            for num_threads in thread_candidates:
+                torch.set_num_threads(num_threads)
+                thread_timings[str(num_threads)] = self._time_trial()
+                logger.info(f"{num_threads} threads: {thread_timings[str(num_threads)]}s per step")
+            torch.set_num_threads(default_threads)
+
+        fitting_threads = {int(n): t for n, t in thread_timings.items() if t is not None}
+        best_threads = min(fitting_threads, key=fitting_threads.get) if fitting_threads else default_threads
+
+        result = {
+            "attention": best_attention,
+            "numThreads": best_threads,
+            "attentionTimings": attention_timings,
+            "threadTimings": thread_timings,
+            "tunedAt": time.time()
+        }
+        cache[fingerprint] = result
+        self._save_cache(cache)
+        logger.info(f"Autotune selected attention '{best_attention}' with {best_threads} threads")
+        return result
+
+    def apply(self, result: Dict[str, Any]):
+        """Apply a configuration returned by run()"""
+        apply_attention(self.pipeline, result["attention"])
+        torch.set_num_threads(result["numThreads"])
@@ -0,0 +1,31 @@
+from .base import InferenceBackend
+
+BACKENDS = ("torch", "onnx", "fake")
+
+def create_backend(name: str, device: str = "cpu", torch_dtype=None) -> InferenceBackend:
+    """
+    Create an inference backend by name
+    
+    Backends are imported lazily so that e.g. the fake backend does not
+    need diffusers and the PyTorch backend does not need onnxruntime.
+    
+    Args:
+        name: One of "torch", "onnx" or "fake"
+        device: Device to run on
+        torch_dtype: Weight dtype for the PyTorch backend
+        
+    Returns:
+        Backend instance
+    """
+    if name == "torch":
+        from .torch_backend import TorchBackend
+        return TorchBackend(device=device, torch_dtype=torch_dtype)
+    if name == "onnx":
+        from .onnx_backend import OnnxBackend
+        return OnnxBackend(device=device)
+    if name == "fake":
+        from .fake_backend import FakeBackend
+        return FakeBackend(device=device)
+    raise ValueError(f"Unknown inference backend '{name}', expected one of {', '.join(BACKENDS)}")
+
+__all__ = ["InferenceBackend", "BACKENDS", "create_backend"]
@@ -0,0 +1,154 @@
+from abc import ABC, abstractmethod
+from PIL import Image
+from typing import List, Optional, Tuple
+import logging
+import threading
+from ..utils import apply_canny_edge_detection, preprocess_product_image
+
+logger = logging.getLogger(__name__)
+
+class InferenceBackend(ABC):
+    """Engine that turns prompts and control images into generated images"""
+    
+    name = "base"
+    # Whether refine() is implemented; callers check this before accepting refinement work
+    supports_refine = False
+    
+    def __init__(self, device: str = "cpu"):
+        self.device = device
+    
+    @abstractmethod
+    def load(self, base_model_id: str) -> bool:
+        """
+        Load the models needed for generation
+        
+        Args:
+            base_model_id: Base SDXL model identifier
+            
+        Returns:
+            True if loaded successfully, False otherwise
+        """
+    
+    @abstractmethod
+    def is_loaded(self) -> bool:
+        """Check if the backend is ready for inference"""
+    
+    @abstractmethod
+    def generate(
+        self,
+        prompt: str,
+        control_image: Image.Image,
+        negative_prompt: str = "",
+        num_inference_steps: int = 30,
+        guidance_scale: float = 7.5,
+        controlnet_conditioning_scale: float = 1.0,
+        seed: Optional[int] = None,
+        width: int = 1024,
+        height: int = 1024,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[Image.Image]:
+        """
+        Generate an image with ControlNet conditioning
+        
+        Backends check cancel_event between denoising steps and raise
+        GenerationCancelled once it is set.
+        
+        Returns:
+            Generated image or None if failed
+        """
+    
+    def generate_batch(
+        self,
+        prompts: List[str],
+        control_image: Image.Image,
+        negative_prompt: str = "",
+        num_inference_steps: int = 30,
+        guidance_scale: float = 7.5,
+        controlnet_conditioning_scale: float = 1.0,
+        seeds: Optional[List[Optional[int]]] = None,
+        width: int = 1024,
+        height: int = 1024,
+        cancel_event: Optional[threading.Event] = None
+    ) -> List[Optional[Image.Image]]:
+        """
+        Generate one image per prompt from a shared control image
+        
+        Backends that can run several prompts in one denoising batch
+        override this; the default generates them one at a time. Batching
+        backends let torch.cuda.OutOfMemoryError propagate so callers can
+        retry with smaller batches.
+        
+        Returns:
+            One generated image (or None if failed) per prompt
+        """
+        seeds = seeds or [None] * len(prompts)
+        return [
+            self.generate(
+                prompt=prompt,
+                control_image=control_image,
+                negative_prompt=negative_prompt,
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                controlnet_conditioning_scale=controlnet_conditioning_scale,
+                seed=seed,
+                width=width,
+                height=height,
+                cancel_event=cancel_event
+            )
+            for prompt, seed in zip(prompts, seeds)
+        ]
+    
+    def refine(
+        self,
+        prompt: str,
+        init_image: Image.Image,
+        control_image: Image.Image,
+        negative_prompt: str = "",
+        strength: float = 0.35,
+        num_inference_steps: int = 30,
+        guidance_scale: float = 7.5,
+        controlnet_conditioning_scale: float = 1.0,
+        seed: Optional[int] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[Image.Image]:
+        """
+        Refine an existing image with ControlNet img2img
+        
+        Only available on backends that set supports_refine.
+        
+        Returns:
+            Refined image or None if failed
+            
+        Raises:
+            NotImplementedError: If the backend does not support refinement
+        """
+        raise NotImplementedError(f"The {self.name} backend does not support refinement")
+    
+    def prepare_control_image(self, product_image: Image.Image, target_size: Tuple[int, int] = (1024, 1024)) -> Optional[Image.Image]:
+        """
+        Prepare product image for ControlNet conditioning
+        
+        Args:
+            product_image: Input product image
+            target_size: Target image dimensions
+            
+        Returns:
+            Processed control image or None if failed
+        """
+        try:
+            processed_image = preprocess_product_image(product_image, target_size)
+            control_image = apply_canny_edge_detection(processed_image)
+            logger.info(f"Control image prepared: {control_image.size}")
+            return control_image
+            
+        except Exception as e:
+            logger.error(f"Failed to prepare control image: {e}")
+            return None
+    
+    def enable_feature_cache(self, interval: int = 3, depth: int = 1) -> bool:
+        """Reuse deep UNet features across denoising steps, if supported"""
+        logger.warning(f"UNet feature caching is not supported by the {self.name} backend")
+        return False
+    
+    def cleanup(self):
+        """Release models and memory"""
@@ -0,0 +1,70 @@
+from PIL import Image
+from typing import Optional
+import time
+import random
+import logging
+import threading
+from .base import InferenceBackend
+from ..utils import raise_if_cancelled
+
+logger = logging.getLogger(__name__)
+
+class FakeBackend(InferenceBackend):
+    """
+    Model-free backend for tests and load testing.
+    
+    Sleeps for a configurable time per image and returns the control image
+    tinted with a seed-dependent color, so results are deterministic.
+    """
+    
+    name = "fake"
+    supports_refine = True
+    
+    def __init__(self, device: str = "cpu", latency: float = 0.0, jitter: float = 0.0):
+        super().__init__(device)
+        self.latency = latency
+        self.jitter = jitter
+        self._is_loaded = False
+    
+    def load(self, base_model_id: str) -> bool:
+        logger.info(f"Fake backend loaded (latency: {self.latency}s per image)")
+        self._is_loaded = True
+        return True
+    
+    def is_loaded(self) -> bool:
+        return self._is_loaded
+    
+    def _sleep(self, fraction: float = 1.0, cancel_event: Optional[threading.Event] = None):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            # Waiting on the event lets a cancellation cut the sleep short, like a step callback would
+            if cancel_event is not None:
+                cancel_event.wait(delay * fraction)
+            else:
+                time.sleep(delay * fraction)
+        raise_if_cancelled(cancel_event)
+    
+    def _tint(self, image: Image.Image, seed: Optional[int]) -> Image.Image:
+        rng = random.Random(seed)
+        color = Image.new("RGB", image.size, tuple(rng.randrange(256) for _ in range(3)))
+        return Image.blend(image.convert("RGB"), color, 0.5)
+    
+    def generate(self, prompt: str, control_image: Image.Image, negative_prompt: str = "",
+                 num_inference_steps: int = 30, guidance_scale: float = 7.5,
+                 controlnet_conditioning_scale: float = 1.0, seed: Optional[int] = None,
+                 width: int = 1024, height: int = 1024,
+                 cancel_event: Optional[threading.Event] = None) -> Optional[Image.Image]:
+        self._sleep(cancel_event=cancel_event)
+        return self._tint(control_image.resize((width, height)), seed)
+    
+    def refine(self, prompt: str, init_image: Image.Image, control_image: Image.Image,
+               negative_prompt: str = "", strength: float = 0.35, num_inference_steps: int = 30,
+               guidance_scale: float = 7.5, controlnet_conditioning_scale: float = 1.0,
+               seed: Optional[int] = None,
+               cancel_event: Optional[threading.Event] = None) -> Optional[Image.Image]:
+        # img2img only runs a `strength` fraction of the steps
+        self._sleep(strength, cancel_event=cancel_event)
+        return Image.blend(init_image.convert("RGB"), self._tint(init_image, seed), strength)
+    
+    def cleanup(self):
+        self._is_loaded = False
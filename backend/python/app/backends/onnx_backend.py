@@ -0,0 +1,221 @@
+from PIL import Image
+from typing import Any, Dict, Optional, Tuple
+import os
+import json
+import logging
+import threading
+import numpy as np
+from .base import InferenceBackend
+from ..utils import GenerationCancelled, raise_if_cancelled
+
+logger = logging.getLogger(__name__)
+
+# Written by scripts/export_onnx.py next to the exported graphs
+ONNX_CONFIG_FILE = "onnx_config.json"
+ONNX_GRAPHS = ("text_encoder", "text_encoder_2", "controlnet", "unet", "vae_decoder")
+
+def get_default_onnx_dir() -> str:
+    """Get default directory of the exported ONNX graphs (backend/python/models/onnx)"""
+    backends_dir = os.path.dirname(os.path.abspath(__file__))  # backend/python/app/backends
+    backend_python_dir = os.path.dirname(os.path.dirname(backends_dir))  # backend/python
+    return os.getenv("ONNX_MODEL_DIR", os.path.join(backend_python_dir, "models", "onnx"))
+
+class OnnxBackend(InferenceBackend):
+    """
+    ONNX Runtime backend for CPU fleets.
+
+    Runs the exported text encoders, ControlNet, UNet and VAE decoder graphs
+    with full graph optimizations, driving the denoising loop with the
+    diffusers scheduler saved alongside them.
+
+    Where the graphs run is chosen by ONNX_PROVIDERS, not by `device`.
+    Initial latents come from torch's CPU generator, as in the PyTorch
+    backend on CPU, so a seed starts from the same noise there; results
+    still differ slightly from PyTorch's numerics and do not match the
+    PyTorch backend on CUDA, whose generator draws different noise.
+    Refinement (img2img) is not supported.
+    """
+
+    name = "onnx"
+
+    def __init__(self, device: str = "cpu", model_dir: str = None, num_threads: Optional[int] = None):
+        super().__init__(device)
+        self.model_dir = model_dir or get_default_onnx_dir()
+        if num_threads is None and os.getenv("ONNX_NUM_THREADS"):
+            num_threads = int(os.getenv("ONNX_NUM_THREADS"))
+        self.num_threads = num_threads
+        self.sessions: Dict[str, Any] = {}
+        self.config: Dict[str, Any] = {}
+        self.tokenizer = None
+        self.tokenizer_2 = None
+        self.scheduler = None
+
+    def _create_session(self, path: str):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+
+        providers = os.getenv("ONNX_PROVIDERS", "CPUExecutionProvider").split(",")
+        if self.device != "cpu" and providers == ["CPUExecutionProvider"]:
+            logger.warning(f"ONNX backend runs on CPU although device is {self.device}; set ONNX_PROVIDERS to use it")
+        return ort.InferenceSession(path, sess_options=options, providers=providers)
+
+    def load(self, base_model_id: str) -> bool:
+        try:
+            import diffusers
+            from transformers import CLIPTokenizer
+
+            logger.info(f"Loading ONNX graphs from {self.model_dir}...")
+
+            with open(os.path.join(self.model_dir, ONNX_CONFIG_FILE)) as f:
+                self.config = json.load(f)
+
+            if self.config.get("baseModelId") != base_model_id:
+                logger.warning(f"ONNX graphs were exported from {self.config.get('baseModelId')}, not {base_model_id}")
+
+            for graph in ONNX_GRAPHS:
+                self.sessions[graph] = self._create_session(os.path.join(self.model_dir, graph, "model.onnx"))
+
+            self.tokenizer = CLIPTokenizer.from_pretrained(os.path.join(self.model_dir, "tokenizer"))
+            self.tokenizer_2 = CLIPTokenizer.from_pretrained(os.path.join(self.model_dir, "tokenizer_2"))
+
+            scheduler_dir = os.path.join(self.model_dir, "scheduler")
+            with open(os.path.join(scheduler_dir, "scheduler_config.json")) as f:
+                scheduler_class = getattr(diffusers, json.load(f)["_class_name"])
+            self.scheduler = scheduler_class.from_pretrained(scheduler_dir)
+
+            logger.info(f"ONNX Runtime backend loaded (providers: {self.sessions['unet'].get_providers()})")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to load ONNX backend: {e}")
+            self.cleanup()
+            return False
+
+    def is_loaded(self) -> bool:
+        return len(self.sessions) == len(ONNX_GRAPHS) and self.scheduler is not None
+
+    @property
+    def _dtype(self):
+        return np.float16 if self.config.get("dtype") == "float16" else np.float32
+
+    def _tokenize(self, tokenizer, text: str) -> np.ndarray:
+        # The text encoder graphs are traced with a fixed sequence length;
+        # exports predating seqLen were traced with model_max_length
+        return tokenizer(
+            text,
+            padding="max_length",
+            max_length=self.config.get("seqLen") or tokenizer.model_max_length,
+            truncation=True,
+            return_tensors="np"
+        ).input_ids.astype(np.int64)
+
+    def _encode_text(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return SDXL prompt embeddings and pooled embeddings for one prompt"""
+        hidden_1 = self.sessions["text_encoder"].run(
+            ["hidden_states"], {"input_ids": self._tokenize(self.tokenizer, text)}
+        )[0]
+        pooled, hidden_2 = self.sessions["text_encoder_2"].run(
+            ["text_embeds", "hidden_states"], {"input_ids": self._tokenize(self.tokenizer_2, text)}
+        )
+        return np.concatenate([hidden_1, hidden_2], axis=-1), pooled
+
+    def _encode_prompt(self, prompt: str, negative_prompt: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return classifier-free guidance batches (negative first) of prompt and pooled embeddings"""
+        prompt_embeds, pooled = self._encode_text(prompt)
+        if negative_prompt:
+            negative_embeds, negative_pooled = self._encode_text(negative_prompt)
+        else:
+            # SDXL uses zero embeddings for an empty negative prompt
+            negative_embeds, negative_pooled = np.zeros_like(prompt_embeds), np.zeros_like(pooled)
+        return np.concatenate([negative_embeds, prompt_embeds]), np.concatenate([negative_pooled, pooled])
+
+    def _initial_latents(self, seed: Optional[int], height: int, width: int):
+        """Starting noise, drawn like diffusers draws it on CPU so seeds match the PyTorch backend there"""
+        import torch
+
+        generator = torch.Generator(device="cpu").manual_seed(seed) if seed is not None else None
+        return torch.randn((1, 4, height // 8, width // 8), generator=generator, dtype=torch.float32)
+
+    def _new_scheduler(self):
+        """Fresh scheduler for one generation; set_timesteps() and step() keep per-run state"""
+        return self.scheduler.__class__.from_config(self.scheduler.config)
+
+    def generate(self, prompt: str, control_image: Image.Image, negative_prompt: str = "",
+                 num_inference_steps: int = 30, guidance_scale: float = 7.5,
+                 controlnet_conditioning_scale: float = 1.0, seed: Optional[int] = None,
+                 width: int = 1024, height: int = 1024,
+                 cancel_event: Optional[threading.Event] = None) -> Optional[Image.Image]:
+        if not self.is_loaded():
+            logger.error("ONNX backend not loaded. Call load() first.")
+            return None
+
+        try:
+            import torch
+
+            dtype = self._dtype
+            logger.info(f"Generating image with ONNX Runtime (steps: {num_inference_steps}, guidance: {guidance_scale})")
+
+            prompt_embeds, pooled = self._encode_prompt(prompt, negative_prompt)
+            prompt_embeds, pooled = prompt_embeds.astype(dtype), pooled.astype(dtype)
+            time_ids = np.array([[height, width, 0, 0, height, width]] * 2, dtype=dtype)
+
+            control = np.asarray(control_image.convert("RGB").resize((width, height)), dtype=np.float32) / 255.0
+            control = np.repeat(control.transpose(2, 0, 1)[None], 2, axis=0).astype(dtype)
+            scale = np.array(controlnet_conditioning_scale, dtype=dtype)
+
+            latents = self._initial_latents(seed, height, width)
+            scheduler = self._new_scheduler()
+            scheduler.set_timesteps(num_inference_steps)
+            latents = latents * scheduler.init_noise_sigma
+
+            num_residuals = self.config["controlnetResiduals"]
+            residual_names = [f"down_{i}" for i in range(num_residuals)] + ["mid"]
+
+            for t in scheduler.timesteps:
+                raise_if_cancelled(cancel_event)
+                model_input = scheduler.scale_model_input(torch.cat([latents] * 2), t)
+                common = {
+                    "sample": model_input.numpy().astype(dtype),
+                    "timestep": np.array([float(t)], dtype=dtype),
+                    "encoder_hidden_states": prompt_embeds,
+                    "text_embeds": pooled,
+                    "time_ids": time_ids
+                }
+
+                residuals = self.sessions["controlnet"].run(
+                    residual_names,
+                    {**common, "controlnet_cond": control, "conditioning_scale": scale}
+                )
+                noise_pred = self.sessions["unet"].run(
+                    ["noise_pred"], {**common, **dict(zip(residual_names, residuals))}
+                )[0].astype(np.float32)
+
+                noise_uncond, noise_text = noise_pred[0:1], noise_pred[1:2]
+                noise_pred = noise_uncond + guidance_scale * (noise_text - noise_uncond)
+                latents = scheduler.step(torch.from_numpy(noise_pred), t, latents).prev_sample
+
+            # The VAE decoder is always exported in float32: SDXL's VAE overflows in float16
+            image = self.sessions["vae_decoder"].run(
+                ["image"], {"latent": latents.numpy().astype(np.float32)}
+            )[0].astype(np.float32)
+            image = np.clip(image[0].transpose(1, 2, 0) / 2 + 0.5, 0, 1)
+
+            logger.info("Image generated successfully with ONNX Runtime")
+            return Image.fromarray((image * 255).round().astype(np.uint8))
+
+        except GenerationCancelled:
+            logger.info("ONNX generation cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"ONNX generation failed: {e}")
+            return None
+
+    def cleanup(self):
+        self.sessions = {}
+        self.scheduler = None
+        self.tokenizer = None
+        self.tokenizer_2 = None
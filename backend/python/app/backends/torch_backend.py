@@ -0,0 +1,99 @@
+from PIL import Image
+from typing import List, Optional, Tuple
+import logging
+import threading
+import torch
+from .base import InferenceBackend
+from ..controlnet import ControlNetProcessor
+from ..snapshot import get_default_snapshot_dir, has_snapshot
+
+logger = logging.getLogger(__name__)
+
+class TorchBackend(InferenceBackend):
+    """PyTorch backend running the diffusers SDXL ControlNet pipelines"""
+    
+    name = "torch"
+    supports_refine = True
+    
+    def __init__(self, device: str = "cuda", torch_dtype: torch.dtype = torch.float16, snapshot_dir: str = None):
+        super().__init__(device)
+        self.processor = ControlNetProcessor(device=device, torch_dtype=torch_dtype)
+        self.snapshot_dir = snapshot_dir or get_default_snapshot_dir()
+    
+    def load(self, base_model_id: str) -> bool:
+        # A local snapshot skips hub resolution and loads weights zero-copy
+        if has_snapshot(self.snapshot_dir):
+            if self.processor.load_from_snapshot(self.snapshot_dir, base_model_id):
+                return True
+            logger.warning("Falling back to loading the pipeline from the model hub")
+        
+        if not self.processor.load_controlnet():
+            return False
+        return self.processor.create_pipeline(base_model_id) is not None
+    
+    def is_loaded(self) -> bool:
+        return self.processor.is_loaded() and self.processor.pipeline is not None
+    
+    def generate(self, prompt: str, control_image: Image.Image, negative_prompt: str = "",
+                 num_inference_steps: int = 30, guidance_scale: float = 7.5,
+                 controlnet_conditioning_scale: float = 1.0, seed: Optional[int] = None,
+                 width: int = 1024, height: int = 1024,
+                 cancel_event: Optional[threading.Event] = None) -> Optional[Image.Image]:
+        return self.processor.generate_with_controlnet(
+            prompt=prompt,
+            control_image=control_image,
+            negative_prompt=negative_prompt,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            controlnet_conditioning_scale=controlnet_conditioning_scale,
+            seed=seed,
+            width=width,
+            height=height,
+            cancel_event=cancel_event
+        )
+    
+    def generate_batch(self, prompts: List[str], control_image: Image.Image, negative_prompt: str = "",
+                       num_inference_steps: int = 30, guidance_scale: float = 7.5,
+                       controlnet_conditioning_scale: float = 1.0, seeds: Optional[List[Optional[int]]] = None,
+                       width: int = 1024, height: int = 1024,
+                       cancel_event: Optional[threading.Event] = None) -> List[Optional[Image.Image]]:
+        images = self.processor.generate_batch_with_controlnet(
+            prompts=prompts,
+            control_image=control_image,
+            negative_prompt=negative_prompt,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            controlnet_conditioning_scale=controlnet_conditioning_scale,
+            seeds=seeds,
+            width=width,
+            height=height,
+            cancel_event=cancel_event
+        )
+        return images if images is not None else [None] * len(prompts)
+    
+    def refine(self, prompt: str, init_image: Image.Image, control_image: Image.Image,
+               negative_prompt: str = "", strength: float = 0.35, num_inference_steps: int = 30,
+               guidance_scale: float = 7.5, controlnet_conditioning_scale: float = 1.0,
+               seed: Optional[int] = None,
+               cancel_event: Optional[threading.Event] = None) -> Optional[Image.Image]:
+        return self.processor.generate_img2img_with_controlnet(
+            prompt=prompt,
+            init_image=init_image,
+            control_image=control_image,
+            negative_prompt=negative_prompt,
+            strength=strength,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            controlnet_conditioning_scale=controlnet_conditioning_scale,
+            seed=seed,
+            cancel_event=cancel_event
+        )
+    
+    def prepare_control_image(self, product_image: Image.Image, target_size: Tuple[int, int] = (1024, 1024)) -> Optional[Image.Image]:
+        return self.processor.prepare_control_image(product_image, target_size)
+    
+    def enable_feature_cache(self, interval: int = 3, depth: int = 1) -> bool:
+        return self.processor.enable_feature_cache(interval=interval, depth=depth)
+    
+    def cleanup(self):
+        self.processor.cleanup()
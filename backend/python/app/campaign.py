@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import logging
+from itertools import islice
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+from PIL import Image
+from .exporter import parse_platforms
+from .generator import SDXLGenerator
+
+logger = logging.getLogger(__name__)
+
+RESULTS_FILE = "results.jsonl"
+CHECKPOINT_FILE = "checkpoint.json"
+
+# Set on manifest entries that cannot be processed
+MANIFEST_ERROR = "manifestError"
+
+# Manifest entries whose prompts are built together
+PROMPT_BATCH = 256
+
+def _validate_entry(entry: Any) -> Optional[str]:
+    """Describe what is wrong with a manifest entry, or None if it is valid"""
+    if not isinstance(entry, dict):
+        return "Entry is not a JSON object"
+    missing = [key for key in ("productImage", "trendProfile") if not entry.get(key)]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    return None
+
+def _parse_export_platforms(value: Any) -> List[str]:
+    """Validate exportPlatforms given as a list or a comma-separated string, like /generate does"""
+    if isinstance(value, list):
+        if not all(isinstance(name, str) for name in value):
+            raise ValueError("exportPlatforms must be a list of platform names")
+        value = ",".join(value)
+    elif value is not None and not isinstance(value, str):
+        raise ValueError("exportPlatforms must be a list or a comma-separated string")
+    return parse_platforms(value)
+
+def iter_manifest(manifest_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream entries from a JSONL campaign manifest
+
+    Each line holds at least productImage (a path, relative paths resolve
+    against the manifest directory) and trendProfile. Entries without an
+    id are identified by their line number. Lines that are not valid
+    entries are yielded with a MANIFEST_ERROR describing the problem, so
+    one bad line does not abort the campaign.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                yield {"id": f"line-{line_number}", MANIFEST_ERROR: f"Invalid JSON: {e}"}
+                continue
+
+            error = _validate_entry(entry)
+            if error:
+                entry_id = entry.get("id") if isinstance(entry, dict) else None
+                yield {"id": entry_id or f"line-{line_number}", MANIFEST_ERROR: error}
+                continue
+
+            entry.setdefault("id", f"line-{line_number}")
+            try:
+                entry["exportPlatforms"] = _parse_export_platforms(entry.get("exportPlatforms"))
+            except ValueError as e:
+                yield {"id": entry["id"], MANIFEST_ERROR: str(e)}
+                continue
+            entry["productImage"] = os.path.join(base_dir, entry["productImage"])
+            yield entry
+
+def load_completed_ids(results_path: str) -> Set[str]:
+    """IDs of manifest entries that already have a successful result"""
+    completed = set()
+    if not os.path.isfile(results_path):
+        return completed
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partial last line from a crash
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+class CampaignRunner:
+    """
+    Generate ads for every entry of a campaign manifest, resumably.
+
+    Prompts of upcoming entries are built in batches, image decoding and
+    control image preparation for them run on a thread pool while the
+    current entry is denoised, and the
+    variations of each entry are denoised in batches. Every finished entry
+    is appended to results.jsonl, which is also what a restarted run reads
+    to skip completed work; checkpoint.json summarizes progress.
+    """
+
+    def __init__(self,
+                 generator: SDXLGenerator,
+                 output_dir: str,
+                 batch_size: int = 4,
+                 prefetch: int = 4,
+                 prefetch_workers: int = 2):
+        self.generator = generator
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.prefetch_workers = prefetch_workers
+        self.results_path = os.path.join(output_dir, RESULTS_FILE)
+        self.checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+
+    def _prepare(self, entry: Dict[str, Any]) -> Tuple[Image.Image, Image.Image]:
+        """Decode the product image and build its control image (runs on the prefetch pool)"""
+        with Image.open(entry["productImage"]) as image:
+            product_image = image.convert("RGB")
+        control_image = self.generator.backend.prepare_control_image(product_image)
+        if not control_image:
+            raise ValueError(f"Failed to prepare control image from {entry['productImage']}")
+        return product_image, control_image
+
+    def _build_prompts(self, entries: List[Dict[str, Any]]):
+        """Build the prompts of valid entries in one batch per brand, so generate_ads() finds them memoized"""
+        profiles_by_brand: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            if MANIFEST_ERROR not in entry:
+                profiles_by_brand.setdefault(entry.get("brandName", ""), []).append(entry["trendProfile"])
+        for brand_name, profiles in profiles_by_brand.items():
+            self.generator.prompt_builder.build_prompts(profiles, brand_name=brand_name)
+
+    def _prefetched(self, entries: Iterator[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Optional[Future]]]:
+        """Yield entries with their preparation future (None for invalid entries), keeping `prefetch` in flight"""
+        entries = iter(entries)
+        with ThreadPoolExecutor(max_workers=self.prefetch_workers, thread_name_prefix="campaign-prefetch") as pool:
+            pending: Deque[Tuple[Dict[str, Any], Optional[Future]]] = deque()
+            while True:
+                batch = list(islice(entries, PROMPT_BATCH))
+                if not batch:
+                    break
+                self._build_prompts(batch)
+                for entry in batch:
+                    prepared = None if MANIFEST_ERROR in entry else pool.submit(self._prepare, entry)
+                    pending.append((entry, prepared))
+                    if len(pending) > self.prefetch:
+                        yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+
+    def _append_result(self, record: Dict[str, Any]):
+        with open(self.results_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_checkpoint(self, progress: Dict[str, Any]):
+        # Replace atomically so a crash never leaves a truncated checkpoint
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({**progress, "updatedAt": time.time()}, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _generate(self, entry: Dict[str, Any], prepared: Optional[Future]) -> Dict[str, Any]:
+        if MANIFEST_ERROR in entry:
+            raise ValueError(entry[MANIFEST_ERROR])
+        product_image, control_image = prepared.result()
+        result = self.generator.generate_ads(
+            product_image=product_image,
+            trend_profile=entry["trendProfile"],
+            brand_name=entry.get("brandName", ""),
+            headline=entry.get("headline", ""),
+            num_images=entry.get("numImages", 4),
+            num_inference_steps=entry.get("numInferenceSteps", 30),
+            guidance_scale=entry.get("guidanceScale", 7.5),
+            controlnet_conditioning_scale=entry.get("controlnetConditioningScale", 1.0),
+            base_seed=entry.get("seed"),
+            control_image=control_image,
+            batch_size=self.batch_size,
+            export_platforms=entry.get("exportPlatforms")
+        )
+        if result.get("batchSize", self.batch_size) < self.batch_size:
+            # Out of memory at this batch size; later entries would fail the same way
+            logger.warning(f"Lowering campaign batch size from {self.batch_size} to {result['batchSize']}")
+            self.batch_size = result["batchSize"]
+        return {"id": entry["id"], "status": "ok", **result}
+
+    def run(self, manifest_path: str, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Process a manifest, skipping entries completed by a previous run
+
+        Args:
+            manifest_path: Path of the JSONL manifest
+            limit: Stop after this many entries have been processed
+
+        Returns:
+            Progress summary, as also written to checkpoint.json
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        completed = load_completed_ids(self.results_path)
+        if completed:
+            logger.info(f"Resuming campaign: {len(completed)} entries already completed")
+
+        progress = {
+            "manifest": os.path.abspath(manifest_path),
+            "completed": len(completed),
+            "failed": 0,
+            "processed": 0
+        }
+        start = time.perf_counter()
+        entries = (entry for entry in iter_manifest(manifest_path) if entry["id"] not in completed)
+
+        for entry, prepared in self._prefetched(entries):
+            try:
+                record = self._generate(entry, prepared)
+                progress["completed"] += 1
+                completed.add(entry["id"])
+            except Exception as e:
+                # Failed entries are retried by the next run
+                logger.error(f"Campaign entry {entry['id']} failed: {e}")
+                record = {"id": entry["id"], "status": "failed", "error": str(e)}
+                progress["failed"] += 1
+
+            self._append_result(record)
+            progress["processed"] += 1
+            progress["lastId"] = entry["id"]
+            progress["elapsedSeconds"] = time.perf_counter() - start
+            self._write_checkpoint(progress)
+
+            if progress["processed"] % 10 == 0:
+                rate = progress["processed"] / progress["elapsedSeconds"]
+                logger.info(f"Campaign progress: {progress['completed']} completed, {progress['failed']} failed ({rate:.2f} entries/s)")
+
+            if limit is not None and progress["processed"] >= limit:
+                break
+
+        logger.info(f"Campaign finished: {progress['completed']} completed, {progress['failed']} failed")
+        return progress
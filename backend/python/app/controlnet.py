@@ -1,20 +1,37 @@
 from PIL import Image
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
+import os
 import logging
+import threading
+from contextlib import contextmanager
 import torch
-from diffusers import ControlNetModel, StableDiffusionXLControlNetPipeline
-from .utils import apply_canny_edge_detection, preprocess_product_image
+from diffusers import ControlNetModel, StableDiffusionXLControlNetPipeline, StableDiffusionXLControlNetImg2ImgPipeline
+from .autotune import AttentionAutotuner, apply_attention
+from .feature_cache import UNetFeatureCache
+from .snapshot import check_snapshot_manifest, load_pipeline_snapshot, read_snapshot_manifest
+from .utils import GenerationCancelled, apply_canny_edge_detection, preprocess_product_image, raise_if_cancelled
 
 logger = logging.getLogger(__name__)
 
+CONTROLNET_MODEL_ID = "diffusers/controlnet-canny-sdxl-1.0"
+
 class ControlNetProcessor:
     """Handle ControlNet conditioning for product image guidance"""
     
-    def __init__(self, device: str = "cuda", torch_dtype: torch.dtype = torch.float16):
+    def __init__(self, device: str = "cuda", torch_dtype: torch.dtype = torch.float16, autotune: Optional[bool] = None):
         self.device = device
         self.torch_dtype = torch_dtype
+        # Tune attention settings per machine instead of assuming xformers + slicing
+        if autotune is None:
+            autotune = os.getenv("AUTOTUNE_ATTENTION", "0") == "1"
+        self.autotune = autotune
         self.controlnet = None
         self.pipeline = None
+        self.img2img_pipeline = None
+        self.feature_cache: Optional[UNetFeatureCache] = None
+        # The UNet, its scheduler and the feature cache are shared state, so one pipeline call runs at a time
+        self._pipeline_lock = threading.RLock()
+        self._autotune_thread: Optional[threading.Thread] = None
         self._is_loaded = False
     
     def load_controlnet(self) -> bool:
@@ -29,7 +46,7 @@ class ControlNetProcessor:
             
             # Load ControlNet model (Canny edge detection)
             self.controlnet = ControlNetModel.from_pretrained(
-                "diffusers/controlnet-canny-sdxl-1.0",
+                CONTROLNET_MODEL_ID,
                 torch_dtype=self.torch_dtype,
                 use_safetensors=True
             )
@@ -81,21 +98,7 @@ class ControlNetProcessor:
                 variant="fp16" if self.torch_dtype == torch.float16 else None
             )
             
-            if self.device == "cuda":
-                self.pipeline = self.pipeline.to(self.device)
-                
-                # Enable memory efficient attention
-                if hasattr(self.pipeline, 'enable_xformers_memory_efficient_attention'):
-                    try:
-                        self.pipeline.enable_xformers_memory_efficient_attention()
-                    except Exception as e:
-                        logger.warning(f"Could not enable xformers: {e}")
-                
-                # Enable attention slicing for memory efficiency
-                self.pipeline.enable_attention_slicing()
-                
-                # Enable CPU offload if memory is limited
-                # self.pipeline.enable_model_cpu_offload()
+            self._configure_pipeline()
             
             logger.info("SDXL ControlNet pipeline created successfully")
             return self.pipeline
@@ -104,6 +107,184 @@ class ControlNetProcessor:
             logger.error(f"Failed to create ControlNet pipeline: {e}")
             return None
     
+    def _configure_pipeline(self):
+        """Move the pipeline to the device and pick its attention implementation"""
+        if self.device == "cuda":
+            self.pipeline = self.pipeline.to(self.device)
+        
+        if not self.autotune:
+            self._apply_static_attention()
+        elif not self.apply_tuned_attention():
+            # Trials take minutes: serve with the static settings until they finish
+            self._start_autotune_warmup()
+    
+    def _start_autotune_warmup(self):
+        """Run autotune_attention() on a background thread"""
+        self._autotune_thread = threading.Thread(target=self.autotune_attention, name="attention-autotune", daemon=True)
+        self._autotune_thread.start()
+    
+    def _apply_static_attention(self):
+        """Attention settings used without autotune results"""
+        if self.device == "cuda":
+            # Enable memory efficient attention
+            if hasattr(self.pipeline, 'enable_xformers_memory_efficient_attention'):
+                try:
+                    self.pipeline.enable_xformers_memory_efficient_attention()
+                except Exception as e:
+                    logger.warning(f"Could not enable xformers: {e}")
+            
+            # Enable attention slicing for memory efficiency
+            self.pipeline.enable_attention_slicing()
+            
+            # Enable CPU offload if memory is limited
+            # self.pipeline.enable_model_cpu_offload()
+    
+    def load_from_snapshot(self, snapshot_dir: str, base_model_id: str = "stabilityai/stable-diffusion-xl-base-1.0") -> bool:
+        """
+        Load ControlNet and pipeline from a local snapshot written by scripts/snapshot_pipeline.py
+        
+        Weights are memory-mapped from the snapshot's safetensors files in
+        their stored dtype, without hub lookups or intermediate copies.
+        Snapshots of other models or another dtype are refused.
+        
+        Args:
+            snapshot_dir: Snapshot directory
+            base_model_id: Base SDXL model the snapshot must have been built from
+            
+        Returns:
+            True if loaded successfully, False otherwise
+        """
+        try:
+            mismatch = check_snapshot_manifest(
+                read_snapshot_manifest(snapshot_dir), base_model_id, CONTROLNET_MODEL_ID, self.torch_dtype
+            )
+            if mismatch:
+                logger.warning(f"Not using pipeline snapshot {snapshot_dir}: {mismatch}")
+                return False
+            
+            logger.info(f"Loading SDXL ControlNet pipeline from snapshot {snapshot_dir}...")
+            
+            self.pipeline = load_pipeline_snapshot(snapshot_dir, StableDiffusionXLControlNetPipeline)
+            self.controlnet = self.pipeline.controlnet
+            self._is_loaded = True
+            
+            self._configure_pipeline()
+            
+            logger.info("SDXL ControlNet pipeline loaded from snapshot")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to load pipeline snapshot: {e}")
+            self.pipeline = None
+            self.controlnet = None
+            self._is_loaded = False
+            return False
+    
+    def _restore_static_attention(self):
+        """Undo partially applied tuning and fall back to the static settings"""
+        apply_attention(self.pipeline, "sdpa")
+        self._apply_static_attention()
+    
+    def apply_tuned_attention(self) -> bool:
+        """
+        Apply the configuration autotune_attention() cached for this machine
+        
+        Returns:
+            True if tuned settings were applied, False if there are none or
+            they failed; the static settings are in place then
+        """
+        try:
+            autotuner = AttentionAutotuner(self.pipeline, self.device, self.torch_dtype)
+            result = autotuner.cached()
+            if result is None:
+                logger.info("No autotune results for this machine, using static attention settings until tuning finishes")
+                self._apply_static_attention()
+                return False
+            autotuner.apply(result)
+            logger.info(f"Applied tuned attention '{result['attention']}' with {result['numThreads']} threads")
+            return True
+            
+        except Exception as e:
+            logger.warning(f"Could not apply autotune results, using static attention settings: {e}")
+            self._restore_static_attention()
+            return False
+    
+    def autotune_attention(self) -> bool:
+        """
+        Measure and apply the fastest attention implementation and thread count that fits in memory
+        
+        Runs full-size denoising trials, which take minutes on CPU; the
+        result is cached so later loads apply it with apply_tuned_attention().
+        Generations wait for the trials, which run without the feature cache
+        so every trial step times the full UNet.
+        
+        Returns:
+            True if tuned settings were applied, False if tuning failed
+        """
+        with self._pipeline_lock:
+            if self.pipeline is None:
+                return False
+            
+            feature_cache = self.feature_cache
+            if feature_cache:
+                feature_cache.disable()
+            try:
+                autotuner = AttentionAutotuner(self.pipeline, self.device, self.torch_dtype)
+                autotuner.apply(autotuner.run())
+                return True
+                
+            except Exception as e:
+                # Fall back to the static settings rather than failing startup
+                logger.warning(f"Attention autotuning failed, using static attention settings: {e}")
+                self._restore_static_attention()
+                return False
+            finally:
+                if feature_cache:
+                    feature_cache.enable()
+    
+    @contextmanager
+    def _exclusive_pipeline(self):
+        """Hold the pipeline for one call, starting from an empty feature cache"""
+        with self._pipeline_lock:
+            # Cached features from a previous image must never leak into this one
+            if self.feature_cache:
+                self.feature_cache.reset()
+            yield
+    
+    def enable_feature_cache(self, interval: int = 3, depth: int = 1) -> bool:
+        """
+        Reuse deep UNet features across denoising steps
+        
+        Args:
+            interval: Run the full UNet every `interval` steps
+            depth: Number of shallow UNet levels recomputed on cached steps
+            
+        Returns:
+            True if enabled successfully, False otherwise
+        """
+        if not self.pipeline:
+            logger.error("Pipeline not created. Call create_pipeline() first.")
+            return False
+        
+        try:
+            with self._pipeline_lock:
+                self.disable_feature_cache()
+                self.feature_cache = UNetFeatureCache(self.pipeline.unet, interval=interval, depth=depth)
+                self.feature_cache.enable()
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to enable UNet feature cache: {e}")
+            self.feature_cache = None
+            return False
+    
+    def disable_feature_cache(self):
+        """Run the full UNet at every denoising step"""
+        with self._pipeline_lock:
+            if self.feature_cache:
+                self.feature_cache.disable()
+                self.feature_cache = None
+    
     def prepare_control_image(self, product_image: Image.Image, target_size: Tuple[int, int] = (1024, 1024)) -> Optional[Image.Image]:
         """
         Prepare product image for ControlNet conditioning
@@ -139,7 +320,8 @@ class ControlNetProcessor:
         controlnet_conditioning_scale: float = 1.0,
         seed: Optional[int] = None,
         width: int = 1024,
-        height: int = 1024
+        height: int = 1024,
+        cancel_event: Optional[threading.Event] = None
     ) -> Optional[Image.Image]:
         """
         Generate image using ControlNet conditioning
@@ -154,9 +336,13 @@ class ControlNetProcessor:
             seed: Random seed for reproducibility
             width: Output image width
             height: Output image height
+            cancel_event: Event that aborts denoising at the next step when set
             
         Returns:
             Generated image or None if failed
+            
+        Raises:
+            GenerationCancelled: If cancel_event was set during generation
         """
         if not self.pipeline:
             logger.error("Pipeline not created. Call create_pipeline() first.")
@@ -172,27 +358,214 @@ class ControlNetProcessor:
             logger.info(f"Generating image with ControlNet (steps: {num_inference_steps}, guidance: {guidance_scale})")
             
             # Generate image
-            result = self.pipeline(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                image=control_image,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=guidance_scale,
-                controlnet_conditioning_scale=controlnet_conditioning_scale,
-                generator=generator,
-                width=width,
-                height=height,
-                return_dict=True
-            )
+            with self._exclusive_pipeline():
+                result = self.pipeline(
+                    prompt=prompt,
+                    negative_prompt=negative_prompt,
+                    image=control_image,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    controlnet_conditioning_scale=controlnet_conditioning_scale,
+                    generator=generator,
+                    width=width,
+                    height=height,
+                    callback_on_step_end=self._cancel_callback(cancel_event),
+                    return_dict=True
+                )
             
             generated_image = result.images[0]
             logger.info("Image generated successfully with ControlNet")
             return generated_image
             
+        except GenerationCancelled:
+            logger.info("ControlNet generation cancelled")
+            raise
         except Exception as e:
             logger.error(f"ControlNet generation failed: {e}")
             return None
     
+    def generate_batch_with_controlnet(
+        self,
+        prompts: List[str],
+        control_image: Image.Image,
+        negative_prompt: str = "",
+        num_inference_steps: int = 30,
+        guidance_scale: float = 7.5,
+        controlnet_conditioning_scale: float = 1.0,
+        seeds: Optional[List[Optional[int]]] = None,
+        width: int = 1024,
+        height: int = 1024,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[List[Image.Image]]:
+        """
+        Generate one image per prompt in a single denoising batch
+        
+        All prompts share the control image, so the UNet and ControlNet run
+        once per step for the whole batch instead of once per image.
+        
+        Args:
+            prompts: Text prompts, one per image
+            control_image: Preprocessed control image (canny edges)
+            negative_prompt: Negative prompt applied to every image
+            num_inference_steps: Number of denoising steps
+            guidance_scale: Guidance scale for classifier-free guidance
+            controlnet_conditioning_scale: Strength of ControlNet conditioning
+            seeds: Random seed per prompt for reproducibility
+            width: Output image width
+            height: Output image height
+            cancel_event: Event that aborts denoising at the next step when set
+            
+        Returns:
+            Generated images in prompt order, or None if failed
+            
+        Raises:
+            GenerationCancelled: If cancel_event was set during generation
+            torch.cuda.OutOfMemoryError: If the batch does not fit in GPU memory
+        """
+        if not self.pipeline:
+            logger.error("Pipeline not created. Call create_pipeline() first.")
+            return None
+        
+        try:
+            seeds = seeds or [None] * len(prompts)
+            # Per-image generators keep each image identical to its unbatched counterpart
+            if all(seed is not None for seed in seeds):
+                generator = [torch.Generator(device=self.device).manual_seed(seed) for seed in seeds]
+            else:
+                generator = None
+            
+            logger.info(f"Generating {len(prompts)} images in one batch with ControlNet (steps: {num_inference_steps})")
+            
+            with self._exclusive_pipeline():
+                result = self.pipeline(
+                    prompt=prompts,
+                    negative_prompt=[negative_prompt] * len(prompts),
+                    image=control_image,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    controlnet_conditioning_scale=controlnet_conditioning_scale,
+                    generator=generator,
+                    width=width,
+                    height=height,
+                    callback_on_step_end=self._cancel_callback(cancel_event),
+                    return_dict=True
+                )
+            
+            return result.images
+            
+        except GenerationCancelled:
+            logger.info("Batched ControlNet generation cancelled")
+            raise
+        except torch.cuda.OutOfMemoryError:
+            # The caller can retry with a smaller batch
+            logger.warning(f"Batched ControlNet generation of {len(prompts)} images ran out of memory")
+            raise
+        except Exception as e:
+            logger.error(f"Batched ControlNet generation failed: {e}")
+            return None
+    
+    @staticmethod
+    def _cancel_callback(cancel_event: Optional[threading.Event]):
+        """Step-end callback raising GenerationCancelled once cancel_event is set"""
+        if cancel_event is None:
+            return None
+        
+        def callback(pipeline, step, timestep, callback_kwargs):
+            raise_if_cancelled(cancel_event)
+            return callback_kwargs
+        return callback
+    
+    def get_img2img_pipeline(self) -> Optional[StableDiffusionXLControlNetImg2ImgPipeline]:
+        """
+        Get an img2img ControlNet pipeline sharing the weights of the main pipeline
+        
+        Returns:
+            Img2img pipeline or None if the main pipeline is not created
+        """
+        if not self.pipeline:
+            logger.error("Pipeline not created. Call create_pipeline() first.")
+            return None
+        
+        with self._pipeline_lock:
+            if self.img2img_pipeline is None:
+                # from_pipe reuses the loaded modules, so this costs no extra memory
+                self.img2img_pipeline = StableDiffusionXLControlNetImg2ImgPipeline.from_pipe(self.pipeline)
+                logger.info("SDXL ControlNet img2img pipeline created from loaded components")
+            return self.img2img_pipeline
+    
+    def generate_img2img_with_controlnet(
+        self,
+        prompt: str,
+        init_image: Image.Image,
+        control_image: Image.Image,
+        negative_prompt: str = "",
+        strength: float = 0.35,
+        num_inference_steps: int = 30,
+        guidance_scale: float = 7.5,
+        controlnet_conditioning_scale: float = 1.0,
+        seed: Optional[int] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[Image.Image]:
+        """
+        Refine an existing image with ControlNet conditioning
+        
+        Only about `strength * num_inference_steps` denoising steps run, so
+        small strengths give nearby variations at a fraction of the cost.
+        
+        Args:
+            prompt: Text prompt for generation
+            init_image: Image to start denoising from
+            control_image: Preprocessed control image (canny edges)
+            negative_prompt: Negative prompt to avoid unwanted elements
+            strength: How far to move away from init_image (0-1)
+            num_inference_steps: Number of denoising steps for strength 1.0
+            guidance_scale: Guidance scale for classifier-free guidance
+            controlnet_conditioning_scale: Strength of ControlNet conditioning
+            seed: Random seed for reproducibility
+            cancel_event: Event that aborts denoising at the next step when set
+            
+        Returns:
+            Refined image or None if failed
+            
+        Raises:
+            GenerationCancelled: If cancel_event was set during refinement
+        """
+        pipeline = self.get_img2img_pipeline()
+        if not pipeline:
+            return None
+        
+        try:
+            generator = torch.Generator(device=self.device).manual_seed(seed) if seed is not None else None
+            
+            logger.info(f"Refining image with ControlNet img2img (strength: {strength}, steps: {num_inference_steps})")
+            
+            # The img2img pipeline shares the UNet, scheduler and feature cache with the main one
+            with self._exclusive_pipeline():
+                result = pipeline(
+                    prompt=prompt,
+                    negative_prompt=negative_prompt,
+                    image=init_image,
+                    control_image=control_image,
+                    strength=strength,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    controlnet_conditioning_scale=controlnet_conditioning_scale,
+                    generator=generator,
+                    width=init_image.width,
+                    height=init_image.height,
+                    callback_on_step_end=self._cancel_callback(cancel_event),
+                    return_dict=True
+                )
+            
+            return result.images[0]
+            
+        except GenerationCancelled:
+            logger.info("ControlNet img2img refinement cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"ControlNet img2img refinement failed: {e}")
+            return None
+    
     def is_loaded(self) -> bool:
         """Check if ControlNet is loaded and ready"""
         return self._is_loaded and self.controlnet is not None
@@ -200,6 +573,9 @@ class ControlNetProcessor:
     def cleanup(self):
         """Clean up GPU memory"""
         try:
+            self.disable_feature_cache()
+            self.img2img_pipeline = None
+            
             if self.pipeline:
                 del self.pipeline
                 self.pipeline = None
@@ -0,0 +1,144 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Output size (width, height) per platform placement
+PLATFORM_FORMATS = {
+    "instagram": (1080, 1080),   # 1:1 feed
+    "facebook": (1080, 1350),    # 4:5 feed
+    "tiktok": (1080, 1920),      # 9:16 full screen
+    "pinterest": (1000, 1500)    # 2:3 pin
+}
+
+def parse_platforms(value: Optional[str]) -> List[str]:
+    """Parse a comma-separated platform list such as "instagram,tiktok" """
+    platforms = [name.strip().lower() for name in (value or "").split(",") if name.strip()]
+    unknown = [name for name in platforms if name not in PLATFORM_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown export platform(s) {', '.join(unknown)}, expected {', '.join(PLATFORM_FORMATS)}")
+    return list(dict.fromkeys(platforms))
+
+def find_subject_box(control_image: Image.Image, trim: float = 0.02) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Locate the product from the edges of its control image
+
+    Args:
+        control_image: Canny edge control image
+        trim: Fraction of edge pixels ignored on each side as outliers
+
+    Returns:
+        (left, top, right, bottom) as fractions of the image size, or None if there are no edges
+    """
+    edges = np.asarray(control_image.convert("L"))
+    ys, xs = np.nonzero(edges > 127)
+    if len(xs) == 0:
+        return None
+    width, height = control_image.size
+    left, right = np.quantile(xs, [trim, 1 - trim])
+    top, bottom = np.quantile(ys, [trim, 1 - trim])
+    return float(left / width), float(top / height), float((right + 1) / width), float((bottom + 1) / height)
+
+def compute_crop(image_size: Tuple[int, int], target_size: Tuple[int, int],
+                 subject_box: Optional[Tuple[float, float, float, float]] = None) -> Tuple[int, int, int, int]:
+    """
+    Largest crop with the target aspect ratio, centered on the subject where possible
+
+    Returns:
+        (x0, y0, x1, y1) pixel box inside the image
+    """
+    width, height = image_size
+    aspect = target_size[0] / target_size[1]
+    crop_width, crop_height = (width, round(width / aspect)) if width / height <= aspect else (round(height * aspect), height)
+    crop_width, crop_height = min(crop_width, width), min(crop_height, height)
+
+    if subject_box is None:
+        center_x, center_y = width / 2, height / 2
+    else:
+        center_x = (subject_box[0] + subject_box[2]) / 2 * width
+        center_y = (subject_box[1] + subject_box[3]) / 2 * height
+
+    # Keep the crop inside the image; the subject stays as central as the borders allow
+    x0 = int(round(min(max(center_x - crop_width / 2, 0), width - crop_width)))
+    y0 = int(round(min(max(center_y - crop_height / 2, 0), height - crop_height)))
+    return x0, y0, x0 + crop_width, y0 + crop_height
+
+def render_format(image: np.ndarray, box: Tuple[int, int, int, int], target_size: Tuple[int, int]) -> np.ndarray:
+    """Crop an image array and resize it to the target size"""
+    x0, y0, x1, y1 = box
+    crop = image[y0:y1, x0:x1]
+    # Area averaging avoids aliasing when shrinking, Lanczos keeps edges sharp when enlarging
+    interpolation = cv2.INTER_AREA if target_size[0] < crop.shape[1] else cv2.INTER_LANCZOS4
+    return cv2.resize(crop, target_size, interpolation=interpolation)
+
+class PlatformExporter:
+    """
+    Derive platform-specific crops and sizes from generated images.
+
+    One generation is exported to several placements instead of running
+    diffusion once per platform. Crops follow the product located in the
+    control image, and the OpenCV work runs on a thread pool (cv2 releases
+    the GIL while resizing and encoding).
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv("EXPORT_WORKERS", "4"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="export")
+
+    def _export_one(self, image: np.ndarray, box: Tuple[int, int, int, int],
+                    target_size: Tuple[int, int], path: str) -> str:
+        rendered = render_format(image, box, target_size)
+        cv2.imwrite(path, rendered, [cv2.IMWRITE_PNG_COMPRESSION, 3])
+        return path
+
+    def export(self,
+               images: Dict[str, Image.Image],
+               control_image: Optional[Image.Image],
+               platforms: List[str],
+               output_dir: str) -> Tuple[Dict[str, List[str]], Dict[str, str]]:
+        """
+        Write every image in every platform format
+
+        Args:
+            images: Generated images keyed by file name (e.g. "ad_1.png")
+            control_image: Control image used for generation, to keep the product in frame
+            platforms: Platform names from PLATFORM_FORMATS
+            output_dir: Directory the generated images were saved to
+
+        Returns:
+            Relative paths of the exported files per platform, and the error
+            of each platform whose export failed
+        """
+        subject_box = find_subject_box(control_image) if control_image is not None else None
+        if subject_box is None:
+            logger.info("No subject found in control image, exporting center crops")
+
+        futures = {platform: [] for platform in platforms}
+        for filename, image in images.items():
+            # OpenCV works in BGR
+            array = cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+            stem = os.path.splitext(filename)[0]
+            for platform in platforms:
+                target_size = PLATFORM_FORMATS[platform]
+                box = compute_crop(image.size, target_size, subject_box)
+                path = os.path.join(output_dir, f"{stem}_{platform}.png")
+                futures[platform].append(self._executor.submit(self._export_one, array, box, target_size, path))
+
+        exports, errors = {}, {}
+        for platform, platform_futures in futures.items():
+            try:
+                # Path relative to backend/node/outputs/, like save_image
+                exports[platform] = [
+                    f"/outputs/{os.path.basename(output_dir)}/{os.path.basename(future.result())}"
+                    for future in platform_futures
+                ]
+            except Exception as e:
+                logger.error(f"Export to {platform} failed: {e}")
+                errors[platform] = str(e)
+        logger.info(f"Exported {len(images)} images to {', '.join(exports) or 'no platforms'}")
+        return exports, errors
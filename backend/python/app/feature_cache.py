@@ -0,0 +1,93 @@
+from typing import Any, Callable, Dict, List
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+class UNetFeatureCache:
+    """
+    Reuse deep UNet features across adjacent denoising steps (DeepCache-style).
+
+    The UNet is fully evaluated every ``interval`` steps. On the steps in
+    between, only the ``depth`` shallowest down/up blocks are recomputed; the
+    deeper down blocks, the mid block and the deeper up blocks return the
+    outputs cached at the last full step.
+
+    The cache is state on a shared UNet, so it only holds while one pipeline
+    call runs at a time; ControlNetProcessor serializes its pipeline calls.
+    """
+
+    def __init__(self, unet: torch.nn.Module, interval: int = 3, depth: int = 1):
+        num_levels = len(unet.down_blocks)
+        if interval < 2:
+            raise ValueError("Feature cache interval must be at least 2")
+        if not 1 <= depth < num_levels:
+            raise ValueError(f"Feature cache depth must be between 1 and {num_levels - 1}")
+
+        self.unet = unet
+        self.interval = interval
+        self.depth = depth
+
+        self._calls = 0
+        self._use_cache = False
+        self._cache: Dict[int, Any] = {}
+        self._wrapped: List[torch.nn.Module] = []
+        self._hook = None
+
+    def _cached_blocks(self) -> List[torch.nn.Module]:
+        """Blocks that are skipped on cached steps (deep down, mid and deep up blocks)"""
+        num_levels = len(self.unet.down_blocks)
+        deep_down = list(self.unet.down_blocks[self.depth:])
+        deep_up = list(self.unet.up_blocks[:num_levels - self.depth])
+        return deep_down + [self.unet.mid_block] + deep_up
+
+    def _wrap(self, key: int, forward: Callable) -> Callable:
+        def cached_forward(*args, **kwargs):
+            if self._use_cache and key in self._cache:
+                return self._cache[key]
+            output = forward(*args, **kwargs)
+            self._cache[key] = output
+            return output
+        return cached_forward
+
+    def _on_unet_call(self, module, args):
+        # Full evaluation on the first call and every `interval` calls after it
+        self._use_cache = self._calls % self.interval != 0
+        self._calls += 1
+
+    def enable(self):
+        """Install the caching wrappers on the UNet"""
+        if self._hook is not None:
+            return
+
+        for key, block in enumerate(self._cached_blocks()):
+            block.forward = self._wrap(key, block.forward)
+            self._wrapped.append(block)
+
+        self._hook = self.unet.register_forward_pre_hook(self._on_unet_call)
+        self.reset()
+        logger.info(f"UNet feature cache enabled (interval: {self.interval}, depth: {self.depth})")
+
+    def disable(self):
+        """Remove the caching wrappers and restore the original forwards"""
+        if self._hook is None:
+            return
+
+        self._hook.remove()
+        self._hook = None
+        for block in self._wrapped:
+            # Drop the instance attribute so the class forward is used again
+            del block.forward
+        self._wrapped = []
+        self.reset()
+        logger.info("UNet feature cache disabled")
+
+    def reset(self):
+        """Forget cached features; must be called before each new generation"""
+        self._calls = 0
+        self._use_cache = False
+        self._cache.clear()
+
+    def is_enabled(self) -> bool:
+        """Check if the caching wrappers are installed"""
+        return self._hook is not None
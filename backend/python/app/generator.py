@@ -1,38 +1,66 @@
 import os
+import json
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Union
 from PIL import Image
 import torch
-from .utils import get_device_info, create_output_directory, save_image, generate_request_id
-from .controlnet import ControlNetProcessor
+from .utils import (
+    GenerationCancelled, get_device_info, create_output_directory, save_image,
+    generate_request_id, is_valid_request_id, raise_if_cancelled
+)
+from .backends import InferenceBackend, create_backend
 from .prompt_builder import PromptBuilder
+from .exporter import PlatformExporter
+from .profiling import profile_stage
 
 logger = logging.getLogger(__name__)
 
+# Stored next to the generated images so results can be refined later
+METADATA_FILE = "metadata.json"
+CONTROL_IMAGE_FILE = "control.png"
+
 class SDXLGenerator:
     """Production-ready SDXL inference server with ControlNet support"""
     
     def __init__(self, 
                  base_model_id: str = "stabilityai/stable-diffusion-xl-base-1.0",
-                 output_base_path: str = None):
+                 output_base_path: str = None,
+                 feature_cache_interval: Optional[int] = None,
+                 feature_cache_depth: Optional[int] = None,
+                 backend: Union[str, InferenceBackend, None] = None):
         self.base_model_id = base_model_id
         self.output_base_path = output_base_path or self._get_default_output_path()
         
+        # UNet feature caching (0 disables it)
+        if feature_cache_interval is None:
+            feature_cache_interval = int(os.getenv("FEATURE_CACHE_INTERVAL", "0"))
+        if feature_cache_depth is None:
+            feature_cache_depth = int(os.getenv("FEATURE_CACHE_DEPTH", "1"))
+        self.feature_cache_interval = feature_cache_interval
+        self.feature_cache_depth = feature_cache_depth
+        
         # Get device information
         self.device, self.has_cuda = get_device_info()
         self.torch_dtype = torch.float16 if self.has_cuda else torch.float32
         
         # Initialize components
-        self.controlnet_processor = ControlNetProcessor(
-            device=self.device, 
-            torch_dtype=self.torch_dtype
-        )
+        if not isinstance(backend, InferenceBackend):
+            backend = create_backend(
+                backend or os.getenv("INFERENCE_BACKEND", "torch"),
+                device=self.device,
+                torch_dtype=self.torch_dtype
+            )
+        self.backend = backend
         self.prompt_builder = PromptBuilder()
+        self.exporter = PlatformExporter()
         
         # State tracking
         self._is_initialized = False
+        # Serializes initialize() between the first request and /initialize
+        self._init_lock = threading.Lock()
         
-        logger.info(f"SDXL Generator initialized (device: {self.device}, dtype: {self.torch_dtype})")
+        logger.info(f"SDXL Generator initialized (backend: {self.backend.name}, device: {self.device}, dtype: {self.torch_dtype})")
     
     def _get_default_output_path(self) -> str:
         """Get default output path relative to Node.js backend"""
@@ -50,10 +78,13 @@ class SDXLGenerator:
         Returns:
             True if initialization successful, False otherwise
         """
-        if self._is_initialized:
-            logger.info("Generator already initialized")
-            return True
-        
+        with self._init_lock:
+            if self._is_initialized:
+                logger.info("Generator already initialized")
+                return True
+            return self._initialize()
+    
+    def _initialize(self) -> bool:
         try:
             logger.info("Initializing SDXL Generator...")
             
@@ -61,16 +92,18 @@ class SDXLGenerator:
             os.makedirs(self.output_base_path, exist_ok=True)
             logger.info(f"Output directory: {self.output_base_path}")
             
-            # Load ControlNet
-            if not self.controlnet_processor.load_controlnet():
-                logger.error("Failed to load ControlNet")
+            # Load models into the inference backend
+            if not self.backend.load(self.base_model_id):
+                logger.error(f"Failed to load {self.backend.name} inference backend")
                 return False
             
-            # Create pipeline
-            pipeline = self.controlnet_processor.create_pipeline(self.base_model_id)
-            if not pipeline:
-                logger.error("Failed to create pipeline")
-                return False
+            # Optional cross-step feature caching; a failure here only costs speed
+            if self.feature_cache_interval > 1:
+                if not self.backend.enable_feature_cache(
+                    interval=self.feature_cache_interval,
+                    depth=self.feature_cache_depth
+                ):
+                    logger.warning("Continuing without UNet feature cache")
             
             self._is_initialized = True
             logger.info("SDXL Generator initialization completed successfully")
@@ -89,7 +122,13 @@ class SDXLGenerator:
                     num_inference_steps: int = 30,
                     guidance_scale: float = 7.5,
                     controlnet_conditioning_scale: float = 1.0,
-                    base_seed: Optional[int] = None) -> Dict[str, Any]:
+                    base_seed: Optional[int] = None,
+                    request_id: Optional[str] = None,
+                    cancel_event: Optional[threading.Event] = None,
+                    control_image: Optional[Image.Image] = None,
+                    batch_size: int = 1,
+                    export_platforms: Optional[List[str]] = None,
+                    tenant: Optional[str] = None) -> Dict[str, Any]:
         """
         Generate multiple ad creatives based on trend profile and product image
         
@@ -103,115 +142,318 @@ class SDXLGenerator:
             guidance_scale: Guidance scale for classifier-free guidance
             controlnet_conditioning_scale: Strength of ControlNet conditioning
             base_seed: Base seed for reproducible generation
+            request_id: Request ID to use instead of generating a new one
+            cancel_event: Event that aborts generation when set, e.g. on client disconnect
+            control_image: Precomputed control image, skips preparing it from product_image
+            batch_size: Number of variations denoised together in one batch, halved on out-of-memory
+            export_platforms: Platforms to derive cropped and resized copies for
+            tenant: Tenant (brand) the result belongs to, so refinements are accounted to it too
             
         Returns:
             Dictionary with request_id and list of image paths
+            
+        Raises:
+            GenerationCancelled: If cancel_event was set before all images were generated
         """
         if not self._is_initialized:
             raise RuntimeError("Generator not initialized. Call initialize() first.")
         
         # Clamp num_images to 3-5 range as specified
         num_images = max(3, min(5, num_images))
+        batch_size = max(1, batch_size)
         
         try:
             # Generate unique request ID
-            request_id = generate_request_id()
+            request_id = request_id or generate_request_id()
             logger.info(f"Starting ad generation (request: {request_id}, images: {num_images})")
             
             # Create output directory
             output_dir = create_output_directory(self.output_base_path, request_id)
             
-            # Prepare control image from product image
-            control_image = self.controlnet_processor.prepare_control_image(product_image)
+            # Prepare control image from product image, unless the caller already did
+            if control_image is None:
+                with profile_stage("prepare_control_image"):
+                    control_image = self.backend.prepare_control_image(product_image)
             if not control_image:
                 raise ValueError("Failed to prepare control image from product image")
             
-            # Build base prompt from trend profile
-            base_prompt = self.prompt_builder.build_prompt(
-                trend_profile=trend_profile,
-                brand_name=brand_name,
-                headline=headline
-            )
-            
-            # Get negative prompt
-            negative_prompt = self.prompt_builder.get_negative_prompt()
-            
-            # Generate prompt variations for different styles
-            prompt_variations = self.prompt_builder.build_variation_prompts(
-                base_prompt, num_images
-            )
+            with profile_stage("build_prompts"):
+                # Build base prompt from trend profile
+                base_prompt = self.prompt_builder.build_prompt(
+                    trend_profile=trend_profile,
+                    brand_name=brand_name,
+                    headline=headline
+                )
+                
+                # Get negative prompt
+                negative_prompt = self.prompt_builder.get_negative_prompt()
+                
+                # Generate prompt variations for different styles
+                prompt_variations = self.prompt_builder.build_variation_prompts(
+                    base_prompt, num_images
+                )
             
-            generated_images = []
             image_paths = []
+            image_records = []
+            generated_images = {}
             
-            # Generate each image with variation
-            for i in range(num_images):
+            # Generate the variations, batch_size images per denoising run
+            requested_batch_size = batch_size
+            start = 0
+            while start < num_images:
+                indices = list(range(start, min(num_images, start + batch_size)))
+                start += len(indices)
                 try:
-                    # Calculate seed for this variation
-                    if base_seed is not None:
-                        seed = base_seed + i
-                    else:
-                        seed = None
-                    
-                    prompt = prompt_variations[i] if i < len(prompt_variations) else base_prompt
+                    raise_if_cancelled(cancel_event)
                     
-                    logger.info(f"Generating image {i+1}/{num_images} (seed: {seed})")
+                    # Calculate seed and prompt for each variation
+                    seeds = [base_seed + i if base_seed is not None else None for i in indices]
+                    prompts = [prompt_variations[i] if i < len(prompt_variations) else base_prompt for i in indices]
                     
-                    # Generate image with ControlNet
-                    generated_image = self.controlnet_processor.generate_with_controlnet(
-                        prompt=prompt,
-                        control_image=control_image,
-                        negative_prompt=negative_prompt,
-                        num_inference_steps=num_inference_steps,
-                        guidance_scale=guidance_scale,
-                        controlnet_conditioning_scale=controlnet_conditioning_scale,
-                        seed=seed,
-                        width=1024,
-                        height=1024
-                    )
-                    
-                    if generated_image:
-                        # Save image
-                        filename = f"ad_{i+1}.png"
-                        relative_path = save_image(generated_image, output_dir, filename)
-                        
-                        generated_images.append(generated_image)
-                        image_paths.append(relative_path)
+                    if len(indices) == 1:
+                        i = indices[0]
+                        logger.info(f"Generating image {i+1}/{num_images} (seed: {seeds[0]})")
                         
-                        logger.info(f"Generated and saved: {relative_path}")
+                        # Generate image with ControlNet
+                        with profile_stage(f"generate_image_{i+1}"):
+                            generated = [self.backend.generate(
+                                prompt=prompts[0],
+                                control_image=control_image,
+                                negative_prompt=negative_prompt,
+                                num_inference_steps=num_inference_steps,
+                                guidance_scale=guidance_scale,
+                                controlnet_conditioning_scale=controlnet_conditioning_scale,
+                                seed=seeds[0],
+                                width=1024,
+                                height=1024,
+                                cancel_event=cancel_event
+                            )]
                     else:
-                        logger.warning(f"Failed to generate image {i+1}")
+                        logger.info(f"Generating images {indices[0]+1}-{indices[-1]+1}/{num_images} in one batch (seeds: {seeds})")
+                        
+                        with profile_stage(f"generate_batch_{indices[0]+1}_{indices[-1]+1}"):
+                            generated = self.backend.generate_batch(
+                                prompts=prompts,
+                                control_image=control_image,
+                                negative_prompt=negative_prompt,
+                                num_inference_steps=num_inference_steps,
+                                guidance_scale=guidance_scale,
+                                controlnet_conditioning_scale=controlnet_conditioning_scale,
+                                seeds=seeds,
+                                width=1024,
+                                height=1024,
+                                cancel_event=cancel_event
+                            )
+                    
+                    for i, prompt, seed, generated_image in zip(indices, prompts, seeds, generated):
+                        if generated_image:
+                            # Save image
+                            filename = f"ad_{i+1}.png"
+                            with profile_stage(f"save_image_{i+1}"):
+                                relative_path = save_image(generated_image, output_dir, filename)
+                            
+                            image_paths.append(relative_path)
+                            image_records.append({"index": i + 1, "file": filename, "prompt": prompt, "seed": seed})
+                            generated_images[filename] = generated_image
+                            
+                            logger.info(f"Generated and saved: {relative_path}")
+                        else:
+                            logger.warning(f"Failed to generate image {i+1}")
                 
+                except GenerationCancelled:
+                    raise
+                except torch.cuda.OutOfMemoryError:
+                    if len(indices) == 1:
+                        logger.error(f"Out of memory generating image {indices[0]+1}")
+                        continue
+                    # Retry the same images in smaller batches
+                    batch_size = max(1, len(indices) // 2)
+                    start = indices[0]
+                    logger.warning(f"Out of memory with {len(indices)} images per batch, retrying with {batch_size}")
+                    torch.cuda.empty_cache()
                 except Exception as e:
-                    logger.error(f"Error generating image {i+1}: {e}")
+                    logger.error(f"Error generating images {indices[0]+1}-{indices[-1]+1}: {e}")
                     continue
             
             if not image_paths:
                 raise RuntimeError("No images were generated successfully")
             
+            self._save_generation_metadata(output_dir, control_image, {
+                "requestId": request_id,
+                "tenant": tenant,
+                "negativePrompt": negative_prompt,
+                "numInferenceSteps": num_inference_steps,
+                "guidanceScale": guidance_scale,
+                "controlnetConditioningScale": controlnet_conditioning_scale,
+                "images": image_records
+            })
+            
             result = {
                 "requestId": request_id,
                 "images": image_paths,
                 "numGenerated": len(image_paths),
                 "prompt": base_prompt[:200] + "..." if len(base_prompt) > 200 else base_prompt
             }
+            if batch_size < requested_batch_size:
+                # Lets batch callers start smaller next time
+                result["batchSize"] = batch_size
+            
+            # One generation serves every placement; only crops and resizes differ
+            if export_platforms:
+                with profile_stage("export_platforms"):
+                    try:
+                        exports, export_errors = self.exporter.export(
+                            generated_images, control_image, export_platforms, output_dir
+                        )
+                    except Exception as e:
+                        # The generated images are still good; only the derived crops are missing
+                        logger.error(f"Platform export failed: {e}")
+                        exports, export_errors = {}, {platform: str(e) for platform in export_platforms}
+                result["exports"] = exports
+                if export_errors:
+                    result["exportErrors"] = export_errors
             
             logger.info(f"Ad generation completed: {len(image_paths)}/{num_images} images")
             return result
             
+        except GenerationCancelled:
+            logger.info(f"Ad generation cancelled (request: {request_id})")
+            raise
         except Exception as e:
             logger.error(f"Ad generation failed: {e}")
             raise
     
+    def _save_generation_metadata(self, output_dir: str, control_image: Image.Image, metadata: Dict[str, Any]):
+        """Store the control image and generation parameters for later refinement"""
+        try:
+            control_image.save(os.path.join(output_dir, CONTROL_IMAGE_FILE), "PNG")
+            with open(os.path.join(output_dir, METADATA_FILE), "w") as f:
+                json.dump(metadata, f, indent=2)
+        except Exception as e:
+            # Refinement of this result will be unavailable, generation itself succeeded
+            logger.warning(f"Could not save generation metadata: {e}")
+    
+    def load_generation_metadata(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Load stored generation parameters of a previous request"""
+        if not is_valid_request_id(request_id):
+            return None
+        path = os.path.join(self.output_base_path, request_id, METADATA_FILE)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+    
+    def refine_ad(self,
+                  source_request_id: str,
+                  image_index: int,
+                  prompt_suffix: str = "",
+                  strength: float = 0.35,
+                  num_variations: int = 3,
+                  base_seed: Optional[int] = None,
+                  request_id: Optional[str] = None,
+                  cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Create nearby variations of a previously generated ad via img2img
+        
+        Args:
+            source_request_id: Request ID of the generation to refine
+            image_index: 1-based index of the image within that request
+            prompt_suffix: Prompt tweak appended to the original prompt
+            strength: How far variations may move from the source image (0-1)
+            num_variations: Number of variations to generate
+            base_seed: Base seed for reproducible generation
+            request_id: Request ID to use instead of generating a new one
+            cancel_event: Event that aborts refinement when set, e.g. on client disconnect
+            
+        Returns:
+            Dictionary with request_id and list of image paths
+            
+        Raises:
+            NotImplementedError: If the inference backend does not support refinement
+            LookupError: If the source result does not exist
+        """
+        if not self.backend.supports_refine:
+            raise NotImplementedError(f"The {self.backend.name} backend does not support refinement")
+        if not self._is_initialized:
+            raise RuntimeError("Generator not initialized. Call initialize() first.")
+        
+        metadata = self.load_generation_metadata(source_request_id)
+        if metadata is None:
+            raise LookupError(f"No stored result for request {source_request_id}")
+        
+        record = next((r for r in metadata["images"] if r["index"] == image_index), None)
+        if record is None:
+            raise LookupError(f"Request {source_request_id} has no image {image_index}")
+        
+        source_dir = os.path.join(self.output_base_path, source_request_id)
+        init_image = Image.open(os.path.join(source_dir, record["file"])).convert("RGB")
+        control_image = Image.open(os.path.join(source_dir, CONTROL_IMAGE_FILE)).convert("RGB")
+        
+        prompt = f"{record['prompt']}, {prompt_suffix}" if prompt_suffix else record["prompt"]
+        num_inference_steps = metadata["numInferenceSteps"]
+        
+        request_id = request_id or generate_request_id()
+        logger.info(f"Refining {source_request_id}#{image_index} (request: {request_id}, variations: {num_variations}, strength: {strength})")
+        
+        output_dir = create_output_directory(self.output_base_path, request_id)
+        image_paths = []
+        image_records = []
+        
+        for i in range(num_variations):
+            raise_if_cancelled(cancel_event)
+            seed = base_seed + i if base_seed is not None else None
+            
+            with profile_stage(f"refine_image_{i+1}"):
+                refined_image = self.backend.refine(
+                    prompt=prompt,
+                    init_image=init_image,
+                    control_image=control_image,
+                    negative_prompt=metadata["negativePrompt"],
+                    strength=strength,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=metadata["guidanceScale"],
+                    controlnet_conditioning_scale=metadata["controlnetConditioningScale"],
+                    seed=seed,
+                    cancel_event=cancel_event
+                )
+            
+            if refined_image:
+                filename = f"ad_{i+1}.png"
+                image_paths.append(save_image(refined_image, output_dir, filename))
+                image_records.append({"index": i + 1, "file": filename, "prompt": prompt, "seed": seed})
+            else:
+                logger.warning(f"Failed to refine variation {i+1}")
+        
+        if not image_paths:
+            raise RuntimeError("No images were refined successfully")
+        
+        # Refinements are themselves refinable
+        self._save_generation_metadata(output_dir, control_image, {
+            **metadata,
+            "requestId": request_id,
+            "parentRequestId": source_request_id,
+            "parentImageIndex": image_index,
+            "strength": strength,
+            "images": image_records
+        })
+        
+        logger.info(f"Refinement completed: {len(image_paths)}/{num_variations} images")
+        return {
+            "requestId": request_id,
+            "parentRequestId": source_request_id,
+            "images": image_paths,
+            "numGenerated": len(image_paths),
+            "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt
+        }
+    
     def is_ready(self) -> bool:
         """Check if generator is ready for inference"""
-        return (self._is_initialized and 
-                self.controlnet_processor.is_loaded() and
-                self.controlnet_processor.pipeline is not None)
+        return self._is_initialized and self.backend.is_loaded()
     
     def get_memory_usage(self) -> Dict[str, Any]:
         """Get current GPU memory usage information"""
         info = {
+            "backend": self.backend.name,
             "device": self.device,
             "has_cuda": self.has_cuda,
             "initialized": self._is_initialized
@@ -234,8 +476,8 @@ class SDXLGenerator:
         logger.info("Cleaning up SDXL Generator...")
         
         try:
-            # Cleanup ControlNet
-            self.controlnet_processor.cleanup()
+            # Release backend models
+            self.backend.cleanup()
             
             # Clear CUDA cache if available
             if self.has_cuda:
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def get_default_history_path() -> str:
+    """Get default path of the timing history (~/.cache/adgen/latency_history.json)"""
+    return os.getenv("LATENCY_HISTORY", os.path.join(os.path.expanduser("~"), ".cache", "adgen", "latency_history.json"))
+
+def latency_key(backend: str, device: str, kind: str, width: int = 1024, height: int = 1024) -> str:
+    """Configuration key timings are grouped by, e.g. "torch:cuda:generate:1024x1024" """
+    return f"{backend}:{device}:{kind}:{width}x{height}"
+
+class LatencyModel:
+    """
+    Predict run time of generation jobs from their observed history.
+
+    Each configuration (backend, device, job kind, resolution) keeps its
+    recent (work, seconds) samples, where work is images x denoising steps.
+    Run time is fitted as seconds = overhead + work * seconds_per_unit by
+    least squares. Configurations with too little history fall back to the
+    seconds per unit seen across all configurations, then to a prior.
+
+    Recording only updates memory; the history is written by save(), which
+    callers run off the event loop when save_due() says the save interval
+    has passed, and once more at shutdown.
+    """
+
+    def __init__(self,
+                 history_path: Optional[str] = None,
+                 max_samples: int = 200,
+                 min_samples: int = 3,
+                 prior_seconds_per_unit: Optional[float] = None,
+                 save_interval: Optional[float] = None):
+        self.history_path = history_path or get_default_history_path()
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        if prior_seconds_per_unit is None:
+            prior_seconds_per_unit = float(os.getenv("LATENCY_PRIOR_SECONDS_PER_STEP", "0.2"))
+        self.prior_seconds_per_unit = prior_seconds_per_unit
+        if save_interval is None:
+            save_interval = float(os.getenv("LATENCY_SAVE_INTERVAL", "30"))
+        self.save_interval = save_interval
+
+        self._lock = threading.Lock()
+        # Serializes writers of the history file
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._fits: Dict[str, Tuple[float, float]] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.history_path) as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, samples in history.get("samples", {}).items():
+            self._samples[key] = deque((tuple(s) for s in samples), maxlen=self.max_samples)
+        logger.info(f"Loaded latency history for {len(self._samples)} configurations")
+
+    def save_due(self) -> bool:
+        """
+        Whether unsaved samples are older than the save interval
+
+        Returns True at most once per interval, so the caller that gets it
+        is the one that runs save().
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not self._dirty or now - self._last_save < self.save_interval:
+                return False
+            self._last_save = now
+            return True
+
+    def save(self):
+        """Persist the timing history if it has unsaved samples"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                history = {"samples": {key: list(samples) for key, samples in self._samples.items()}, "savedAt": time.time()}
+                self._dirty = False
+                self._last_save = time.monotonic()
+            try:
+                os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+                # Replace atomically so concurrent readers never see a partial file
+                tmp_path = self.history_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(history, f)
+                os.replace(tmp_path, self.history_path)
+            except OSError as e:
+                logger.warning(f"Could not save latency history: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def record(self, key: str, work: float, seconds: float):
+        """
+        Add an observed run time
+
+        Args:
+            key: Configuration key from latency_key()
+            work: Work units of the job (images x denoising steps)
+            seconds: Observed run time
+        """
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.max_samples)).append((float(work), float(seconds)))
+            self._fits.pop(key, None)
+            self._dirty = True
+
+    def _global_seconds_per_unit(self) -> float:
+        total_work = sum(w for samples in self._samples.values() for w, _ in samples)
+        total_seconds = sum(s for samples in self._samples.values() for _, s in samples)
+        return total_seconds / total_work if total_work > 0 else self.prior_seconds_per_unit
+
+    def _fit(self, key: str) -> Tuple[float, float]:
+        """(overhead seconds, seconds per unit) for a configuration"""
+        if key in self._fits:
+            return self._fits[key]
+
+        samples = np.array(self._samples.get(key, ()), dtype=np.float64).reshape(-1, 2)
+        if len(samples) < self.min_samples:
+            # Not cached: the global rate changes with every other configuration's samples
+            return (0.0, self._global_seconds_per_unit())
+
+        work, seconds = samples[:, 0], samples[:, 1]
+        fit = None
+        if np.ptp(work) > 0:
+            design = np.stack([np.ones_like(work), work], axis=1)
+            (overhead, per_unit), *_ = np.linalg.lstsq(design, seconds, rcond=None)
+            if overhead >= 0 and per_unit > 0:
+                fit = (float(overhead), float(per_unit))
+        if fit is None:
+            # All jobs the same size, or a fit without physical meaning: plain ratio
+            fit = (0.0, float(seconds.sum() / work.sum()))
+
+        self._fits[key] = fit
+        return fit
+
+    def predict(self, key: str, work: float) -> float:
+        """Predicted run time in seconds of a job with `work` units"""
+        with self._lock:
+            overhead, per_unit = self._fit(key)
+        return overhead + work * per_unit
+
+    def stats(self) -> Dict[str, Any]:
+        """Fitted parameters and sample counts per configuration"""
+        with self._lock:
+            configurations = {}
+            for key, samples in self._samples.items():
+                overhead, per_unit = self._fit(key)
+                configurations[key] = {"samples": len(samples), "overheadSeconds": overhead, "secondsPerStep": per_unit}
+            return {"configurations": configurations, "priorSecondsPerStep": self.prior_seconds_per_unit}
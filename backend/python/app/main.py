@@ -1,8 +1,18 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import router
+from . import routes
+from .routes import router, AdmissionMiddleware
 
-app = FastAPI(title="AI Ad Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    routes._scheduler.shutdown()
+
+app = FastAPI(title="AI Ad Service", lifespan=lifespan)
+
+# Shed generation load before the upload is read; added first so CORS wraps its 429s
+app.add_middleware(AdmissionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,195 @@
+import os
+import io
+import json
+import time
+import cProfile
+import pstats
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional
+from .utils import is_valid_request_id
+
+logger = logging.getLogger(__name__)
+
+# Names of the artifacts written for each profiled request
+TORCH_TRACE_FILE = "trace.json"
+PYTHON_PROFILE_FILE = "python.prof"
+PYTHON_STATS_FILE = "python_stats.txt"
+SUMMARY_FILE = "summary.json"
+
+# The session of the request running on the current thread, if it is profiled
+_local = threading.local()
+
+# cProfile and the torch profiler are process-wide, so only one session can run them at a time
+_profilers_lock = threading.Lock()
+
+def get_default_profile_dir() -> str:
+    """Get default directory for profile artifacts (backend/python/profiles)"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))  # backend/python/app
+    return os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(current_dir), "profiles"))
+
+@contextmanager
+def _timed_stage(session: "ProfileSession", name: str):
+    import torch
+
+    start = time.perf_counter()
+    with torch.profiler.record_function(name):
+        try:
+            yield
+        finally:
+            session.stages.append({"name": name, "seconds": time.perf_counter() - start})
+
+def profile_stage(name: str):
+    """
+    Label a stage of the current request in the profile.
+
+    A no-op unless the current request is being profiled, so unflagged
+    requests pay nothing for the instrumentation.
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        return nullcontext()
+    return _timed_stage(session, name)
+
+class ProfileSession:
+    """
+    Run one request under torch.profiler and cProfile.
+
+    If another request is already being profiled, the session only records
+    stage timings instead of failing the request.
+    """
+
+    def __init__(self):
+        self.stages: List[Dict[str, Any]] = []
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.traced = False
+        self._torch_profiler = None
+        self._python_profiler = None
+
+    def _start_profilers(self):
+        import torch
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+        self._torch_profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+        self._torch_profiler.__enter__()
+        try:
+            self._python_profiler = cProfile.Profile()
+            self._python_profiler.enable()
+        except ValueError:
+            # A profiler outside this module (e.g. a debugger) holds the hook
+            self._torch_profiler.__exit__(None, None, None)
+            self._python_profiler = None
+            raise
+
+    def __enter__(self) -> "ProfileSession":
+        self.started_at = time.time()
+        if _profilers_lock.acquire(blocking=False):
+            try:
+                self._start_profilers()
+                self.traced = True
+            except (RuntimeError, ValueError) as e:
+                _profilers_lock.release()
+                logger.warning(f"Could not start profilers, recording stage timings only: {e}")
+        else:
+            logger.warning("Another request is being profiled, recording stage timings only")
+        _local.session = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.session = None
+        if self.traced:
+            try:
+                self._python_profiler.disable()
+                self._torch_profiler.__exit__(exc_type, exc, tb)
+            finally:
+                _profilers_lock.release()
+        self.duration = time.time() - self.started_at
+        return False
+
+    def save(self, output_dir: str, request_id: str) -> Dict[str, Any]:
+        """
+        Write the trace artifacts for a finished session
+
+        Args:
+            output_dir: Base directory for profile artifacts
+            request_id: Request ID the profile is stored under
+
+        Returns:
+            Summary of the profiled request
+        """
+        profile_dir = os.path.join(output_dir, request_id)
+        os.makedirs(profile_dir, exist_ok=True)
+
+        artifacts = []
+        if self.traced:
+            self._torch_profiler.export_chrome_trace(os.path.join(profile_dir, TORCH_TRACE_FILE))
+            self._python_profiler.dump_stats(os.path.join(profile_dir, PYTHON_PROFILE_FILE))
+
+            stats_buffer = io.StringIO()
+            stats = pstats.Stats(self._python_profiler, stream=stats_buffer)
+            stats.sort_stats("cumulative").print_stats(50)
+            with open(os.path.join(profile_dir, PYTHON_STATS_FILE), "w") as f:
+                f.write(stats_buffer.getvalue())
+            artifacts = [TORCH_TRACE_FILE, PYTHON_PROFILE_FILE, PYTHON_STATS_FILE]
+
+        summary = {
+            "requestId": request_id,
+            "startedAt": self.started_at,
+            "durationSeconds": self.duration,
+            "stages": self.stages,
+            "traced": self.traced,
+            "artifacts": artifacts
+        }
+        with open(os.path.join(profile_dir, SUMMARY_FILE), "w") as f:
+            json.dump(summary, f, indent=2)
+
+        logger.info(f"Profile saved for request {request_id}: {profile_dir}")
+        return summary
+
+class ProfilingController:
+    """Decide which requests are profiled and locate their artifacts"""
+
+    def __init__(self, output_dir: str = None):
+        self.output_dir = output_dir or get_default_profile_dir()
+        # Admin toggle: profile every request, not only flagged ones
+        self.profile_all = False
+
+    def should_profile(self, flagged: bool) -> bool:
+        """Check if a request should run under the profilers"""
+        return flagged or self.profile_all
+
+    def session(self, enabled: bool):
+        """Context manager profiling the enclosed work when enabled"""
+        return ProfileSession() if enabled else nullcontext()
+
+    def save(self, session: ProfileSession, request_id: str) -> Optional[Dict[str, Any]]:
+        """Save a session's artifacts, logging instead of failing the request"""
+        try:
+            return session.save(self.output_dir, request_id)
+        except Exception as e:
+            logger.error(f"Failed to save profile for request {request_id}: {e}")
+            return None
+
+    def get_summary(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Get the stored summary of a profiled request"""
+        if not is_valid_request_id(request_id):
+            return None
+        path = os.path.join(self.output_dir, request_id, SUMMARY_FILE)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def get_artifact_path(self, request_id: str, artifact: str) -> Optional[str]:
+        """Get the path of a stored artifact of a profiled request"""
+        if not is_valid_request_id(request_id) or artifact not in (
+            TORCH_TRACE_FILE, PYTHON_PROFILE_FILE, PYTHON_STATS_FILE, SUMMARY_FILE
+        ):
+            return None
+        path = os.path.join(self.output_dir, request_id, artifact)
+        return path if os.path.isfile(path) else None
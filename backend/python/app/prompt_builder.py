@@ -1,10 +1,58 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+import re
+import threading
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+_HEX_COLOR_PATTERN = re.compile(r"^#?([0-9a-f]{3}|[0-9a-f]{6})$")
+
+def parse_hex_color(value: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Parse "#1A2B3C" or "#abc" into an (r, g, b) tuple, or None if not a hex color
+
+    Without the "#" only digit-bearing values such as "1a2b3c" are accepted, so
+    words spelled with hex letters ("facade", "beaded") are not read as colors.
+    """
+    value = value.strip().lower()
+    match = _HEX_COLOR_PATTERN.match(value)
+    if not match:
+        return None
+    digits = match.group(1)
+    if not value.startswith("#") and not any(c.isdigit() for c in digits):
+        return None
+    if len(digits) == 3:
+        digits = "".join(c * 2 for c in digits)
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+def srgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Convert an (N, 3) array of 8-bit sRGB colors to CIELAB (D65 white point)"""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([
+        [0.4124564, 0.2126729, 0.0193339],
+        [0.3575761, 0.7151522, 0.1191920],
+        [0.1804375, 0.0721750, 0.9503041]
+    ])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([
+        116 * f[:, 1] - 16,
+        500 * (f[:, 0] - f[:, 1]),
+        200 * (f[:, 1] - f[:, 2])
+    ], axis=1)
+
 class PromptBuilder:
-    """Build dynamic prompts from TrendProfile data"""
+    """
+    Build dynamic prompts from TrendProfile data.
+    
+    Lookup tables are compiled once per instance and built prompts are
+    memoized, so prompt sets for thousands of trend profiles are cheap.
+    Hex colors resolve to the perceptually nearest named color (CIELAB).
+    """
     
     # Base template structure
     BASE_TEMPLATE = "High-converting {platform} advertisement for the {industry} industry"
@@ -40,6 +88,20 @@ class PromptBuilder:
         "gray": "neutral gray tones"
     }
     
+    # Reference sRGB value of each named color, for matching hex colors
+    COLOR_REFERENCE_RGB = {
+        "blue": (0, 87, 231),
+        "black": (0, 0, 0),
+        "white": (255, 255, 255),
+        "red": (220, 20, 30),
+        "green": (0, 150, 60),
+        "yellow": (255, 215, 0),
+        "orange": (255, 140, 0),
+        "purple": (128, 0, 128),
+        "pink": (255, 105, 180),
+        "gray": (128, 128, 128)
+    }
+    
     # Platform-specific modifiers
     PLATFORM_MODIFIERS = {
         "instagram": "square format, mobile-optimized",
@@ -58,8 +120,170 @@ class PromptBuilder:
         "saas": "professional and solution-oriented"
     }
     
-    def __init__(self):
+    # Keywords too generic to be worth a place in the prompt
+    STOP_KEYWORDS = frozenset(["the", "and", "for", "you", "your"])
+    
+    QUALITY_MODIFIERS = [
+        "professional advertisement photography",
+        "studio lighting",
+        "high resolution",
+        "commercial grade",
+        "marketing materials"
+    ]
+    
+    STYLE_MODIFIERS = [
+        "minimalist style",
+        "bold and dynamic",
+        "elegant and sophisticated",
+        "modern and trendy",
+        "luxury aesthetic"
+    ]
+    
+    def __init__(self, cache_size: int = 4096):
         self.negative_prompt = "blurry, low quality, distorted, watermark, text overlay, poor lighting, amateur photography, cluttered composition"
+        
+        # Descriptor tables keyed the way profile values are normalized
+        self._layouts = {self._normalize_key(k): v for k, v in self.LAYOUT_DESCRIPTORS.items()}
+        self._creatives = {self._normalize_key(k): v for k, v in self.CREATIVE_DESCRIPTORS.items()}
+        self._quality_suffix = ", ".join(self.QUALITY_MODIFIERS)
+        
+        # Nearest-named-color index in CIELAB
+        self._color_names = list(self.COLOR_REFERENCE_RGB)
+        self._color_lab = srgb_to_lab(np.array([self.COLOR_REFERENCE_RGB[n] for n in self._color_names]))
+        # Bounded LRU of color -> named color
+        self._color_cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._color_cache_limit = cache_size * 4
+        self._color_lock = threading.Lock()
+        
+        self._build_cached = lru_cache(maxsize=cache_size)(self._build)
+    
+    @staticmethod
+    def _normalize_key(value: str) -> str:
+        return value.lower().replace("-", "_")
+    
+    def _match_color_name(self, color: str) -> Optional[str]:
+        """Named color matching a free-form color name such as "Light Blue" """
+        color_lower = color.lower().replace(" ", "")
+        for color_name in self.COLOR_DESCRIPTORS:
+            if color_name in color_lower or color_lower in color_name:
+                return color_name
+        return None
+    
+    def nearest_color_names(self, rgb_colors: Sequence[Tuple[int, int, int]]) -> List[str]:
+        """
+        Find the perceptually nearest named color for each sRGB color
+        
+        Args:
+            rgb_colors: Colors as (r, g, b) tuples
+            
+        Returns:
+            Named color (a COLOR_DESCRIPTORS key) per input color
+        """
+        if not rgb_colors:
+            return []
+        lab = srgb_to_lab(np.array(rgb_colors))
+        distances = ((lab[:, None, :] - self._color_lab[None, :, :]) ** 2).sum(axis=2)
+        return [self._color_names[i] for i in distances.argmin(axis=1)]
+    
+    def _resolve_colors(self, colors: Sequence[str]) -> Dict[str, Optional[str]]:
+        """
+        Resolve colors to named colors, hex colors in one vectorized lookup
+        
+        Returns:
+            Named color (or None) per input color, independent of which
+            entries the cache evicts afterwards
+        """
+        with self._color_lock:
+            resolved = {}
+            hex_colors = {}
+            for color in colors:
+                if color in self._color_cache:
+                    self._color_cache.move_to_end(color)
+                    resolved[color] = self._color_cache[color]
+                    continue
+                rgb = parse_hex_color(color) if color.strip().startswith("#") else None
+                if rgb is None:
+                    name = self._match_color_name(color)
+                    if name is None:
+                        # Bare hex such as "1a2b3c" that is not a color name
+                        rgb = parse_hex_color(color)
+                    if rgb is None:
+                        resolved[color] = self._color_cache[color] = name
+                        continue
+                hex_colors[color] = rgb
+            
+            if hex_colors:
+                names = self.nearest_color_names(list(hex_colors.values()))
+                resolved.update(zip(hex_colors, names))
+                self._color_cache.update(zip(hex_colors, names))
+            
+            while len(self._color_cache) > self._color_cache_limit:
+                self._color_cache.popitem(last=False)
+            return resolved
+    
+    def _build(self,
+               industry: str,
+               platform: str,
+               colors: Tuple[str, ...],
+               layout: str,
+               creative_type: str,
+               keywords: Tuple[str, ...],
+               brand_name: str) -> str:
+        # Start with base template
+        prompt_parts = [self.BASE_TEMPLATE.format(
+            platform=platform.capitalize(),
+            industry=industry.capitalize()
+        )]
+        
+        # Add industry context
+        if industry in self.INDUSTRY_CONTEXTS:
+            prompt_parts.append(self.INDUSTRY_CONTEXTS[industry])
+        
+        # Add layout and creative type descriptions
+        if layout in self._layouts:
+            prompt_parts.append(self._layouts[layout])
+        if creative_type in self._creatives:
+            prompt_parts.append(self._creatives[creative_type])
+        
+        # Add color palette
+        if colors:
+            resolved = self._resolve_colors(colors)
+            names = [name for name in map(resolved.get, colors) if name]
+            if names:
+                prompt_parts.append("color palette: " + ", ".join(self.COLOR_DESCRIPTORS[n] for n in names[:2]))
+        
+        # Add platform-specific modifiers
+        if platform in self.PLATFORM_MODIFIERS:
+            prompt_parts.append(self.PLATFORM_MODIFIERS[platform])
+        
+        # Add trending keywords (filtered and limited)
+        filtered_keywords = [kw for kw in keywords if len(kw) > 2 and kw.lower() not in self.STOP_KEYWORDS]
+        if filtered_keywords:
+            prompt_parts.append(f"keywords: {', '.join(filtered_keywords[:3])}")
+        
+        # Add brand context if provided
+        if brand_name:
+            prompt_parts.append(f"for {brand_name} brand")
+        
+        prompt_parts.append(self._quality_suffix)
+        return ", ".join(prompt_parts)
+    
+    def _prompt_key(self, trend_profile: Dict[str, Any], brand_name: str) -> Tuple:
+        """Hashable view of the profile fields that influence the prompt"""
+        dominant_layouts = trend_profile.get("dominantLayouts") or []
+        creative_types = trend_profile.get("creativeTypes") or []
+        return (
+            trend_profile.get("industry", "").lower(),
+            trend_profile.get("platform", "instagram").lower(),
+            tuple((trend_profile.get("topColors") or [])[:3]),  # Use top 3 colors
+            self._normalize_key(dominant_layouts[0]) if dominant_layouts else "",
+            self._normalize_key(creative_types[0]) if creative_types else "",
+            tuple((trend_profile.get("topKeywords") or [])[:5]),
+            brand_name or ""
+        )
+    
+    def _fallback_prompt(self, trend_profile: Dict[str, Any]) -> str:
+        return f"Professional advertisement for {trend_profile.get('industry', 'product')} industry, high quality, commercial photography"
     
     def build_prompt(self, trend_profile: Dict[str, Any], brand_name: str = "", headline: str = "") -> str:
         """
@@ -74,85 +298,50 @@ class PromptBuilder:
             Complete prompt string for SDXL generation
         """
         try:
-            industry = trend_profile.get("industry", "").lower()
-            platform = trend_profile.get("platform", "instagram").lower()
-            top_colors = trend_profile.get("topColors", [])
-            dominant_layouts = trend_profile.get("dominantLayouts", [])
-            creative_types = trend_profile.get("creativeTypes", [])
-            top_keywords = trend_profile.get("topKeywords", [])
-            
-            # Start with base template
-            prompt_parts = [self.BASE_TEMPLATE.format(
-                platform=platform.capitalize(),
-                industry=industry.capitalize()
-            )]
-            
-            # Add industry context
-            if industry in self.INDUSTRY_CONTEXTS:
-                prompt_parts.append(self.INDUSTRY_CONTEXTS[industry])
-            
-            # Add layout description
-            if dominant_layouts:
-                layout = dominant_layouts[0].lower()
-                if layout in self.LAYOUT_DESCRIPTORS:
-                    prompt_parts.append(self.LAYOUT_DESCRIPTORS[layout])
-            
-            # Add creative type description
-            if creative_types:
-                creative_type = creative_types[0].lower().replace("-", "_")
-                if creative_type in self.CREATIVE_DESCRIPTORS:
-                    prompt_parts.append(self.CREATIVE_DESCRIPTORS[creative_type])
-            
-            # Add color palette
-            if top_colors:
-                color_descriptions = []
-                for color in top_colors[:3]:  # Use top 3 colors
-                    color_lower = color.lower().replace("#", "").replace(" ", "")
-                    # Try to match common color names
-                    for color_name, description in self.COLOR_DESCRIPTORS.items():
-                        if color_name in color_lower or color_lower in color_name:
-                            color_descriptions.append(description)
-                            break
-                
-                if color_descriptions:
-                    prompt_parts.append("color palette: " + ", ".join(color_descriptions[:2]))
-            
-            # Add platform-specific modifiers
-            if platform in self.PLATFORM_MODIFIERS:
-                prompt_parts.append(self.PLATFORM_MODIFIERS[platform])
-            
-            # Add trending keywords (filtered and limited)
-            if top_keywords:
-                # Filter out generic keywords and limit to most relevant
-                filtered_keywords = [kw for kw in top_keywords[:5] 
-                                   if len(kw) > 2 and kw.lower() not in ['the', 'and', 'for', 'you', 'your']]
-                if filtered_keywords:
-                    prompt_parts.append(f"keywords: {', '.join(filtered_keywords[:3])}")
-            
-            # Add brand context if provided
-            if brand_name:
-                prompt_parts.append(f"for {brand_name} brand")
-            
-            # Add quality modifiers
-            quality_modifiers = [
-                "professional advertisement photography",
-                "studio lighting",
-                "high resolution",
-                "commercial grade",
-                "marketing materials"
-            ]
-            prompt_parts.extend(quality_modifiers)
-            
-            # Join all parts
-            final_prompt = ", ".join(prompt_parts)
-            
+            final_prompt = self._build_cached(*self._prompt_key(trend_profile, brand_name))
             logger.info(f"Generated prompt: {final_prompt[:100]}...")
             return final_prompt
             
         except Exception as e:
             logger.error(f"Error building prompt: {e}")
             # Fallback to basic prompt
-            return f"Professional advertisement for {trend_profile.get('industry', 'product')} industry, high quality, commercial photography"
+            return self._fallback_prompt(trend_profile)
+    
+    def build_prompts(self, trend_profiles: List[Dict[str, Any]], brand_name: str = "", headline: str = "") -> List[str]:
+        """
+        Build prompts for many trend profiles at once
+        
+        Hex colors of all profiles are resolved in a single vectorized
+        lookup, and repeated profiles are served from the memo.
+        
+        Args:
+            trend_profiles: TrendProfile dictionaries
+            brand_name: Optional brand name to include
+            headline: Optional headline to incorporate
+            
+        Returns:
+            One prompt per trend profile, in order
+        """
+        keys = []
+        for trend_profile in trend_profiles:
+            try:
+                keys.append(self._prompt_key(trend_profile, brand_name))
+            except Exception as e:
+                logger.error(f"Error building prompt: {e}")
+                keys.append(None)
+        
+        self._resolve_colors([color for key in keys if key for color in key[2]])
+        
+        prompts = []
+        for trend_profile, key in zip(trend_profiles, keys):
+            try:
+                prompts.append(self._build_cached(*key) if key else self._fallback_prompt(trend_profile))
+            except Exception as e:
+                logger.error(f"Error building prompt: {e}")
+                prompts.append(self._fallback_prompt(trend_profile))
+        
+        logger.info(f"Generated {len(prompts)} prompts ({self._build_cached.cache_info().hits} cache hits so far)")
+        return prompts
     
     def get_negative_prompt(self) -> str:
         """Get negative prompt to avoid unwanted elements"""
@@ -171,16 +360,7 @@ class PromptBuilder:
         """
         variations = [base_prompt]  # Include original
         
-        style_modifiers = [
-            "minimalist style",
-            "bold and dynamic",
-            "elegant and sophisticated",
-            "modern and trendy",
-            "luxury aesthetic"
-        ]
-        
-        for i in range(min(num_variations - 1, len(style_modifiers))):
-            varied_prompt = f"{base_prompt}, {style_modifiers[i]}"
-            variations.append(varied_prompt)
+        for style_modifier in self.STYLE_MODIFIERS[:max(0, num_variations - 1)]:
+            variations.append(f"{base_prompt}, {style_modifier}")
         
-        return variations[:num_variations]
\ No newline at end of file
+        return variations[:num_variations]
@@ -1,9 +1,17 @@
 import io
+import os
+import hmac
+import math
+import time
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Depends
-from fastapi.responses import JSONResponse
+import threading
+from functools import lru_cache
+from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Depends, Header, Request
+from fastapi.responses import JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
 from PIL import Image
-from typing import Optional
+from typing import Any, Optional, Tuple
 
 from .schemas import (
     GenerateRequest, 
@@ -11,10 +19,16 @@ from .schemas import (
     ErrorResponse, 
     HealthResponse,
     TrendProfileData,
-    LegacyGenerateRequest
+    LegacyGenerateRequest,
+    ProfilingToggleRequest
 )
 from .generator import SDXLGenerator
-from .utils import validate_image_format
+from .exporter import parse_platforms
+from .upload_store import UploadStore
+from .latency_model import latency_key
+from .profiling import ProfilingController
+from .scheduler import GenerationScheduler, Job, QueueFullError, DeadlineExceededError, LANES, INTERACTIVE
+from .utils import validate_image_format, generate_request_id, get_device_info, GenerationCancelled
 
 logger = logging.getLogger(__name__)
 
@@ -23,16 +37,155 @@ router = APIRouter()
 
 # Global generator instance
 _generator: Optional[SDXLGenerator] = None
+# Scheduler workers and threadpool endpoints may race to create it
+_generator_lock = threading.Lock()
 
 def get_generator() -> SDXLGenerator:
     """Get or create the global SDXL generator instance"""
     global _generator
-    if _generator is None:
-        logger.info("Creating SDXL Generator instance...")
-        _generator = SDXLGenerator()
-        # Initialize in background or on first use
+    with _generator_lock:
+        if _generator is None:
+            logger.info("Creating SDXL Generator instance...")
+            _generator = SDXLGenerator()
+            # Initialize in background or on first use
     return _generator
 
+def get_ready_generator() -> SDXLGenerator:
+    """Get the global generator, initializing it on first use"""
+    generator = get_generator()
+    if not generator.is_ready():
+        logger.info("Initializing generator for first use...")
+        if not generator.initialize():
+            raise HTTPException(status_code=503, detail="Generator initialization failed")
+    return generator
+
+# Decides which requests run under the profilers
+_profiling = ProfilingController()
+
+# Orders generation work across priority lanes and tenants
+_scheduler = GenerationScheduler.from_env()
+_upload_store = UploadStore()
+
+# How often a waiting request checks whether its client went away
+DISCONNECT_POLL_SECONDS = 0.5
+
+def _parse_deadline(timeout_seconds: Optional[float], x_request_deadline: Optional[str]) -> Optional[float]:
+    """
+    Convert a relative timeout or an absolute deadline header to a monotonic deadline
+    
+    Args:
+        timeout_seconds: Seconds from now the client is willing to wait
+        x_request_deadline: Absolute deadline as Unix epoch seconds
+        
+    Returns:
+        time.monotonic() deadline, the earlier of both if both are given, or None
+    """
+    deadlines = []
+    if timeout_seconds is not None and timeout_seconds > 0:
+        deadlines.append(time.monotonic() + timeout_seconds)
+    if x_request_deadline:
+        try:
+            deadlines.append(time.monotonic() + float(x_request_deadline) - time.time())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid X-Request-Deadline, expected Unix epoch seconds")
+    return min(deadlines) if deadlines else None
+
+def _queue_full_response(error: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
+
+# Endpoints whose requests are shed by AdmissionMiddleware
+ADMISSION_PATHS = ("/generate", "/refine")
+
+class AdmissionMiddleware:
+    """
+    Reject generation requests with 429 before their body is received.
+
+    FastAPI reads and parses the whole multipart form before a handler or
+    its dependencies run, so admission has to happen at the ASGI level to
+    spare a full queue the upload. The scheduler checks admission again
+    when the job is queued.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in ADMISSION_PATHS:
+            try:
+                _scheduler.check_admission()
+            except QueueFullError as e:
+                error = _queue_full_response(e)
+                response = JSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+async def _run_scheduled(request: Request, fn, cancel_event: threading.Event, **enqueue_kwargs) -> Tuple[Any, Job]:
+    """
+    Run fn through the scheduler, abandoning it if the client disconnects
+    
+    A job still in the queue is dropped; a running one is stopped at its
+    next denoising step through cancel_event.
+    
+    Returns:
+        The function's result and the finished job
+    """
+    job = _scheduler.enqueue(fn, **enqueue_kwargs)
+    try:
+        while True:
+            done, _ = await asyncio.wait({job.future}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return job.future.result(), job
+            if await request.is_disconnected():
+                raise GenerationCancelled("Client disconnected")
+    finally:
+        if not job.future.done():
+            cancel_event.set()
+            job.future.cancel()
+
+@lru_cache(maxsize=1)
+def _default_device() -> str:
+    return get_device_info()[0]
+
+def _latency_key(kind: str) -> str:
+    """
+    Latency model key of a job kind on the current backend and device
+    
+    Runs on the event loop, so it reads the configuration the generator
+    will be created with instead of creating it.
+    """
+    generator = _generator
+    if generator is not None:
+        return latency_key(generator.backend.name, generator.device, kind)
+    return latency_key(os.getenv("INFERENCE_BACKEND", "torch"), _default_device(), kind)
+
+def _scheduling_error(error: Exception) -> HTTPException:
+    """Map admission, deadline and cancellation errors to HTTP errors"""
+    if isinstance(error, QueueFullError):
+        return _queue_full_response(error)
+    if isinstance(error, DeadlineExceededError):
+        return HTTPException(status_code=504, detail=str(error))
+    if isinstance(error, GenerationCancelled):
+        # Nobody is listening any more; 499 is the conventional "client closed request"
+        return HTTPException(status_code=499, detail=str(error))
+    return HTTPException(status_code=500, detail=str(error))
+
+# Clients allowed to use admin endpoints when no ADMIN_TOKEN is configured
+LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(None)):
+    """Guard admin endpoints with ADMIN_TOKEN, or allow only local clients when it is not configured"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if admin_token:
+        if not hmac.compare_digest(x_admin_token or "", admin_token):
+            raise HTTPException(status_code=403, detail="Admin token required")
+    elif request.client is None or request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(status_code=403, detail="Admin endpoints are local-only unless ADMIN_TOKEN is set")
+
 @router.get("/health", response_model=HealthResponse)
 def health():
     """Health check endpoint with generator status"""
@@ -57,7 +210,8 @@ def health():
 
 @router.post("/generate", response_model=GenerateResponse)
 async def generate(
-    product_image: UploadFile = File(..., description="Product image file"),
+    request: Request,
+    product_image: Optional[UploadFile] = File(None, description="Product image file"),
     industry: str = Form(..., description="Industry category"),
     platform: str = Form(..., description="Target platform"),
     trend_profile: str = Form(..., description="JSON string of TrendProfile data"),
@@ -67,31 +221,63 @@ async def generate(
     num_inference_steps: Optional[int] = Form(30, description="Inference steps"),
     guidance_scale: Optional[float] = Form(7.5, description="Guidance scale"),
     controlnet_conditioning_scale: Optional[float] = Form(1.0, description="ControlNet scale"),
-    base_seed: Optional[int] = Form(None, description="Base seed")
+    base_seed: Optional[int] = Form(None, description="Base seed"),
+    image_ref: Optional[str] = Form(None, description="Path of an already stored upload, relative to the upload root"),
+    image_sha256: Optional[str] = Form(None, description="SHA-256 of an already stored upload"),
+    tenant: Optional[str] = Form(None, description="Tenant for fair scheduling (defaults to brand name)"),
+    priority: Optional[str] = Form(INTERACTIVE, description="Scheduling lane: interactive or bulk"),
+    timeout_seconds: Optional[float] = Form(None, description="Drop the request if generation has not started within this time"),
+    export_platforms: Optional[str] = Form(None, description="Comma-separated platforms to export crops for (instagram, facebook, tiktok, pinterest)"),
+    profile: Optional[bool] = Form(False, description="Profile this request"),
+    x_profile: Optional[str] = Header(None, description="Set to 1 to profile this request"),
+    x_request_deadline: Optional[str] = Header(None, description="Absolute deadline as Unix epoch seconds")
 ):
     """
     Generate ad creatives using SDXL and ControlNet
     
     This endpoint accepts a product image and trend profile data,
     then generates 3-5 ad variations using Stable Diffusion XL.
+    
+    The product image is either uploaded, or referenced by image_ref or
+    image_sha256 when the Node.js backend has already stored it.
     """
-    request_id = None
+    request_id = generate_request_id()
+    profiled = _profiling.should_profile(bool(profile) or x_profile in ("1", "true", "yes"))
+    cancel_event = threading.Event()
+    received_at = time.monotonic()
     
     try:
-        # Validate and parse inputs
-        if not product_image.content_type or not product_image.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="Invalid image format")
+        deadline = _parse_deadline(timeout_seconds, x_request_deadline)
         
-        # Read and validate image
-        image_data = await product_image.read()
-        if not validate_image_format(image_data):
-            raise HTTPException(status_code=400, detail="Unsupported image format")
+        if sum(source is not None for source in (product_image, image_ref, image_sha256)) != 1:
+            raise HTTPException(status_code=400, detail="Provide exactly one of product_image, image_ref or image_sha256")
         
-        # Parse image
-        try:
-            pil_image = Image.open(io.BytesIO(image_data))
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Could not process image: {str(e)}")
+        if product_image is None:
+            # Read the stored upload directly instead of receiving its bytes again
+            try:
+                pil_image = await run_in_threadpool(_upload_store.load, image_ref, image_sha256)
+            except FileNotFoundError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            # Validate and parse inputs
+            if not product_image.content_type or not product_image.content_type.startswith('image/'):
+                raise HTTPException(status_code=400, detail="Invalid image format")
+            
+            # Read and validate image
+            image_data = await product_image.read()
+            if not validate_image_format(image_data):
+                raise HTTPException(status_code=400, detail="Unsupported image format")
+            
+            # Parse image
+            try:
+                pil_image = Image.open(io.BytesIO(image_data))
+                # Decode now so the raw upload is not kept alive while queued
+                pil_image.load()
+                del image_data
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Could not process image: {str(e)}")
         
         # Parse trend profile JSON
         try:
@@ -109,35 +295,69 @@ async def generate(
         guidance_scale = max(1.0, min(20.0, guidance_scale or 7.5))
         controlnet_conditioning_scale = max(0.1, min(2.0, controlnet_conditioning_scale or 1.0))
         
-        # Get generator and ensure it's initialized
-        generator = get_generator()
-        if not generator.is_ready():
-            logger.info("Initializing generator for first use...")
-            if not generator.initialize():
-                raise HTTPException(status_code=503, detail="Generator initialization failed")
+        priority = priority or INTERACTIVE
+        if priority not in LANES:
+            raise HTTPException(status_code=400, detail=f"Invalid priority, expected one of {', '.join(LANES)}")
+        tenant = tenant or brand_name or "default"
+        
+        try:
+            platforms = parse_platforms(export_platforms)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        def run_generation():
+            # Runs on a scheduler worker thread, where the profilers must also run
+            generator = get_ready_generator()
+            session = _profiling.session(profiled)
+            try:
+                with session:
+                    return generator.generate_ads(
+                        product_image=pil_image,
+                        trend_profile=trend_profile_data.dict(),
+                        brand_name=brand_name or "",
+                        headline=headline or "",
+                        num_images=num_images,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        controlnet_conditioning_scale=controlnet_conditioning_scale,
+                        base_seed=base_seed,
+                        request_id=request_id,
+                        cancel_event=cancel_event,
+                        export_platforms=platforms,
+                        tenant=tenant
+                    )
+            finally:
+                if profiled:
+                    _profiling.save(session, request_id)
         
         # Generate ads
-        logger.info(f"Starting ad generation for {industry}/{platform}")
-        
-        result = generator.generate_ads(
-            product_image=pil_image,
-            trend_profile=trend_profile_data.dict(),
-            brand_name=brand_name or "",
-            headline=headline or "",
-            num_images=num_images,
-            num_inference_steps=num_inference_steps,
-            guidance_scale=guidance_scale,
-            controlnet_conditioning_scale=controlnet_conditioning_scale,
-            base_seed=base_seed
+        logger.info(f"Queueing ad generation for {industry}/{platform} (tenant: {tenant}, lane: {priority})")
+        
+        result, job = await _run_scheduled(
+            request,
+            run_generation,
+            cancel_event,
+            tenant=tenant,
+            lane=priority,
+            deadline=deadline,
+            latency_key=_latency_key("generate"),
+            work=num_images * num_inference_steps
         )
         
-        request_id = result["requestId"]
-        logger.info(f"Ad generation completed: {request_id}")
+        logger.info(f"Ad generation completed: {request_id} (eta: {job.eta:.1f}s, actual: {time.monotonic() - received_at:.1f}s)")
+        
+        if profiled:
+            result["profileUrl"] = f"/profiles/{request_id}"
+        result["etaSeconds"] = job.eta
+        result["elapsedSeconds"] = time.monotonic() - received_at
         
         return GenerateResponse(**result)
         
     except HTTPException:
         raise
+    except (QueueFullError, DeadlineExceededError, GenerationCancelled) as e:
+        logger.info(f"Generation not completed (request: {request_id}): {e}")
+        raise _scheduling_error(e)
     except Exception as e:
         logger.error(f"Generation error (request: {request_id}): {e}")
         raise HTTPException(
@@ -145,6 +365,111 @@ async def generate(
             detail=f"Generation failed: {str(e)}"
         )
 
+@router.post("/refine", response_model=GenerateResponse)
+async def refine(
+    request: Request,
+    request_id: str = Form(..., description="Request ID of the generation to refine"),
+    image_index: int = Form(..., description="1-based index of the image to refine"),
+    prompt_suffix: Optional[str] = Form("", description="Prompt tweak appended to the original prompt"),
+    strength: Optional[float] = Form(0.35, description="Variation strength (0.1-0.9)"),
+    num_variations: Optional[int] = Form(3, description="Number of variations (1-5)"),
+    base_seed: Optional[int] = Form(None, description="Base seed"),
+    tenant: Optional[str] = Form(None, description="Tenant for fair scheduling if the original generation recorded none"),
+    priority: Optional[str] = Form(INTERACTIVE, description="Scheduling lane: interactive or bulk"),
+    timeout_seconds: Optional[float] = Form(None, description="Drop the request if refinement has not started within this time"),
+    x_request_deadline: Optional[str] = Header(None, description="Absolute deadline as Unix epoch seconds")
+):
+    """
+    Create nearby variations of a previous result
+    
+    Runs a ControlNet img2img pass starting from the stored image, so only
+    a `strength` fraction of the denoising steps is paid for.
+    """
+    cancel_event = threading.Event()
+    received_at = time.monotonic()
+    
+    try:
+        deadline = _parse_deadline(timeout_seconds, x_request_deadline)
+        strength = max(0.1, min(0.9, strength or 0.35))
+        num_variations = max(1, min(5, num_variations or 3))
+        
+        priority = priority or INTERACTIVE
+        if priority not in LANES:
+            raise HTTPException(status_code=400, detail=f"Invalid priority, expected one of {', '.join(LANES)}")
+        
+        # Fail fast instead of queueing work the backend cannot do
+        if _generator is not None and not _generator.backend.supports_refine:
+            raise HTTPException(status_code=501, detail=f"The {_generator.backend.name} backend does not support refinement")
+        
+        # Refinements are accounted to the brand and step count of the result they refine
+        metadata = await run_in_threadpool(lambda: get_generator().load_generation_metadata(request_id))
+        if metadata is None:
+            raise HTTPException(status_code=404, detail=f"No stored result for request {request_id}")
+        tenant = metadata.get("tenant") or tenant or "default"
+        
+        def run_refinement():
+            return get_ready_generator().refine_ad(
+                source_request_id=request_id,
+                image_index=image_index,
+                prompt_suffix=prompt_suffix or "",
+                strength=strength,
+                num_variations=num_variations,
+                base_seed=base_seed,
+                cancel_event=cancel_event
+            )
+        
+        # img2img runs about `strength` of the denoising steps of a full generation
+        result, job = await _run_scheduled(
+            request,
+            run_refinement,
+            cancel_event,
+            tenant=tenant,
+            lane=priority,
+            deadline=deadline,
+            latency_key=_latency_key("refine"),
+            work=num_variations * metadata["numInferenceSteps"] * strength
+        )
+        result["etaSeconds"] = job.eta
+        result["elapsedSeconds"] = time.monotonic() - received_at
+        return GenerateResponse(**result)
+        
+    except HTTPException:
+        raise
+    except (QueueFullError, DeadlineExceededError, GenerationCancelled) as e:
+        logger.info(f"Refinement not completed (source request: {request_id}): {e}")
+        raise _scheduling_error(e)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        logger.error(f"Refinement error (source request: {request_id}): {e}")
+        raise HTTPException(status_code=500, detail=f"Refinement failed: {str(e)}")
+
+@router.get("/scheduler/stats")
+def scheduler_stats():
+    """Queue depth and wait times per scheduling lane"""
+    return _scheduler.stats()
+
+@router.get("/scheduler/estimate")
+def scheduler_estimate(
+    num_images: int = 4,
+    num_inference_steps: int = 30,
+    priority: str = INTERACTIVE
+):
+    """
+    Predicted wait, run time and total ETA of a /generate request submitted now
+    
+    /generate responds only when the images are done (with the etaSeconds
+    predicted at admission), so clients that show progress ask here before
+    submitting.
+    """
+    if priority not in LANES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority, expected one of {', '.join(LANES)}")
+    num_images = max(3, min(5, num_images))
+    num_inference_steps = max(10, min(50, num_inference_steps))
+    return _scheduler.estimate(priority, _latency_key("generate"), num_images * num_inference_steps)
+
 @router.post("/initialize")
 def initialize_generator():
     """Manually initialize the generator (useful for warming up)"""
@@ -166,6 +491,34 @@ def initialize_generator():
         logger.error(f"Manual initialization error: {e}")
         raise HTTPException(status_code=500, detail=f"Initialization failed: {str(e)}")
 
+@router.get("/admin/profiling", dependencies=[Depends(require_admin)])
+def get_profiling():
+    """Get the profiling toggle state"""
+    return {"profileAll": _profiling.profile_all, "outputDir": _profiling.output_dir}
+
+@router.post("/admin/profiling", dependencies=[Depends(require_admin)])
+def set_profiling(req: ProfilingToggleRequest):
+    """Toggle profiling of every /generate request"""
+    _profiling.profile_all = req.enabled
+    logger.info(f"Profiling of all requests {'enabled' if req.enabled else 'disabled'}")
+    return {"profileAll": _profiling.profile_all}
+
+@router.get("/profiles/{request_id}", dependencies=[Depends(require_admin)])
+def get_profile(request_id: str):
+    """Get the timing summary and artifact list of a profiled request"""
+    summary = _profiling.get_summary(request_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return summary
+
+@router.get("/profiles/{request_id}/{artifact}", dependencies=[Depends(require_admin)])
+def get_profile_artifact(request_id: str, artifact: str):
+    """Download a trace artifact of a profiled request"""
+    path = _profiling.get_artifact_path(request_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile artifact not found")
+    return FileResponse(path, filename=f"{request_id}-{artifact}")
+
 # Legacy endpoint for backward compatibility
 @router.post("/generate_legacy")
 def generate_legacy(req: LegacyGenerateRequest):
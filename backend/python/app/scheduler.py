@@ -0,0 +1,374 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+from .latency_model import LatencyModel
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+# Number of recent dispatches kept per lane for wait-time statistics
+WAIT_HISTORY = 200
+
+class QueueFullError(Exception):
+    """The admission queue is full; retry after `retry_after` seconds"""
+    
+    def __init__(self, retry_after: float):
+        super().__init__(f"Generation queue is full, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class DeadlineExceededError(Exception):
+    """The job's deadline passed before it could start"""
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """Parse "name=weight" pairs such as "brand-a=2,brand-b=0.5" """
+    weights = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, weight = item.split("=", 1)
+            weights[name.strip()] = float(weight)
+    return weights
+
+class Job:
+    """A unit of generation work waiting for or holding a worker"""
+
+    def __init__(self, fn: Callable[[], Any], tenant: str, lane: str, cost: float, deadline: Optional[float] = None,
+                 latency_key: Optional[str] = None, work: float = 0.0):
+        self.fn = fn
+        self.tenant = tenant
+        self.lane = lane
+        # Predicted run time in seconds
+        self.cost = cost
+        self.latency_key = latency_key
+        self.work = work
+        # time.monotonic() value after which the job is no longer worth starting
+        self.deadline = deadline
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        # True while the job sits in the scheduler's queues
+        self.queued = False
+        # Predicted seconds from enqueueing to completion
+        self.eta: Optional[float] = None
+
+class _FairQueue:
+    """
+    Weighted fair queue over flows (stride scheduling).
+
+    Each flow has a pass value advanced by cost / weight whenever one of its
+    jobs is dispatched; the backlogged flow with the lowest pass goes next.
+    A flow that becomes backlogged again starts at the current virtual time,
+    so idle periods do not build up credit.
+    """
+
+    def __init__(self, weights: Dict[str, float], default_weight: float = 1.0):
+        self.weights = weights
+        self.default_weight = default_weight
+        self.queues: Dict[str, Deque[Any]] = {}
+        self.passes: Dict[str, float] = {}
+        self.virtual_time = 0.0
+
+    def push(self, flow: str, item: Any):
+        queue = self.queues.setdefault(flow, deque())
+        if not queue:
+            self.passes[flow] = max(self.passes.get(flow, 0.0), self.virtual_time)
+        queue.append(item)
+
+    def pick(self, eligible: Callable[[str], bool]) -> Optional[str]:
+        """Flow that should be served next among the backlogged, eligible ones"""
+        candidates = [flow for flow, queue in self.queues.items() if queue and eligible(flow)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda flow: self.passes[flow])
+
+    def peek(self, flow: str) -> Any:
+        return self.queues[flow][0]
+    
+    def remove(self, flow: str, item: Any):
+        """Drop an item without charging its flow"""
+        self.queues[flow].remove(item)
+        if not self.queues[flow]:
+            del self.queues[flow]
+    
+    def pop(self, flow: str, cost: float, item: Any = None) -> Any:
+        """Dequeue the flow's first item, or the given one, and charge the flow `cost`"""
+        if item is None:
+            item = self.queues[flow].popleft()
+        else:
+            self.queues[flow].remove(item)
+        self.virtual_time = self.passes[flow]
+        self.passes[flow] += cost / self.weights.get(flow, self.default_weight)
+        if not self.queues[flow]:
+            del self.queues[flow]
+        return item
+
+    def depth(self, flow: Optional[str] = None) -> int:
+        if flow is not None:
+            return len(self.queues.get(flow, ()))
+        return sum(len(queue) for queue in self.queues.values())
+
+class GenerationScheduler:
+    """
+    Schedule generation jobs across lanes and tenants.
+
+    Lanes (interactive, bulk) share the workers by weight, so latency
+    sensitive work overtakes a bulk backlog without starving it. Within a
+    lane, tenants (brands) are served by weighted fair queuing and can be
+    capped to a number of concurrently running jobs. Jobs run on a thread
+    pool so the event loop stays responsive during inference.
+    
+    Job costs are run times predicted by a LatencyModel, which learns from
+    every completed job. The same predictions give the wait and ETA
+    estimates used for Retry-After values and deadline feasibility.
+    
+    Admission is bounded: once `max_queue` jobs are waiting, submit()
+    raises QueueFullError with an estimate of when capacity frees up. Jobs
+    that were cancelled or whose deadline passed (or cannot be met) are
+    dropped before they start.
+    """
+
+    def __init__(self,
+                 workers: int = 1,
+                 lane_weights: Optional[Dict[str, float]] = None,
+                 tenant_weights: Optional[Dict[str, float]] = None,
+                 tenant_caps: Optional[Dict[str, int]] = None,
+                 default_tenant_cap: int = 0,
+                 max_queue: int = 0,
+                 latency_model: Optional[LatencyModel] = None):
+        self.workers = workers
+        self.tenant_caps = tenant_caps or {}
+        self.default_tenant_cap = default_tenant_cap
+        self.max_queue = max_queue
+        self.latency_model = latency_model or LatencyModel()
+        self._queued_cost: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._running_jobs: List[Job] = []
+
+        self._lanes = _FairQueue(lane_weights or {INTERACTIVE: 8.0, BULK: 1.0})
+        self._tenants = {lane: _FairQueue(tenant_weights or {}) for lane in LANES}
+        self._running: Dict[str, int] = {}
+        self._running_by_lane: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._waits: Dict[str, Deque[float]] = {lane: deque(maxlen=WAIT_HISTORY) for lane in LANES}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generation")
+
+    @classmethod
+    def from_env(cls) -> "GenerationScheduler":
+        """Create a scheduler configured from SCHEDULER_* and TENANT_* environment variables"""
+        return cls(
+            workers=int(os.getenv("SCHEDULER_WORKERS", "1")),
+            lane_weights=parse_weights(os.getenv("SCHEDULER_LANE_WEIGHTS", "interactive=8,bulk=1")),
+            tenant_weights=parse_weights(os.getenv("TENANT_WEIGHTS", "")),
+            tenant_caps={name: int(cap) for name, cap in parse_weights(os.getenv("TENANT_CONCURRENCY_CAPS", "")).items()},
+            default_tenant_cap=int(os.getenv("TENANT_MAX_CONCURRENCY", "0")),
+            max_queue=int(os.getenv("SCHEDULER_MAX_QUEUE", "32"))
+        )
+
+    def _tenant_cap(self, tenant: str) -> int:
+        return self.tenant_caps.get(tenant, self.default_tenant_cap)
+
+    def _tenant_eligible(self, tenant: str) -> bool:
+        cap = self._tenant_cap(tenant)
+        return cap <= 0 or self._running.get(tenant, 0) < cap
+
+    def _lane_eligible(self, lane: str) -> bool:
+        return self._tenants[lane].pick(self._tenant_eligible) is not None
+
+    def _discard(self, job: Job):
+        """Remove a job that has not started from the queues"""
+        if not job.queued:
+            return
+        job.queued = False
+        self._tenants[job.lane].remove(job.tenant, job)
+        self._lanes.remove(job.lane, job)
+        self._queued_cost[job.lane] -= job.cost
+
+    def _sweep(self):
+        """Drop queued jobs that were cancelled or whose deadline passed"""
+        now = time.monotonic()
+        for lane in LANES:
+            for queue in list(self._tenants[lane].queues.values()):
+                for job in list(queue):
+                    # Abandoned work is dropped without being charged to its tenant
+                    if job.future.cancelled():
+                        self._discard(job)
+                    elif job.deadline is not None and now > job.deadline:
+                        self._discard(job)
+                        job.future.set_exception(DeadlineExceededError("Deadline passed before generation started"))
+
+    def _next_job(self) -> Optional[Job]:
+        self._sweep()
+        lane = self._lanes.pick(self._lane_eligible)
+        if lane is None:
+            return None
+        tenants = self._tenants[lane]
+        tenant = tenants.pick(self._tenant_eligible)
+        job = tenants.peek(tenant)
+        
+        job.queued = False
+        self._queued_cost[lane] -= job.cost
+        tenants.pop(tenant, job.cost)
+        self._lanes.pop(lane, job.cost, job)
+        return job
+
+    def _dispatch(self):
+        """Start queued jobs while workers are free"""
+        while sum(self._running_by_lane.values()) < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self._start(job)
+
+    def _start(self, job: Job):
+        job.started_at = time.monotonic()
+        self._waits[job.lane].append(job.started_at - job.enqueued_at)
+        self._running[job.tenant] = self._running.get(job.tenant, 0) + 1
+        self._running_by_lane[job.lane] += 1
+        self._running_jobs.append(job)
+
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self._executor, job.fn)
+        task.add_done_callback(lambda done: self._finish(job, done))
+
+    def _finish(self, job: Job, done: asyncio.Future):
+        if job.latency_key and done.exception() is None:
+            self.latency_model.record(job.latency_key, job.work, time.monotonic() - job.started_at)
+            if self.latency_model.save_due():
+                # Runs on the event loop: keep the file write off it
+                asyncio.get_running_loop().run_in_executor(None, self.latency_model.save)
+        
+        self._running_jobs.remove(job)
+        self._running[job.tenant] -= 1
+        if not self._running[job.tenant]:
+            del self._running[job.tenant]
+        self._running_by_lane[job.lane] -= 1
+
+        if not job.future.cancelled():
+            if done.exception() is not None:
+                job.future.set_exception(done.exception())
+            else:
+                job.future.set_result(done.result())
+        self._dispatch()
+
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        self._sweep()
+        return self._lanes.depth()
+    
+    def _running_remaining(self) -> List[float]:
+        """Predicted seconds left for each running job"""
+        now = time.monotonic()
+        return [max(0.0, job.started_at + job.cost - now) for job in self._running_jobs]
+    
+    def estimate_wait(self, lane: Optional[str] = None) -> float:
+        """
+        Estimated seconds until a job submitted now would start
+        
+        Interactive jobs overtake the bulk backlog, so only queued
+        interactive work counts against them; bulk jobs wait behind all of it.
+        """
+        self._sweep()
+        queued = self._queued_cost[INTERACTIVE] if lane == INTERACTIVE else sum(self._queued_cost.values())
+        remaining = self._running_remaining()
+        if len(remaining) < self.workers:
+            # A free worker takes the job as soon as the queue ahead of it drains
+            return queued / self.workers
+        return (queued + sum(remaining)) / self.workers
+    
+    def predict(self, latency_key: str, work: float) -> float:
+        """Predicted run time in seconds of a job of `work` units"""
+        return self.latency_model.predict(latency_key, work)
+    
+    def estimate(self, lane: str, latency_key: str, work: float) -> Dict[str, float]:
+        """Predicted wait, run time and total ETA of a job submitted now"""
+        wait = self.estimate_wait(lane)
+        run = self.predict(latency_key, work)
+        return {"waitSeconds": wait, "runSeconds": run, "etaSeconds": wait + run}
+    
+    def _retry_after(self) -> float:
+        """Estimated seconds until a queue slot frees up, i.e. the next job starts"""
+        remaining = self._running_remaining()
+        return max(1.0, min(remaining) if remaining else 0.0)
+    
+    def check_admission(self):
+        """Raise QueueFullError if no more jobs can be queued"""
+        if self.max_queue > 0 and self.queue_depth() >= self.max_queue:
+            raise QueueFullError(self._retry_after())
+    
+    def enqueue(self, fn: Callable[[], Any], tenant: str = "default", lane: str = INTERACTIVE,
+                cost: Optional[float] = None, deadline: Optional[float] = None,
+                latency_key: Optional[str] = None, work: float = 0.0) -> Job:
+        """
+        Queue a blocking function; its result is delivered through the job's future
+
+        Args:
+            fn: Blocking function to run on a worker thread
+            tenant: Tenant (brand) the work is accounted to
+            lane: Priority lane, "interactive" or "bulk"
+            cost: Expected run time in seconds, predicted from latency_key and work if omitted
+            deadline: time.monotonic() value after which the job is dropped unstarted
+            latency_key: Configuration key the run time is recorded under
+            work: Work units of the job (images x denoising steps)
+
+        Returns:
+            The queued job; cancelling its future drops it if it has not started
+        """
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {', '.join(LANES)}")
+        self.check_admission()
+        if deadline is not None:
+            wait = self.estimate_wait(lane)
+            if time.monotonic() + wait > deadline:
+                raise DeadlineExceededError(f"Generation cannot start before the deadline (estimated wait {wait:.0f}s)")
+        if cost is None:
+            cost = self.predict(latency_key, work) if latency_key else 1.0
+
+        job = Job(fn, tenant, lane, cost, deadline, latency_key, work)
+        job.eta = self.estimate_wait(lane) + cost
+        self._queued_cost[lane] += cost
+        # The lane queue holds one token per job; tenants order jobs within the lane
+        self._tenants[lane].push(tenant, job)
+        self._lanes.push(lane, job)
+        job.queued = True
+        # Free the slot (and the inputs the job holds) as soon as it is cancelled
+        job.future.add_done_callback(lambda _: self._discard(job))
+        self._dispatch()
+        return job
+    
+    async def submit(self, fn: Callable[[], Any], tenant: str = "default", lane: str = INTERACTIVE, **kwargs) -> Any:
+        """Queue a blocking function and wait for its result (see enqueue() for arguments)"""
+        job = self.enqueue(fn, tenant, lane, **kwargs)
+        return await job.future
+
+    def shutdown(self):
+        """Stop accepting work and persist the timing history recorded since the last save"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.latency_model.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, running jobs and recent wait times per lane"""
+        self._sweep()
+        lanes = {}
+        for lane in LANES:
+            waits: List[float] = sorted(self._waits[lane])
+            tenants = self._tenants[lane]
+            lanes[lane] = {
+                "queued": tenants.depth(),
+                "running": self._running_by_lane[lane],
+                "queuedByTenant": {tenant: tenants.depth(tenant) for tenant in tenants.queues},
+                "queuedSeconds": self._queued_cost[lane],
+                "estimatedWaitSeconds": self.estimate_wait(lane),
+                "waitSecondsAvg": sum(waits) / len(waits) if waits else 0.0,
+                "waitSecondsP95": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0
+            }
+        return {
+            "workers": self.workers,
+            "maxQueue": self.max_queue,
+            "lanes": lanes,
+            "runningByTenant": dict(self._running),
+            "latencyModel": self.latency_model.stats()
+        }
@@ -37,6 +37,12 @@ class GenerateResponse(BaseModel):
     images: List[str] = Field(..., description="List of relative image paths")
     numGenerated: int = Field(..., description="Number of successfully generated images")
     prompt: Optional[str] = Field(default=None, description="Base prompt used for generation")
+    profileUrl: Optional[str] = Field(default=None, description="Profile summary URL if the request was profiled")
+    parentRequestId: Optional[str] = Field(default=None, description="Request the images were refined from")
+    exports: Optional[Dict[str, List[str]]] = Field(default=None, description="Platform-specific image paths per export platform")
+    exportErrors: Optional[Dict[str, str]] = Field(default=None, description="Error per export platform whose export failed")
+    etaSeconds: Optional[float] = Field(default=None, description="Predicted end-to-end time when the request was admitted")
+    elapsedSeconds: Optional[float] = Field(default=None, description="Actual end-to-end time of the request")
 
 class ErrorResponse(BaseModel):
     """Error response schema"""
@@ -50,6 +56,10 @@ class HealthResponse(BaseModel):
     generator_ready: Optional[bool] = Field(default=None, description="Whether generator is ready")
     memory_info: Optional[Dict[str, Any]] = Field(default=None, description="Memory usage information")
 
+class ProfilingToggleRequest(BaseModel):
+    """Admin toggle for profiling every generation request"""
+    enabled: bool = Field(..., description="Whether to profile all /generate requests")
+
 # Legacy schema for backward compatibility
 class LegacyGenerateRequest(BaseModel):
     prompt: Optional[str] = None
@@ -0,0 +1,171 @@
+import os
+import json
+import glob
+import time
+import struct
+import logging
+import inspect
+import importlib
+from typing import Any, Dict, Optional
+import torch
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MANIFEST = "snapshot.json"
+
+# safetensors dtype names -> torch dtypes
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool
+}
+
+def get_default_snapshot_dir() -> str:
+    """Get default pipeline snapshot directory (backend/python/models/snapshot)"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))  # backend/python/app
+    return os.getenv("MODEL_SNAPSHOT_DIR", os.path.join(os.path.dirname(current_dir), "models", "snapshot"))
+
+def has_snapshot(snapshot_dir: str) -> bool:
+    """Check if a directory holds a complete pipeline snapshot"""
+    return os.path.isfile(os.path.join(snapshot_dir, SNAPSHOT_MANIFEST))
+
+def read_snapshot_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    """Read the manifest describing what a snapshot was built from"""
+    with open(os.path.join(snapshot_dir, SNAPSHOT_MANIFEST)) as f:
+        return json.load(f)
+
+def check_snapshot_manifest(manifest: Dict[str, Any], base_model_id: str, controlnet_id: str,
+                            torch_dtype: torch.dtype) -> Optional[str]:
+    """
+    Check that a snapshot matches the configured models and dtype
+
+    Args:
+        manifest: Manifest from read_snapshot_manifest
+        base_model_id: Configured base SDXL model identifier
+        controlnet_id: Configured ControlNet model identifier
+        torch_dtype: Dtype the pipeline should run in on this host
+
+    Returns:
+        Description of the first mismatch, or None if the snapshot can be used
+    """
+    expected = {"baseModelId": base_model_id, "controlnetId": controlnet_id, "dtype": str(torch_dtype)}
+    for key, value in expected.items():
+        if manifest.get(key) != value:
+            return f"snapshot {key} is {manifest.get(key)}, expected {value}"
+    return None
+
+def save_pipeline_snapshot(pipeline, snapshot_dir: str, base_model_id: str, controlnet_id: str):
+    """
+    Write a fully built pipeline as safetensors in its current dtype
+
+    Args:
+        pipeline: Loaded SDXL ControlNet pipeline
+        snapshot_dir: Output directory
+        base_model_id: Base SDXL model identifier the pipeline was built from
+        controlnet_id: ControlNet model identifier the pipeline was built from
+    """
+    logger.info(f"Saving pipeline snapshot to {snapshot_dir}...")
+    pipeline.save_pretrained(snapshot_dir, safe_serialization=True)
+
+    # Written last: its presence marks the snapshot as complete
+    with open(os.path.join(snapshot_dir, SNAPSHOT_MANIFEST), "w") as f:
+        json.dump({
+            "baseModelId": base_model_id,
+            "controlnetId": controlnet_id,
+            "dtype": str(pipeline.unet.dtype),
+            "createdAt": time.time()
+        }, f, indent=2)
+
+    logger.info("Pipeline snapshot saved")
+
+def mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Map a safetensors file into tensors without reading it.
+
+    The whole file becomes one private memory mapping and every tensor is a
+    view into it, so pages are only read from disk when first touched and
+    no copy is made.
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data = torch.empty(0, dtype=torch.uint8).set_(storage)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        tensor = data[data_start + start:data_start + end].view(_SAFETENSORS_DTYPES[info["dtype"]])
+        tensors[name] = tensor.view(info["shape"])
+    return tensors
+
+def _load_module(library: str, cls, component_dir: str) -> torch.nn.Module:
+    """Build a model on the meta device and assign mmapped weights to it"""
+    from accelerate import init_empty_weights
+
+    if library == "diffusers":
+        with init_empty_weights():
+            module = cls.from_config(cls.load_config(component_dir))
+    else:
+        config = cls.config_class.from_pretrained(component_dir)
+        with init_empty_weights():
+            module = cls(config)
+
+    state_dict = {}
+    for path in sorted(glob.glob(os.path.join(component_dir, "*.safetensors"))):
+        state_dict.update(mmap_safetensors(path))
+    module.load_state_dict(state_dict, strict=False, assign=True)
+
+    missing = [name for name, param in module.named_parameters() if param.is_meta]
+    if missing:
+        raise ValueError(f"{len(missing)} parameters missing from snapshot, e.g. {missing[0]}")
+    return module.eval()
+
+def load_pipeline_snapshot(snapshot_dir: str, pipeline_class) -> Any:
+    """
+    Load a pipeline written by save_pipeline_snapshot, fully offline
+
+    Args:
+        snapshot_dir: Snapshot directory
+        pipeline_class: Pipeline class to assemble the components into
+
+    Returns:
+        Pipeline whose weights are lazily mapped from the snapshot files
+    """
+    with open(os.path.join(snapshot_dir, "model_index.json")) as f:
+        model_index = json.load(f)
+
+    init_parameters = inspect.signature(pipeline_class.__init__).parameters
+    components: Dict[str, Optional[Any]] = {}
+    for name, value in model_index.items():
+        if name.startswith("_"):
+            continue
+        if not isinstance(value, list):
+            # Plain pipeline options such as force_zeros_for_empty_prompt
+            if name in init_parameters:
+                components[name] = value
+            continue
+        library, class_name = value
+        if library is None or class_name is None:
+            components[name] = None
+            continue
+
+        cls = getattr(importlib.import_module(library), class_name)
+        component_dir = os.path.join(snapshot_dir, name)
+        if issubclass(cls, torch.nn.Module):
+            components[name] = _load_module(library, cls, component_dir)
+        else:
+            # Tokenizers and schedulers are small config files
+            components[name] = cls.from_pretrained(component_dir, local_files_only=True)
+
+    return pipeline_class(**components)
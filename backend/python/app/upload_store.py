@@ -0,0 +1,189 @@
+import os
+import re
+import mmap
+import hashlib
+import logging
+import time
+import threading
+from typing import Dict, Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from .utils import SUPPORTED_IMAGE_FORMATS
+
+logger = logging.getLogger(__name__)
+
+_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def get_default_upload_root() -> str:
+    """Get default upload root shared with the Node.js backend (backend/node/uploads)"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))  # backend/python/app
+    backend_dir = os.path.dirname(os.path.dirname(current_dir))  # backend
+    return os.getenv("UPLOAD_ROOT", os.path.join(backend_dir, "node", "uploads"))
+
+def decode_image_file(path: str) -> Image.Image:
+    """
+    Decode an image file through a read-only memory mapping
+
+    OpenCV decodes straight from the mapped pages, so the encoded bytes are
+    never copied into a Python buffer. Formats and orientation match uploads
+    decoded by PIL: the same whitelist applies and EXIF rotation is ignored.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Image file is empty")
+        try:
+            # Reads only the header
+            with Image.open(f) as probe:
+                image_format = probe.format
+        except UnidentifiedImageError:
+            image_format = None
+        if image_format not in SUPPORTED_IMAGE_FORMATS:
+            raise ValueError("Unsupported image format")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            image = cv2.imdecode(np.frombuffer(mapped, dtype=np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        raise ValueError("Unsupported image format")
+    return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+class UploadStore:
+    """
+    Read product images already stored by the Node.js backend.
+
+    Uploads are referenced either by a path relative to the upload root or
+    by the SHA-256 of their content. References never resolve outside the
+    root, including through symlinks.
+
+    Hash lookups index the root lazily. Unknown digests rescan it at most
+    once per refresh_interval, and each scan hashes at most max_hash_bytes
+    of new files, newest first; a scan that runs out of budget is resumed
+    by the next lookup.
+    """
+
+    def __init__(self, root: Optional[str] = None, refresh_interval: float = 1.0, max_hash_bytes: int = 256 << 20):
+        self.root = os.path.realpath(root or get_default_upload_root())
+        self.refresh_interval = refresh_interval
+        self.max_hash_bytes = max_hash_bytes
+        self._lock = threading.Lock()
+        # path -> (mtime_ns, size, sha256) of files hashed so far
+        self._hashed: Dict[str, Tuple[int, int, str]] = {}
+        self._by_hash: Dict[str, str] = {}
+        self._last_refresh: Optional[float] = None
+        self._index_complete = False
+
+    def resolve_path(self, ref: str) -> str:
+        """
+        Resolve a relative upload reference to an absolute path
+
+        Raises:
+            ValueError: If the reference points outside the upload root
+            FileNotFoundError: If no such upload exists
+        """
+        if not ref or os.path.isabs(ref) or "\0" in ref:
+            raise ValueError("Invalid image reference")
+        path = os.path.realpath(os.path.join(self.root, ref))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError("Invalid image reference")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No upload found for reference {ref}")
+        return path
+
+    def _hash_file(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _index(self, path: str, mtime_ns: int, size: int):
+        digest = self._hash_file(path)
+        self._hashed[path] = (mtime_ns, size, digest)
+        self._by_hash[digest] = path
+
+    def _refresh_index(self):
+        """Hash uploads that are new or changed since the last scan, within the hashing budget"""
+        seen = set()
+        pending = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            seen.add(entry.path)
+            cached = self._hashed.get(entry.path)
+            if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            if cached:
+                # Overwritten upload: its old content is gone
+                self._forget(entry.path)
+            pending.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        # Forget uploads the Node.js backend has cleaned up
+        for path in set(self._hashed) - seen:
+            self._forget(path)
+
+        # Lookups are mostly for recent uploads
+        pending.sort(reverse=True)
+        budget = self.max_hash_bytes
+        hashed = 0
+        for mtime_ns, size, path in pending:
+            # A file larger than the whole budget is still hashed on its own
+            if size > budget and hashed:
+                break
+            self._index(path, mtime_ns, size)
+            budget -= size
+            hashed += 1
+        self._index_complete = hashed == len(pending)
+        self._last_refresh = time.monotonic()
+
+    def _refresh_due(self) -> bool:
+        return (not self._index_complete
+                or self._last_refresh is None
+                or time.monotonic() - self._last_refresh >= self.refresh_interval)
+
+    def _forget(self, path: str):
+        digest = self._hashed.pop(path)[2]
+        if self._by_hash.get(digest) == path:
+            del self._by_hash[digest]
+
+    def _revalidate(self, path: str) -> bool:
+        """Rehash an indexed file whose size or mtime changed; True if it still has the digest it was found by"""
+        digest = self._hashed[path][2]
+        try:
+            stat = os.stat(path, follow_symlinks=False)
+        except OSError:
+            self._forget(path)
+            return False
+        if self._hashed[path][:2] != (stat.st_mtime_ns, stat.st_size):
+            self._forget(path)
+            self._index(path, stat.st_mtime_ns, stat.st_size)
+        return self._by_hash.get(digest) == path
+
+    def resolve_hash(self, sha256: str) -> str:
+        """
+        Find the upload with the given content hash
+
+        Raises:
+            ValueError: If the hash is not a hex SHA-256 digest
+            FileNotFoundError: If no upload has that content
+        """
+        sha256 = (sha256 or "").lower()
+        if not _SHA256_PATTERN.match(sha256):
+            raise ValueError("Invalid image hash, expected a hex SHA-256 digest")
+
+        with self._lock:
+            path = self._by_hash.get(sha256)
+            if path is not None and not self._revalidate(path):
+                path = None
+            if path is None and self._refresh_due():
+                self._refresh_index()
+                path = self._by_hash.get(sha256)
+        if path is None:
+            raise FileNotFoundError(f"No upload found with hash {sha256}")
+        return path
+
+    def load(self, ref: Optional[str] = None, sha256: Optional[str] = None) -> Image.Image:
+        """Decode the upload identified by a relative path or a content hash"""
+        path = self.resolve_path(ref) if ref else self.resolve_hash(sha256)
+        image = decode_image_file(path)
+        logger.info(f"Loaded product image by reference: {os.path.basename(path)} {image.size}")
+        return image
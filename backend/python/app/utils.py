@@ -1,6 +1,8 @@
 import os
 import io
+import re
 import uuid
+import threading
 import cv2
 import numpy as np
 from PIL import Image
@@ -9,6 +11,11 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+_REQUEST_ID_PATTERN = re.compile(r"^[0-9a-fA-F-]{36}$")
+
+# Product image formats accepted however the image arrives
+SUPPORTED_IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP', 'BMP')
+
 def create_output_directory(base_path: str, request_id: str) -> str:
     """Create output directory for generated images"""
     output_dir = os.path.join(base_path, request_id)
@@ -58,6 +65,18 @@ def generate_request_id() -> str:
     """Generate unique request ID"""
     return str(uuid.uuid4())
 
+def is_valid_request_id(request_id: str) -> bool:
+    """Check that a request ID is a UUID and safe to use as a directory name"""
+    return bool(_REQUEST_ID_PATTERN.match(request_id or ""))
+
+class GenerationCancelled(Exception):
+    """Raised inside generation when the caller no longer wants the result"""
+
+def raise_if_cancelled(cancel_event: Optional[threading.Event]):
+    """Abort the current generation if its cancel event has been set"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise GenerationCancelled("Generation cancelled")
+
 def get_device_info() -> Tuple[str, bool]:
     """Get device information for model loading"""
     try:
@@ -80,6 +99,6 @@ def validate_image_format(image_data: bytes) -> bool:
     try:
         image = Image.open(io.BytesIO(image_data))
         # Check if it's a valid image format
-        return image.format in ['JPEG', 'PNG', 'WEBP', 'BMP']
+        return image.format in SUPPORTED_IMAGE_FORMATS
     except Exception:
         return False
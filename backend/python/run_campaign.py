@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Generate a whole campaign offline from a JSONL manifest.
+
+Each manifest line is a JSON object such as:
+    {"id": "sku-123", "productImage": "images/sku-123.png", "trendProfile": {...},
+     "brandName": "Acme", "headline": "Move more", "numImages": 4, "seed": 42,
+     "exportPlatforms": ["instagram", "tiktok"]}
+
+Results are appended to <output>/results.jsonl; rerunning the same command
+after a crash skips entries that already completed.
+
+Usage:
+    python run_campaign.py campaign.jsonl --output campaign-run
+"""
+
+import json
+import logging
+import argparse
+
+from app.campaign import CampaignRunner
+from app.generator import SDXLGenerator
+
+logging.basicConfig(level=logging.INFO)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate ads for every entry of a campaign manifest")
+    parser.add_argument("manifest", help="JSONL manifest of product images and trend profiles")
+    parser.add_argument("--output", required=True, help="Directory for results.jsonl and checkpoint.json")
+    parser.add_argument("--images-dir", help="Where generated images are written (default: backend/node/outputs)")
+    parser.add_argument("--batch-size", type=int, default=4, help="Variations denoised together in one batch")
+    parser.add_argument("--prefetch", type=int, default=4, help="Entries decoded and prepared ahead of generation")
+    parser.add_argument("--limit", type=int, help="Stop after this many entries")
+    args = parser.parse_args()
+
+    generator = SDXLGenerator(output_base_path=args.images_dir)
+    if not generator.initialize():
+        raise SystemExit("Generator initialization failed")
+
+    runner = CampaignRunner(generator, args.output, batch_size=args.batch_size, prefetch=args.prefetch)
+    try:
+        progress = runner.run(args.manifest, limit=args.limit)
+    finally:
+        generator.cleanup()
+
+    print(json.dumps(progress, indent=2))
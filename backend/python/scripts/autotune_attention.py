@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Measure the fastest attention implementation and thread count for this machine.
+
+Loads the pipeline exactly as the service does (same backend, device,
+dtype and snapshot), times denoising trials at AUTOTUNE_RESOLUTIONS and
+caches the winner under the machine fingerprint. With AUTOTUNE_ATTENTION=1
+the service applies the cached result at load time, or runs the trials in
+the background after loading when there is none.
+
+Trials take minutes on CPU; run this once per machine type to tune before
+traffic arrives.
+
+Usage (from backend/python):
+    python -m scripts.autotune_attention
+"""
+
+import json
+import logging
+import argparse
+from typing import List, Optional
+
+from app.autotune import AttentionAutotuner
+from app.generator import SDXLGenerator
+
+logger = logging.getLogger(__name__)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Autotune attention and thread count for the SDXL ControlNet pipeline")
+    parser.add_argument("--base-model", default="stabilityai/stable-diffusion-xl-base-1.0", help="Base SDXL model identifier")
+    args = parser.parse_args(argv)
+
+    generator = SDXLGenerator(base_model_id=args.base_model, backend="torch")
+    # Load without applying earlier results so the trials start from the static settings
+    processor = generator.backend.processor
+    processor.autotune = False
+    if not generator.initialize():
+        raise SystemExit("Could not load the ControlNet pipeline")
+
+    if not processor.autotune_attention():
+        raise SystemExit("Autotuning failed")
+    result = AttentionAutotuner(processor.pipeline, processor.device, processor.torch_dtype).cached()
+    print(json.dumps(result, indent=2))
+    generator.cleanup()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark UNet feature caching against the full UNet.
+
+Generates the same prompts and seeds with and without the feature cache
+and reports the speedup and the image drift (mean absolute pixel error
+and PSNR) of the cached results.
+
+Usage (from backend/python):
+    python -m scripts.benchmark_feature_cache --image product.png --intervals 2 3 5 --depths 1 2
+"""
+
+import argparse
+import logging
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.controlnet import ControlNetProcessor
+from app.utils import get_device_info
+
+logger = logging.getLogger(__name__)
+
+PROMPTS = [
+    "High-converting Instagram advertisement, minimal product showcase, studio lighting",
+    "Professional advertisement photography, bold and dynamic, vibrant colors",
+]
+
+def _image_drift(reference: Image.Image, candidate: Image.Image) -> Tuple[float, float]:
+    """Return (mean absolute error in 0-255 units, PSNR in dB)"""
+    ref = np.asarray(reference, dtype=np.float32)
+    cand = np.asarray(candidate, dtype=np.float32)
+    mae = float(np.abs(ref - cand).mean())
+    mse = float(((ref - cand) ** 2).mean())
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    return mae, psnr
+
+def _run(processor: ControlNetProcessor, control_image: Image.Image, steps: int, seed: int) -> Tuple[float, List[Image.Image]]:
+    """Generate all benchmark prompts, returning (seconds, images)"""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    images = []
+    for i, prompt in enumerate(PROMPTS):
+        image = processor.generate_with_controlnet(
+            prompt=prompt,
+            control_image=control_image,
+            num_inference_steps=steps,
+            seed=seed + i
+        )
+        if image is None:
+            raise RuntimeError("Generation failed during benchmark")
+        images.append(image)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return time.perf_counter() - start, images
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark UNet feature caching")
+    parser.add_argument("--image", required=True, help="Product image used for ControlNet conditioning")
+    parser.add_argument("--steps", type=int, default=30, help="Denoising steps per image")
+    parser.add_argument("--seed", type=int, default=1234, help="Base seed")
+    parser.add_argument("--intervals", type=int, nargs="+", default=[2, 3, 5], help="Full-UNet intervals to try")
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 2], help="Recomputed shallow levels to try")
+    args = parser.parse_args(argv)
+
+    device, has_cuda = get_device_info()
+    processor = ControlNetProcessor(device=device, torch_dtype=torch.float16 if has_cuda else torch.float32)
+    if not processor.load_controlnet() or not processor.create_pipeline():
+        raise SystemExit("Could not load the ControlNet pipeline")
+
+    control_image = processor.prepare_control_image(Image.open(args.image))
+
+    # Warm-up so the first timed run does not pay for kernel selection
+    processor.generate_with_controlnet(PROMPTS[0], control_image, num_inference_steps=2, seed=args.seed)
+
+    baseline_time, baseline_images = _run(processor, control_image, args.steps, args.seed)
+    print(f"{'config':<22}{'seconds':>10}{'speedup':>10}{'MAE':>8}{'PSNR':>8}")
+    print(f"{'full UNet':<22}{baseline_time:>10.2f}{1.0:>10.2f}{0.0:>8.2f}{'inf':>8}")
+
+    for depth in args.depths:
+        for interval in args.intervals:
+            if not processor.enable_feature_cache(interval=interval, depth=depth):
+                continue
+            elapsed, images = _run(processor, control_image, args.steps, args.seed)
+            drift = [_image_drift(ref, img) for ref, img in zip(baseline_images, images)]
+            mae = sum(d[0] for d in drift) / len(drift)
+            psnr = sum(d[1] for d in drift) / len(drift)
+            label = f"interval={interval} depth={depth}"
+            print(f"{label:<22}{elapsed:>10.2f}{baseline_time / elapsed:>10.2f}{mae:>8.2f}{psnr:>8.2f}")
+
+    processor.cleanup()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Export the SDXL ControlNet pipeline to ONNX graphs for the ONNX Runtime backend.
+
+Writes text_encoder, text_encoder_2, controlnet, unet and vae_decoder graphs
+(each as <name>/model.onnx, with external weight data where needed) plus the
+tokenizers, scheduler config and onnx_config.json consumed by
+app.backends.onnx_backend.OnnxBackend.
+
+Usage (from backend/python):
+    python -m scripts.export_onnx --output models/onnx
+    INFERENCE_BACKEND=onnx python run.py
+"""
+
+import os
+import json
+import logging
+import argparse
+from typing import List, Optional
+
+import torch
+
+from app.controlnet import ControlNetProcessor
+from app.backends.onnx_backend import ONNX_CONFIG_FILE, get_default_onnx_dir
+
+logger = logging.getLogger(__name__)
+
+OPSET = 17
+
+class TextEncoderGraph(torch.nn.Module):
+    """CLIP text encoder returning the penultimate hidden states used by SDXL"""
+
+    def __init__(self, encoder):
+        super().__init__()
+        self.encoder = encoder
+
+    def forward(self, input_ids):
+        return self.encoder(input_ids, output_hidden_states=True).hidden_states[-2]
+
+class TextEncoder2Graph(torch.nn.Module):
+    """Second SDXL text encoder returning pooled and penultimate hidden states"""
+
+    def __init__(self, encoder):
+        super().__init__()
+        self.encoder = encoder
+
+    def forward(self, input_ids):
+        output = self.encoder(input_ids, output_hidden_states=True)
+        return output.text_embeds, output.hidden_states[-2]
+
+class ControlNetGraph(torch.nn.Module):
+    """ControlNet returning its down block residuals followed by the mid residual"""
+
+    def __init__(self, controlnet):
+        super().__init__()
+        self.controlnet = controlnet
+
+    def forward(self, sample, timestep, encoder_hidden_states, controlnet_cond, text_embeds, time_ids, conditioning_scale):
+        down_residuals, mid_residual = self.controlnet(
+            sample,
+            timestep,
+            encoder_hidden_states=encoder_hidden_states,
+            controlnet_cond=controlnet_cond,
+            conditioning_scale=conditioning_scale,
+            added_cond_kwargs={"text_embeds": text_embeds, "time_ids": time_ids},
+            return_dict=False
+        )
+        return (*down_residuals, mid_residual)
+
+class UNetGraph(torch.nn.Module):
+    """SDXL UNet taking the ControlNet residuals as flat inputs"""
+
+    def __init__(self, unet):
+        super().__init__()
+        self.unet = unet
+
+    def forward(self, sample, timestep, encoder_hidden_states, text_embeds, time_ids, *residuals):
+        return self.unet(
+            sample,
+            timestep,
+            encoder_hidden_states=encoder_hidden_states,
+            added_cond_kwargs={"text_embeds": text_embeds, "time_ids": time_ids},
+            down_block_additional_residuals=list(residuals[:-1]),
+            mid_block_additional_residual=residuals[-1],
+            return_dict=False
+        )[0]
+
+class VaeDecoderGraph(torch.nn.Module):
+    """VAE decoder from scaled latents to images in [-1, 1]"""
+
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, latent):
+        return self.vae.decode(latent / self.vae.config.scaling_factor, return_dict=False)[0]
+
+def _export(module: torch.nn.Module, args: tuple, output_dir: str, name: str,
+            input_names: List[str], output_names: List[str], dynamic_axes: dict):
+    path = os.path.join(output_dir, name, "model.onnx")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    logger.info(f"Exporting {name} -> {path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            module,
+            args,
+            path,
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET,
+            do_constant_folding=True,
+            dynamo=False
+        )
+
+def export_pipeline(output_dir: str, base_model_id: str, height: int = 1024, width: int = 1024, fp16: bool = False):
+    """Export all graphs of the SDXL ControlNet pipeline to output_dir"""
+    device = "cuda" if fp16 else "cpu"
+    dtype = torch.float16 if fp16 else torch.float32
+
+    processor = ControlNetProcessor(device=device, torch_dtype=dtype, autotune=False)
+    if not processor.load_controlnet() or not processor.create_pipeline(base_model_id):
+        raise RuntimeError("Could not load the ControlNet pipeline")
+    pipeline = processor.pipeline
+    # Plain attention processors export cleanly; xformers kernels do not
+    pipeline.unet.set_default_attn_processor()
+    pipeline.controlnet.set_default_attn_processor()
+
+    os.makedirs(output_dir, exist_ok=True)
+    batch = {0: "batch"}
+    spatial = {0: "batch", 2: "height", 3: "width"}
+    seq_len = pipeline.text_encoder.config.max_position_embeddings
+
+    input_ids = torch.zeros((1, seq_len), dtype=torch.int64, device=device)
+    _export(TextEncoderGraph(pipeline.text_encoder), (input_ids,), output_dir, "text_encoder",
+            ["input_ids"], ["hidden_states"], {"input_ids": batch, "hidden_states": batch})
+    _export(TextEncoder2Graph(pipeline.text_encoder_2), (input_ids,), output_dir, "text_encoder_2",
+            ["input_ids"], ["text_embeds", "hidden_states"],
+            {"input_ids": batch, "text_embeds": batch, "hidden_states": batch})
+
+    # Classifier-free guidance doubles the batch
+    sample = torch.randn((2, 4, height // 8, width // 8), dtype=dtype, device=device)
+    timestep = torch.tensor([999.0], dtype=dtype, device=device)
+    hidden_dim = pipeline.text_encoder.config.hidden_size + pipeline.text_encoder_2.config.hidden_size
+    encoder_hidden_states = torch.randn((2, seq_len, hidden_dim), dtype=dtype, device=device)
+    text_embeds = torch.randn((2, pipeline.text_encoder_2.config.projection_dim), dtype=dtype, device=device)
+    time_ids = torch.tensor([[height, width, 0, 0, height, width]] * 2, dtype=dtype, device=device)
+    controlnet_cond = torch.rand((2, 3, height, width), dtype=dtype, device=device)
+    scale = torch.tensor(1.0, dtype=dtype, device=device)
+
+    controlnet_graph = ControlNetGraph(pipeline.controlnet)
+    with torch.no_grad():
+        residuals = controlnet_graph(sample, timestep, encoder_hidden_states, controlnet_cond, text_embeds, time_ids, scale)
+    residual_names = [f"down_{i}" for i in range(len(residuals) - 1)] + ["mid"]
+    common_inputs = ["sample", "timestep", "encoder_hidden_states", "text_embeds", "time_ids"]
+    common_axes = {"sample": spatial, "encoder_hidden_states": batch, "text_embeds": batch, "time_ids": batch}
+
+    _export(controlnet_graph,
+            (sample, timestep, encoder_hidden_states, controlnet_cond, text_embeds, time_ids, scale),
+            output_dir, "controlnet",
+            ["sample", "timestep", "encoder_hidden_states", "controlnet_cond", "text_embeds", "time_ids", "conditioning_scale"],
+            residual_names,
+            {**common_axes, "controlnet_cond": spatial, **{name: spatial for name in residual_names}})
+
+    _export(UNetGraph(pipeline.unet),
+            (sample, timestep, encoder_hidden_states, text_embeds, time_ids, *residuals),
+            output_dir, "unet",
+            common_inputs + residual_names,
+            ["noise_pred"],
+            {**common_axes, **{name: spatial for name in residual_names}, "noise_pred": spatial})
+
+    # SDXL's VAE overflows to NaN in float16 (diffusers upcasts it, see
+    # vae.config.force_upcast), so the decoder is exported in float32
+    _export(VaeDecoderGraph(pipeline.vae.to(torch.float32)), (sample[:1].float(),), output_dir, "vae_decoder",
+            ["latent"], ["image"], {"latent": spatial, "image": spatial})
+
+    pipeline.tokenizer.save_pretrained(os.path.join(output_dir, "tokenizer"))
+    pipeline.tokenizer_2.save_pretrained(os.path.join(output_dir, "tokenizer_2"))
+    pipeline.scheduler.save_pretrained(os.path.join(output_dir, "scheduler"))
+
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w") as f:
+        json.dump({
+            "baseModelId": base_model_id,
+            "dtype": "float16" if fp16 else "float32",
+            "vaeDtype": "float32",
+            "seqLen": seq_len,
+            "controlnetResiduals": len(residual_names) - 1,
+            "opset": OPSET
+        }, f, indent=2)
+
+    processor.cleanup()
+    logger.info(f"ONNX export completed: {output_dir}")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export the SDXL ControlNet pipeline to ONNX")
+    parser.add_argument("--output", default=get_default_onnx_dir(), help="Output directory (default: ONNX_MODEL_DIR)")
+    parser.add_argument("--base-model", default="stabilityai/stable-diffusion-xl-base-1.0", help="Base SDXL model identifier")
+    parser.add_argument("--height", type=int, default=1024, help="Sample height used for tracing")
+    parser.add_argument("--width", type=int, default=1024, help="Sample width used for tracing")
+    parser.add_argument("--fp16", action="store_true", help="Export float16 graphs except the VAE decoder (requires CUDA)")
+    args = parser.parse_args(argv)
+
+    export_pipeline(args.output, args.base_model, height=args.height, width=args.width, fp16=args.fp16)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Concurrency load test for the /generate endpoint.
+
+By default the FastAPI app is served in-process with a generator on the
+fake inference backend, which sleeps for a configurable time per image
+instead of running diffusion, so queueing and concurrency behaviour can be
+measured without models or a GPU. The server runs on its own thread and event loop, where
+event-loop lag is sampled while the load runs.
+
+Usage (from backend/python):
+    python -m scripts.load_test --requests 40 --concurrency 8 --latency 0.5
+    python -m scripts.load_test --url http://localhost:8000 --requests 10 --concurrency 2
+"""
+
+import io
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from PIL import Image
+
+from app import routes
+from app.backends.fake_backend import FakeBackend
+from app.generator import SDXLGenerator
+from app.scheduler import GenerationScheduler
+
+logger = logging.getLogger(__name__)
+
+TREND_PROFILE = {
+    "industry": "fitness",
+    "platform": "instagram",
+    "topColors": ["blue", "white"],
+    "dominantLayouts": ["image-centric"],
+    "creativeTypes": ["product-only"],
+    "topKeywords": ["energy", "workout", "performance"]
+}
+
+def create_stub_generator(latency: float = 0.5, jitter: float = 0.0) -> SDXLGenerator:
+    """SDXLGenerator on the fake backend with configurable per-image latency"""
+    backend = FakeBackend(latency=latency, jitter=jitter)
+    generator = SDXLGenerator(
+        output_base_path=tempfile.mkdtemp(prefix="adgen-loadtest-"),
+        backend=backend
+    )
+    generator.initialize()
+    return generator
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def _make_image_bytes(size: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), (220, 60, 60)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+class LoopLagMonitor:
+    """Sample how late an event loop wakes up from short sleeps"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._running = True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self._running:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def stop(self):
+        self._running = False
+
+class InProcessServer:
+    """Serve the FastAPI app with a stub generator on a background thread"""
+
+    def __init__(self, port: int, latency: float, jitter: float):
+        routes._generator = create_stub_generator(latency=latency, jitter=jitter)
+        # Keep fake-backend timings out of the real latency history
+        os.environ["LATENCY_HISTORY"] = os.path.join(tempfile.mkdtemp(prefix="adgen-loadtest-"), "latency_history.json")
+        routes._scheduler = GenerationScheduler.from_env()
+
+        config = uvicorn.Config("app.main:app", host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.lag_monitor = LoopLagMonitor()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.create_task(self.lag_monitor.run())
+        loop.run_until_complete(self.server.serve())
+
+    def start(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def stop(self):
+        self.lag_monitor.stop()
+        self.server.should_exit = True
+        self._thread.join(timeout=10)
+
+async def _send(client: httpx.AsyncClient, url: str, image_bytes: bytes, form: Dict[str, str]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        response = await client.post(
+            f"{url}/generate",
+            data=form,
+            files={"product_image": ("product.png", image_bytes, "image/png")}
+        )
+        status = response.status_code
+    except httpx.HTTPError as e:
+        logger.warning(f"Request failed: {e}")
+        status = 0
+    return {"status": status, "latency": time.perf_counter() - start}
+
+async def run_load(url: str, num_requests: int, concurrency: int, image_bytes: bytes, form: Dict[str, str]) -> Dict[str, Any]:
+    """Send num_requests uploads to /generate with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = httpx.Timeout(600.0)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def bounded():
+            async with semaphore:
+                return await _send(client, url, image_bytes, form)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded() for _ in range(num_requests)))
+        elapsed = time.perf_counter() - start
+
+    ok = [r["latency"] for r in results if r["status"] == 200]
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+
+    return {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "elapsedSeconds": elapsed,
+        "throughputRps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "statuses": statuses,
+        "latency": {
+            "p50": _percentile(ok, 50),
+            "p95": _percentile(ok, 95),
+            "p99": _percentile(ok, 99),
+            "max": max(ok) if ok else 0.0
+        }
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test the /generate endpoint")
+    parser.add_argument("--url", help="Target an already running server instead of the in-process stub")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the in-process stub server")
+    parser.add_argument("--requests", type=int, default=20, help="Total number of requests")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub latency per image in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter on stub latency")
+    parser.add_argument("--num-images", type=int, default=3, help="num_images form field")
+    parser.add_argument("--image-size", type=int, default=1024, help="Side of the uploaded test image")
+    parser.add_argument("--image", help="Upload this image instead of a generated one")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = _make_image_bytes(args.image_size)
+
+    form = {
+        "industry": TREND_PROFILE["industry"],
+        "platform": TREND_PROFILE["platform"],
+        "trend_profile": json.dumps(TREND_PROFILE),
+        "num_images": str(args.num_images)
+    }
+
+    server = None
+    url = args.url
+    if not url:
+        server = InProcessServer(args.port, args.latency, args.jitter)
+        server.start()
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        report = asyncio.run(run_load(url, args.requests, args.concurrency, image_bytes, form))
+    finally:
+        if server:
+            server.stop()
+
+    if server:
+        lag = server.lag_monitor.samples
+        report["eventLoopLag"] = {
+            "p50": _percentile(lag, 50),
+            "p99": _percentile(lag, 99),
+            "max": max(lag) if lag else 0.0
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Requests: {report['requests']} (concurrency {report['concurrency']}), statuses: {report['statuses']}")
+    print(f"Elapsed: {report['elapsedSeconds']:.2f}s, throughput: {report['throughputRps']:.2f} req/s")
+    latency = report["latency"]
+    print(f"Latency p50/p95/p99/max: {latency['p50']:.2f}/{latency['p95']:.2f}/{latency['p99']:.2f}/{latency['max']:.2f}s")
+    if "eventLoopLag" in report:
+        lag = report["eventLoopLag"]
+        print(f"Event-loop lag p50/p99/max: {lag['p50'] * 1000:.1f}/{lag['p99'] * 1000:.1f}/{lag['max'] * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
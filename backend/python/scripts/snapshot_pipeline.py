@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Write the SDXL ControlNet pipeline as a local, memory-mappable snapshot.
+
+The pipeline is built once from the model hub (or its local cache) and
+saved as safetensors in the target dtype. On later starts the PyTorch
+backend maps the snapshot lazily instead of resolving hub ids, parsing
+and converting weights.
+
+Usage (from backend/python):
+    python -m scripts.snapshot_pipeline --output models/snapshot
+    python -m scripts.snapshot_pipeline --fp16   # dtype used on CUDA hosts
+"""
+
+import logging
+import argparse
+from typing import List, Optional
+
+import torch
+
+from app.controlnet import ControlNetProcessor, CONTROLNET_MODEL_ID
+from app.snapshot import get_default_snapshot_dir, save_pipeline_snapshot
+from app.utils import get_device_info
+
+logger = logging.getLogger(__name__)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Snapshot the SDXL ControlNet pipeline for fast loading")
+    parser.add_argument("--output", default=get_default_snapshot_dir(), help="Output directory (default: MODEL_SNAPSHOT_DIR)")
+    parser.add_argument("--base-model", default="stabilityai/stable-diffusion-xl-base-1.0", help="Base SDXL model identifier")
+    dtype_group = parser.add_mutually_exclusive_group()
+    dtype_group.add_argument("--fp16", action="store_true", help="Store float16 weights")
+    dtype_group.add_argument("--fp32", action="store_true", help="Store float32 weights")
+    args = parser.parse_args(argv)
+
+    # Default to the dtype SDXLGenerator would pick on this machine
+    _, has_cuda = get_device_info()
+    if args.fp16 or (has_cuda and not args.fp32):
+        torch_dtype = torch.float16
+    else:
+        torch_dtype = torch.float32
+
+    # Build on CPU: the snapshot only needs the weights, not a warmed-up device
+    processor = ControlNetProcessor(device="cpu", torch_dtype=torch_dtype, autotune=False)
+    if not processor.load_controlnet() or not processor.create_pipeline(args.base_model):
+        raise SystemExit("Could not load the ControlNet pipeline")
+
+    save_pipeline_snapshot(processor.pipeline, args.output, args.base_model, CONTROLNET_MODEL_ID)
+    processor.cleanup()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
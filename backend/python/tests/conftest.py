@@ -0,0 +1,63 @@
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import routes
+from app.backends.fake_backend import FakeBackend
+from app.generator import SDXLGenerator
+from app.latency_model import LatencyModel
+from app.main import app
+from app.scheduler import GenerationScheduler
+
+TREND_PROFILE = {
+    "industry": "fitness",
+    "platform": "instagram",
+    "topColors": ["blue", "white"],
+    "dominantLayouts": ["image-centric"],
+    "creativeTypes": ["product-only"],
+    "topKeywords": ["energy", "workout"]
+}
+
+
+def make_png(size: int = 64, color=(220, 60, 60)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def generate_form(**overrides):
+    form = {
+        "industry": "fitness",
+        "platform": "instagram",
+        "trend_profile": json.dumps(TREND_PROFILE),
+        "brand_name": "Acme",
+        "num_images": "3",
+        "num_inference_steps": "10",
+        "base_seed": "1"
+    }
+    form.update(overrides)
+    return form
+
+
+@pytest.fixture
+def stub_generator(tmp_path):
+    generator = SDXLGenerator(output_base_path=str(tmp_path / "outputs"), backend=FakeBackend())
+    generator.initialize()
+    return generator
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return GenerationScheduler(max_queue=4, latency_model=LatencyModel(str(tmp_path / "latency.json")))
+
+
+@pytest.fixture
+def client(monkeypatch, stub_generator, scheduler):
+    """Test client of the app with a fake-backend generator and a private scheduler"""
+    monkeypatch.setattr(routes, "_generator", stub_generator)
+    monkeypatch.setattr(routes, "_scheduler", scheduler)
+    with TestClient(app) as test_client:
+        yield test_client
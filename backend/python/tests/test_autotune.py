@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import controlnet
+from app.autotune import parse_resolutions
+from app.controlnet import ControlNetProcessor
+
+
+class RecordingPipeline:
+    def __init__(self):
+        self.calls = []
+
+    def enable_xformers_memory_efficient_attention(self):
+        self.calls.append("xformers")
+
+    def enable_attention_slicing(self):
+        self.calls.append("slicing")
+
+    def to(self, device):
+        return self
+
+
+def test_parse_resolutions():
+    assert parse_resolutions("1024x1024, 832X1216") == [(1024, 1024), (832, 1216)]
+
+
+def test_autotune_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("AUTOTUNE_ATTENTION", raising=False)
+    assert not ControlNetProcessor(device="cpu").autotune
+
+
+@pytest.mark.parametrize("method", ["apply_tuned_attention", "autotune_attention"])
+def test_failed_tuning_restores_xformers_and_slicing(monkeypatch, method):
+    class FailingAutotuner:
+        def __init__(self, *args):
+            pass
+
+        def cached(self):
+            raise RuntimeError("boom")
+
+        run = cached
+
+    monkeypatch.setattr(controlnet, "AttentionAutotuner", FailingAutotuner)
+    monkeypatch.setattr(controlnet, "apply_attention", lambda pipeline, attention: pipeline.calls.append(attention))
+    processor = ControlNetProcessor(device="cuda", autotune=True)
+    processor.pipeline = RecordingPipeline()
+
+    assert getattr(processor, method)() is False
+    assert processor.pipeline.calls == ["sdpa", "xformers", "slicing"]
+
+
+class TuningAutotuner:
+    """Autotuner without cached results that records what the UNet looked like during trials"""
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.trials = []
+
+    def __call__(self, *args):
+        return self
+
+    def cached(self):
+        return None
+
+    def run(self):
+        self.trials.append({"featureCache": self.processor.feature_cache.calls[-1:]})
+        return {"attention": "sdpa", "numThreads": 1}
+
+    def apply(self, result):
+        self.processor.pipeline.calls.append(f"tuned:{result['attention']}")
+
+
+def test_loading_without_cached_results_tunes_in_the_background(monkeypatch):
+    processor = ControlNetProcessor(device="cuda", autotune=True)
+    processor.pipeline = RecordingPipeline()
+    processor.feature_cache = SimpleNamespace(calls=[])
+    processor.feature_cache.disable = lambda: processor.feature_cache.calls.append("disable")
+    processor.feature_cache.enable = lambda: processor.feature_cache.calls.append("enable")
+    autotuner = TuningAutotuner(processor)
+    monkeypatch.setattr(controlnet, "AttentionAutotuner", autotuner)
+
+    processor._configure_pipeline()
+    processor._autotune_thread.join(5)
+
+    # Static settings serve until the trials finish
+    assert processor.pipeline.calls == ["xformers", "slicing", "tuned:sdpa"]
+    # Trials time the full UNet, then the feature cache is restored
+    assert autotuner.trials == [{"featureCache": ["disable"]}]
+    assert processor.feature_cache.calls == ["disable", "enable"]
+
+
+def test_cached_results_are_applied_without_trials(monkeypatch):
+    processor = ControlNetProcessor(device="cuda", autotune=True)
+    processor.pipeline = RecordingPipeline()
+    autotuner = TuningAutotuner(processor)
+    autotuner.cached = lambda: {"attention": "default", "numThreads": 2}
+    monkeypatch.setattr(controlnet, "AttentionAutotuner", autotuner)
+
+    processor._configure_pipeline()
+    assert processor._autotune_thread is None
+    assert processor.pipeline.calls == ["tuned:default"]
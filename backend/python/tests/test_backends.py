@@ -0,0 +1,52 @@
+import json
+
+import pytest
+import torch
+from diffusers.utils.torch_utils import randn_tensor
+
+from app.backends import create_backend
+from app.backends.onnx_backend import OnnxBackend
+from app.generator import SDXLGenerator
+
+
+def test_refine_support_is_declared():
+    assert create_backend("fake").supports_refine
+    assert not OnnxBackend().supports_refine
+
+
+def test_refine_on_unsupported_backend_raises_before_touching_results(tmp_path):
+    generator = SDXLGenerator(output_base_path=str(tmp_path), backend=OnnxBackend())
+    with pytest.raises(NotImplementedError):
+        generator.refine_ad("20240101_000000_deadbeef", 1)
+
+
+def test_onnx_latents_match_diffusers_cpu_noise():
+    latents = OnnxBackend()._initial_latents(42, 64, 64)
+    expected = randn_tensor((1, 4, 8, 8), generator=torch.Generator("cpu").manual_seed(42), dtype=torch.float32)
+    assert torch.equal(latents, expected)
+
+
+def test_onnx_tokens_are_padded_to_the_exported_sequence_length(tmp_path):
+    from transformers import CLIPTokenizer
+
+    (tmp_path / "vocab.json").write_text(json.dumps({"<|startoftext|>": 0, "<|endoftext|>": 1, "a</w>": 2}))
+    (tmp_path / "merges.txt").write_text("#version: 0.2\n")
+    # Some checkpoints leave model_max_length at a huge placeholder
+    tokenizer = CLIPTokenizer(str(tmp_path / "vocab.json"), str(tmp_path / "merges.txt"), model_max_length=10 ** 30)
+
+    backend = OnnxBackend()
+    backend.config = {"seqLen": 8}
+    assert backend._tokenize(tokenizer, "a").shape == (1, 8)
+    assert backend._tokenize(tokenizer, " ".join(["a"] * 20)).shape == (1, 8)
+
+
+def test_onnx_generations_do_not_share_scheduler_state():
+    from diffusers import EulerDiscreteScheduler
+
+    backend = OnnxBackend()
+    backend.scheduler = EulerDiscreteScheduler()
+    first, second = backend._new_scheduler(), backend._new_scheduler()
+    first.set_timesteps(10)
+    second.set_timesteps(30)
+    assert first is not backend.scheduler and len(first.timesteps) == 10
+    assert len(second.timesteps) == 30
@@ -0,0 +1,122 @@
+import json
+
+import torch
+from PIL import Image
+
+from app.backends.fake_backend import FakeBackend
+from app.campaign import MANIFEST_ERROR, CampaignRunner, iter_manifest, load_completed_ids
+from app.generator import SDXLGenerator
+from tests.conftest import TREND_PROFILE, make_png
+
+
+def _write_manifest(path, lines):
+    path.write_text("\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n")
+    return str(path)
+
+
+def test_iter_manifest_reports_bad_lines_instead_of_raising(tmp_path):
+    manifest = _write_manifest(tmp_path / "campaign.jsonl", [
+        {"id": "ok", "productImage": "a.png", "trendProfile": TREND_PROFILE},
+        "{not json",
+        {"id": "no-image", "trendProfile": TREND_PROFILE},
+        "",
+        {"productImage": "b.png", "trendProfile": TREND_PROFILE},
+    ])
+    entries = list(iter_manifest(manifest))
+
+    assert [entry["id"] for entry in entries] == ["ok", "line-2", "no-image", "line-5"]
+    assert entries[0]["productImage"] == str(tmp_path / "a.png")
+    assert MANIFEST_ERROR in entries[1] and MANIFEST_ERROR in entries[2]
+    assert MANIFEST_ERROR not in entries[3]
+
+
+def test_load_completed_ids_ignores_failures_and_partial_lines(tmp_path):
+    results = tmp_path / "results.jsonl"
+    results.write_text(
+        json.dumps({"id": "a", "status": "ok"}) + "\n"
+        + json.dumps({"id": "b", "status": "failed"}) + "\n"
+        + '{"id": "c", "sta'
+    )
+    assert load_completed_ids(str(results)) == {"a"}
+    assert load_completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_campaign_records_bad_entries_and_resumes(tmp_path, stub_generator):
+    (tmp_path / "p.png").write_bytes(make_png())
+    manifest = _write_manifest(tmp_path / "campaign.jsonl", [
+        {"id": "first", "productImage": "p.png", "trendProfile": TREND_PROFILE, "numImages": 3, "seed": 1},
+        "{not json",
+        {"id": "second", "productImage": "p.png", "trendProfile": TREND_PROFILE, "numImages": 3, "seed": 2},
+    ])
+    output = tmp_path / "run"
+
+    progress = CampaignRunner(stub_generator, str(output), batch_size=2).run(manifest, limit=2)
+    assert progress["completed"] == 1 and progress["failed"] == 1
+
+    progress = CampaignRunner(stub_generator, str(output), batch_size=2).run(manifest)
+    # "first" is skipped; the bad line is retried (and fails again) along with "second"
+    assert progress["processed"] == 2
+    records = [json.loads(line) for line in (output / "results.jsonl").read_text().splitlines()]
+    assert [(r["id"], r["status"]) for r in records] == [
+        ("first", "ok"), ("line-2", "failed"), ("line-2", "failed"), ("second", "ok")
+    ]
+
+
+class OomOnLargeBatches(FakeBackend):
+    def __init__(self, max_batch):
+        super().__init__()
+        self.max_batch = max_batch
+        self.batch_sizes = []
+
+    def generate_batch(self, prompts, *args, **kwargs):
+        self.batch_sizes.append(len(prompts))
+        if len(prompts) > self.max_batch:
+            raise torch.cuda.OutOfMemoryError("CUDA out of memory")
+        return super().generate_batch(prompts, *args, **kwargs)
+
+
+def test_generation_halves_the_batch_size_on_oom(tmp_path):
+    backend = OomOnLargeBatches(max_batch=2)
+    generator = SDXLGenerator(output_base_path=str(tmp_path), backend=backend)
+    generator.initialize()
+    control = generator.backend.prepare_control_image(Image.new("RGB", (64, 64)))
+
+    result = generator.generate_ads(
+        product_image=None, trend_profile=TREND_PROFILE, num_images=5, num_inference_steps=10,
+        control_image=control, batch_size=4, base_seed=0
+    )
+    assert result["numGenerated"] == 5
+    assert result["batchSize"] == 2
+    assert backend.batch_sizes == [4, 2, 2]
+
+
+def test_iter_manifest_validates_export_platforms(tmp_path):
+    manifest = _write_manifest(tmp_path / "campaign.jsonl", [
+        {"id": "list", "productImage": "a.png", "trendProfile": TREND_PROFILE, "exportPlatforms": ["tiktok", "Instagram"]},
+        {"id": "string", "productImage": "a.png", "trendProfile": TREND_PROFILE, "exportPlatforms": "tiktok"},
+        {"id": "unknown", "productImage": "a.png", "trendProfile": TREND_PROFILE, "exportPlatforms": ["myspace"]},
+        {"id": "number", "productImage": "a.png", "trendProfile": TREND_PROFILE, "exportPlatforms": 3},
+    ])
+    entries = {entry["id"]: entry for entry in iter_manifest(manifest)}
+
+    assert entries["list"]["exportPlatforms"] == ["tiktok", "instagram"]
+    assert entries["string"]["exportPlatforms"] == ["tiktok"]
+    assert "myspace" in entries["unknown"][MANIFEST_ERROR]
+    assert MANIFEST_ERROR in entries["number"]
+
+
+def test_campaign_builds_prompts_in_batches(tmp_path, stub_generator, monkeypatch):
+    (tmp_path / "p.png").write_bytes(make_png())
+    manifest = _write_manifest(tmp_path / "campaign.jsonl", [
+        {"id": str(i), "productImage": "p.png", "trendProfile": dict(TREND_PROFILE, topColors=[f"#0{i}57e7"]), "numImages": 3}
+        for i in range(3)
+    ])
+    builder = stub_generator.prompt_builder
+    batches = []
+    build_prompts = builder.build_prompts
+    monkeypatch.setattr(builder, "build_prompts", lambda profiles, **kwargs: batches.append(len(profiles)) or build_prompts(profiles, **kwargs))
+
+    CampaignRunner(stub_generator, str(tmp_path / "run")).run(manifest)
+    assert batches == [3]
+    # generate_ads() found every prompt already built
+    assert builder._build_cached.cache_info().misses == 3
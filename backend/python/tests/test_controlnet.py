@@ -0,0 +1,50 @@
+import time
+import threading
+from types import SimpleNamespace
+from PIL import Image
+
+from app.controlnet import ControlNetProcessor
+
+
+class RecordingPipeline:
+    """Stand-in pipeline that records how many calls overlap"""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        prompts = kwargs["prompt"] if isinstance(kwargs["prompt"], list) else [kwargs["prompt"]]
+        return SimpleNamespace(images=[Image.new("RGB", (8, 8)) for _ in prompts])
+
+
+def test_generate_and_refine_calls_are_serialized_and_reset_the_feature_cache():
+    resets = []
+    processor = ControlNetProcessor(device="cpu", autotune=False)
+    processor.pipeline = RecordingPipeline()
+    processor.feature_cache = SimpleNamespace(reset=lambda: resets.append(threading.current_thread().name))
+    control = Image.new("RGB", (8, 8))
+
+    # from_pipe shares the UNet, so the img2img pipeline is the same shared state
+    processor.img2img_pipeline = processor.pipeline
+
+    threads = [
+        threading.Thread(target=processor.generate_with_controlnet, args=("a", control)),
+        threading.Thread(target=processor.generate_batch_with_controlnet, args=(["b", "c"], control)),
+        threading.Thread(target=processor.generate_img2img_with_controlnet, args=("d", control, control)),
+        threading.Thread(target=processor.generate_with_controlnet, args=("e", control)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert processor.pipeline.max_active == 1
+    assert len(resets) == 4
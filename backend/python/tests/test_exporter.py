@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.exporter import PLATFORM_FORMATS, PlatformExporter, compute_crop, find_subject_box, parse_platforms
+
+
+def test_parse_platforms_normalizes_and_deduplicates():
+    assert parse_platforms(" Instagram,tiktok,instagram ") == ["instagram", "tiktok"]
+    assert parse_platforms(None) == []
+    with pytest.raises(ValueError):
+        parse_platforms("instagram,myspace")
+
+
+def test_find_subject_box_locates_edges():
+    edges = np.zeros((100, 200), dtype=np.uint8)
+    edges[20:40, 150:180] = 255
+    left, top, right, bottom = find_subject_box(Image.fromarray(edges), trim=0.0)
+    assert (left, top, right, bottom) == pytest.approx((0.75, 0.2, 0.9, 0.4))
+    assert find_subject_box(Image.new("L", (10, 10))) is None
+
+
+def test_compute_crop_has_target_aspect_and_stays_inside():
+    for target in PLATFORM_FORMATS.values():
+        x0, y0, x1, y1 = compute_crop((1024, 1024), target)
+        assert 0 <= x0 < x1 <= 1024 and 0 <= y0 < y1 <= 1024
+        assert (x1 - x0) / (y1 - y0) == pytest.approx(target[0] / target[1], rel=0.01)
+
+
+def test_compute_crop_follows_subject_but_clamps_to_borders():
+    # 9:16 crop of a square image, subject near the right edge
+    x0, _, x1, _ = compute_crop((1024, 1024), (1080, 1920), subject_box=(0.85, 0.4, 0.95, 0.6))
+    assert x1 == 1024
+    assert x0 == 1024 - round(1024 * 1080 / 1920)
+    # Centered subject gives a centered crop
+    x0, _, x1, _ = compute_crop((1024, 1024), (1080, 1920), subject_box=(0.4, 0.4, 0.6, 0.6))
+    assert abs((x0 + x1) / 2 - 512) <= 1
+
+
+def test_export_writes_sizes_and_reports_failed_platforms(tmp_path, monkeypatch):
+    exporter = PlatformExporter(max_workers=2)
+    export_one = exporter._export_one
+
+    def flaky(image, box, target_size, path):
+        if "tiktok" in path:
+            raise OSError("disk full")
+        return export_one(image, box, target_size, path)
+
+    monkeypatch.setattr(exporter, "_export_one", flaky)
+    images = {"ad_1.png": Image.new("RGB", (256, 256), (10, 20, 30))}
+    exports, errors = exporter.export(images, None, ["instagram", "tiktok"], str(tmp_path))
+
+    assert exports == {"instagram": [f"/outputs/{tmp_path.name}/ad_1_instagram.png"]}
+    assert errors == {"tiktok": "disk full"}
+    assert Image.open(tmp_path / "ad_1_instagram.png").size == PLATFORM_FORMATS["instagram"]
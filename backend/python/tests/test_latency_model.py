@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import pytest
+
+from app.latency_model import LatencyModel, latency_key
+from app.scheduler import GenerationScheduler
+
+KEY = latency_key("fake", "cpu", "generate")
+
+
+def _model(tmp_path, **kwargs):
+    return LatencyModel(str(tmp_path / "latency.json"), **kwargs)
+
+
+def test_least_squares_fit_recovers_overhead_and_rate(tmp_path):
+    model = _model(tmp_path)
+    for work in (10, 20, 40, 80):
+        model.record(KEY, work, 2.0 + 0.5 * work)
+    assert model.predict(KEY, 100) == pytest.approx(52.0)
+    assert model.stats()["configurations"][KEY]["overheadSeconds"] == pytest.approx(2.0)
+
+
+def test_equal_sized_jobs_fall_back_to_ratio(tmp_path):
+    model = _model(tmp_path)
+    for seconds in (9.0, 10.0, 11.0):
+        model.record(KEY, 20, seconds)
+    assert model.predict(KEY, 40) == pytest.approx(20.0)
+
+
+def test_unphysical_fit_falls_back_to_ratio(tmp_path):
+    model = _model(tmp_path)
+    # Larger jobs finishing faster would fit a negative rate
+    for work, seconds in ((10, 10.0), (20, 8.0), (40, 6.0)):
+        model.record(KEY, work, seconds)
+    assert model.predict(KEY, 70) == pytest.approx(70 * 24.0 / 70)
+
+
+def test_sparse_configuration_uses_global_rate_then_prior(tmp_path):
+    model = _model(tmp_path, prior_seconds_per_unit=0.3)
+    assert model.predict(KEY, 10) == pytest.approx(3.0)
+
+    other = latency_key("fake", "cpu", "refine")
+    for _ in range(3):
+        model.record(other, 10, 1.0)
+    model.record(KEY, 10, 100.0)
+    # One sample of KEY is below min_samples: rate across all configurations
+    assert model.predict(KEY, 10) == pytest.approx(10 * 103.0 / 40)
+
+
+def test_history_is_saved_only_when_due_and_reloaded(tmp_path):
+    model = _model(tmp_path, save_interval=3600)
+    model.record(KEY, 10, 5.0)
+    assert not model.save_due()
+    assert not (tmp_path / "latency.json").exists()
+
+    model.save()
+    assert json.loads((tmp_path / "latency.json").read_text())["samples"][KEY] == [[10.0, 5.0]]
+    assert _model(tmp_path).predict(KEY, 10) == model.predict(KEY, 10)
+
+    model._last_save -= 3600
+    assert not model.save_due()
+    model.record(KEY, 10, 5.0)
+    assert model.save_due()
+    # Only one caller is told to save per interval
+    assert not model.save_due()
+
+
+def test_scheduler_saves_off_the_event_loop_and_at_shutdown(tmp_path):
+    model = _model(tmp_path, save_interval=3600)
+    scheduler = GenerationScheduler(latency_model=model)
+
+    async def main():
+        await scheduler.submit(lambda: None, latency_key=KEY, work=10)
+
+    asyncio.run(main())
+    assert model.stats()["configurations"][KEY]["samples"] == 1
+    assert not (tmp_path / "latency.json").exists()
+
+    scheduler.shutdown()
+    assert KEY in json.loads((tmp_path / "latency.json").read_text())["samples"]
+
+
+def test_sparse_configuration_follows_new_history_elsewhere(tmp_path):
+    model = _model(tmp_path, prior_seconds_per_unit=0.2)
+    sparse = latency_key("fake", "cpu", "refine")
+    assert model.predict(sparse, 10) == pytest.approx(2.0)
+
+    for _ in range(5):
+        model.record(KEY, 10, 50.0)
+    assert model.predict(sparse, 10) == pytest.approx(50.0)
@@ -0,0 +1,69 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.profiling import ProfileSession, profile_stage
+from app.routes import require_admin
+
+
+def test_concurrent_sessions_do_not_fail(tmp_path):
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def profiled_job():
+        try:
+            with ProfileSession() as session:
+                started.set()
+                release.wait(5)
+            session.save(str(tmp_path), "first")
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=profiled_job)
+    thread.start()
+    started.wait(5)
+
+    with ProfileSession() as second:
+        with profile_stage("decode"):
+            pass
+    summary = second.save(str(tmp_path), "second")
+    release.set()
+    thread.join()
+
+    assert not errors
+    assert not second.traced
+    assert summary["artifacts"] == []
+    assert [stage["name"] for stage in summary["stages"]] == ["decode"]
+    assert (tmp_path / "first" / "trace.json").exists()
+
+
+def test_sessions_trace_again_once_the_first_finishes(tmp_path):
+    with ProfileSession() as first:
+        pass
+    with ProfileSession() as second:
+        pass
+    assert first.traced and second.traced
+
+
+def _request(host):
+    return SimpleNamespace(client=SimpleNamespace(host=host))
+
+
+def test_admin_is_local_only_without_token(monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    require_admin(_request("127.0.0.1"), None)
+    with pytest.raises(HTTPException) as error:
+        require_admin(_request("203.0.113.7"), None)
+    assert error.value.status_code == 403
+
+
+def test_admin_token_is_required_when_set(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    require_admin(_request("203.0.113.7"), "secret")
+    with pytest.raises(HTTPException):
+        require_admin(_request("127.0.0.1"), "wrong")
+    with pytest.raises(HTTPException):
+        require_admin(_request("127.0.0.1"), None)
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.prompt_builder import PromptBuilder, parse_hex_color, srgb_to_lab
+from tests.conftest import TREND_PROFILE
+
+
+def test_parse_hex_color_requires_prefix_for_words():
+    assert parse_hex_color("#1A2B3C") == (26, 43, 60)
+    assert parse_hex_color("#abc") == (170, 187, 204)
+    assert parse_hex_color("1a2b3c") == (26, 43, 60)
+    assert parse_hex_color("#facade") == (250, 202, 222)
+    for word in ("facade", "decade", "accede", "beaded", "bad", "fed"):
+        assert parse_hex_color(word) is None
+    assert parse_hex_color("#12345") is None
+
+
+def test_srgb_to_lab_reference_points():
+    lab = srgb_to_lab(np.array([(0, 0, 0), (255, 255, 255), (255, 0, 0)]))
+    assert lab[0] == pytest.approx((0, 0, 0), abs=1e-6)
+    assert lab[1] == pytest.approx((100, 0, 0), abs=1e-3)
+    assert lab[2] == pytest.approx((53.24, 80.09, 67.20), abs=0.05)
+
+
+def test_nearest_color_names_in_cielab():
+    builder = PromptBuilder()
+    assert builder.nearest_color_names([(10, 60, 200), (250, 250, 245), (200, 30, 40)]) == ["blue", "white", "red"]
+    assert builder.nearest_color_names([]) == []
+
+
+def test_bare_hex_word_is_not_a_color():
+    builder = PromptBuilder()
+    assert builder._resolve_colors(["facade", "#facade", "#bead", "Light Blue"]) == {
+        "facade": None,
+        "#facade": "white",
+        "#bead": None,
+        "Light Blue": "blue"
+    }
+    prompt = builder.build_prompt(dict(TREND_PROFILE, topColors=["facade"]))
+    assert "color palette" not in prompt
+
+
+def test_color_cache_survives_concurrent_resets():
+    builder = PromptBuilder(cache_size=1)
+    colors = [f"#{i:02x}{i:02x}ff" for i in range(64)]
+
+    def resolve(offset):
+        batch = colors[offset:] + colors[:offset]
+        return all(builder._resolve_colors(batch).get(color) for color in batch)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert all(pool.map(resolve, range(64)))
+
+
+def test_hex_top_color_reaches_the_prompt():
+    prompt = PromptBuilder().build_prompt(dict(TREND_PROFILE, topColors=["#0057e7"]))
+    assert "professional blue tones" in prompt
+
+
+def test_build_prompts_keeps_order_and_isolates_bad_profiles():
+    builder = PromptBuilder()
+    profiles = [
+        dict(TREND_PROFILE, industry="fitness", topColors=["#dc141e"]),
+        dict(TREND_PROFILE, industry=None),
+        dict(TREND_PROFILE, industry="beauty", topColors=["pink"]),
+    ]
+    prompts = builder.build_prompts(profiles)
+
+    assert prompts[0] == builder.build_prompt(profiles[0]) and "bold red highlights" in prompts[0]
+    assert prompts[1] == builder._fallback_prompt(profiles[1])
+    assert prompts[2] == builder.build_prompt(profiles[2]) and "Beauty" in prompts[2]
+
+
+def test_repeated_profiles_are_memoized():
+    builder = PromptBuilder()
+    builder.build_prompts([TREND_PROFILE])
+    hits = builder._build_cached.cache_info().hits
+    builder.build_prompts([dict(TREND_PROFILE)] * 3)
+    builder.build_prompt(dict(TREND_PROFILE))
+    assert builder._build_cached.cache_info().hits == hits + 4
+
+
+def test_color_cache_stays_bounded_in_large_batches():
+    builder = PromptBuilder(cache_size=2)
+    profiles = [dict(TREND_PROFILE, topColors=[f"#{i:06x}"]) for i in range(0, 0xffffff, 0xffff)]
+    prompts = builder.build_prompts(profiles)
+
+    assert len(builder._color_cache) <= builder._color_cache_limit
+    assert all("color palette" in prompt for prompt in prompts)
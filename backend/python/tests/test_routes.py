@@ -0,0 +1,135 @@
+import pytest
+
+from app import routes
+from tests.conftest import generate_form, make_png
+
+
+def _spy_enqueue(monkeypatch, scheduler):
+    calls = []
+    enqueue = scheduler.enqueue
+
+    def spy(fn, **kwargs):
+        calls.append(kwargs)
+        return enqueue(fn, **kwargs)
+
+    monkeypatch.setattr(scheduler, "enqueue", spy)
+    return calls
+
+
+def test_refine_is_accounted_to_the_stored_tenant_and_steps(client, scheduler, monkeypatch):
+    generated = client.post(
+        "/generate",
+        data=generate_form(tenant="acme", num_inference_steps="20"),
+        files={"product_image": ("p.png", make_png(), "image/png")}
+    )
+    assert generated.status_code == 200, generated.text
+
+    calls = _spy_enqueue(monkeypatch, scheduler)
+    refined = client.post("/refine", data={
+        "request_id": generated.json()["requestId"],
+        "image_index": "1",
+        "strength": "0.5",
+        "num_variations": "2",
+        "tenant": "someone-else"
+    })
+    assert refined.status_code == 200, refined.text
+    assert calls[0]["tenant"] == "acme"
+    assert calls[0]["work"] == 2 * 20 * 0.5
+
+
+def test_refine_of_unknown_result_is_rejected_before_queueing(client, scheduler, monkeypatch):
+    calls = _spy_enqueue(monkeypatch, scheduler)
+    response = client.post("/refine", data={"request_id": "00000000-0000-0000-0000-000000000000", "image_index": "1"})
+    assert response.status_code == 404
+    assert calls == []
+
+
+def test_generator_is_created_once(monkeypatch):
+    import threading
+
+    created = []
+    monkeypatch.setattr(routes, "_generator", None)
+    monkeypatch.setattr(routes, "SDXLGenerator", lambda: created.append(1) or object())
+
+    threads = [threading.Thread(target=routes.get_generator) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+
+
+def test_full_queue_is_rejected_before_the_body_is_read(monkeypatch, scheduler):
+    import asyncio
+    from app.main import app
+    from app.scheduler import QueueFullError
+
+    def full():
+        raise QueueFullError(12.2)
+
+    monkeypatch.setattr(routes, "_scheduler", scheduler)
+    monkeypatch.setattr(scheduler, "check_admission", full)
+
+    async def receive():
+        raise AssertionError("request body was read")
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/generate", "raw_path": b"/generate", "root_path": "",
+        "scheme": "http", "query_string": b"", "headers": [(b"content-type", b"multipart/form-data; boundary=x")],
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80), "http_version": "1.1"
+    }
+    asyncio.run(app(scope, receive, send))
+
+    start = messages[0]
+    assert start["status"] == 429
+    assert (b"retry-after", b"13") in start["headers"]
+
+
+def test_export_failure_does_not_fail_the_generation(client, stub_generator, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("exporter crashed")
+
+    monkeypatch.setattr(stub_generator.exporter, "export", broken)
+    response = client.post(
+        "/generate",
+        data=generate_form(export_platforms="instagram,tiktok"),
+        files={"product_image": ("p.png", make_png(), "image/png")}
+    )
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["numGenerated"] == 3
+    assert body["exports"] == {}
+    assert body["exportErrors"] == {"instagram": "exporter crashed", "tiktok": "exporter crashed"}
+
+
+def test_latency_key_does_not_create_the_generator(monkeypatch):
+    monkeypatch.setattr(routes, "_generator", None)
+    monkeypatch.setattr(routes, "SDXLGenerator", lambda: pytest.fail("generator created"))
+    monkeypatch.setenv("INFERENCE_BACKEND", "onnx")
+    assert routes._latency_key("refine").startswith("onnx:")
+
+
+def test_responses_report_the_eta_predicted_at_admission(client, scheduler, monkeypatch):
+    jobs = []
+    enqueue = scheduler.enqueue
+    monkeypatch.setattr(scheduler, "enqueue", lambda fn, **kwargs: jobs.append(enqueue(fn, **kwargs)) or jobs[-1])
+    scheduler.latency_model.prior_seconds_per_unit = 0.5
+
+    generated = client.post(
+        "/generate",
+        data=generate_form(num_images="3", num_inference_steps="10"),
+        files={"product_image": ("p.png", make_png(), "image/png")}
+    )
+    assert generated.status_code == 200, generated.text
+    # Empty queue and no history: 3 images x 10 steps at the prior rate
+    assert jobs[0].eta == pytest.approx(15.0)
+    assert generated.json()["etaSeconds"] == pytest.approx(jobs[0].eta)
+
+    refined = client.post("/refine", data={"request_id": generated.json()["requestId"], "image_index": "1"})
+    assert refined.status_code == 200, refined.text
+    assert refined.json()["etaSeconds"] == pytest.approx(jobs[1].eta)
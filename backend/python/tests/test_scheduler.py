@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.latency_model import LatencyModel
+from app.scheduler import (
+    BULK, INTERACTIVE, DeadlineExceededError, GenerationScheduler, QueueFullError, _FairQueue, parse_weights
+)
+
+
+def _scheduler(tmp_path, **kwargs):
+    return GenerationScheduler(latency_model=LatencyModel(str(tmp_path / "latency.json")), **kwargs)
+
+
+def _blocker():
+    """A job function that runs until released"""
+    release = threading.Event()
+    return release, lambda: release.wait(5)
+
+
+def test_parse_weights():
+    assert parse_weights("brand-a=2, brand-b=0.5,bogus") == {"brand-a": 2.0, "brand-b": 0.5}
+
+
+def test_fair_queue_serves_flows_in_proportion_to_weight():
+    queue = _FairQueue({"a": 3.0, "b": 1.0})
+    for i in range(8):
+        queue.push("a", f"a{i}")
+        queue.push("b", f"b{i}")
+
+    served = []
+    for _ in range(8):
+        flow = queue.pick(lambda flow: True)
+        served.append(flow)
+        queue.pop(flow, 1.0)
+    assert served.count("a") == 6
+    assert served.count("b") == 2
+
+
+def test_fair_queue_idle_flow_builds_no_credit():
+    queue = _FairQueue({})
+    for i in range(4):
+        queue.push("busy", i)
+    for _ in range(4):
+        queue.pop(queue.pick(lambda flow: True), 1.0)
+
+    queue.push("busy", "next")
+    queue.push("idle", "first")
+    # The idle flow starts at the current virtual time instead of far behind
+    assert queue.passes["idle"] == queue.virtual_time
+
+
+def test_fair_queue_remove_does_not_charge_the_flow():
+    queue = _FairQueue({})
+    queue.push("a", 1)
+    queue.push("a", 2)
+    queue.remove("a", 2)
+    assert queue.passes["a"] == 0.0
+    assert queue.depth("a") == 1
+    queue.remove("a", 1)
+    assert queue.depth() == 0
+
+
+def test_cancelled_jobs_free_their_queue_slots(tmp_path):
+    async def scenario():
+        scheduler = _scheduler(tmp_path, max_queue=3)
+        release, block = _blocker()
+        running = scheduler.enqueue(block, cost=10.0)
+
+        queued = [scheduler.enqueue(lambda: None, cost=5.0) for _ in range(3)]
+        with pytest.raises(QueueFullError):
+            scheduler.enqueue(lambda: None, cost=5.0)
+
+        for job in queued:
+            job.future.cancel()
+        # Checked synchronously, before the futures' done-callbacks have run
+        assert scheduler.queue_depth() == 0
+        assert scheduler.estimate_wait(BULK) == pytest.approx(10.0, abs=0.5)
+        scheduler.enqueue(lambda: None, cost=5.0)
+
+        release.set()
+        await running.future
+
+    asyncio.run(scenario())
+
+
+def test_expired_jobs_are_dropped_before_starting(tmp_path):
+    async def scenario():
+        scheduler = _scheduler(tmp_path, max_queue=1)
+        release, block = _blocker()
+        running = scheduler.enqueue(block, cost=0.0)
+
+        started = []
+        expiring = scheduler.enqueue(lambda: started.append(True), cost=0.0, deadline=time.monotonic() + 0.05)
+        await asyncio.sleep(0.1)
+
+        # The expired job no longer holds the only queue slot
+        assert scheduler.queue_depth() == 0
+        with pytest.raises(DeadlineExceededError):
+            await expiring.future
+        scheduler.enqueue(lambda: None, cost=0.0)
+
+        release.set()
+        await running.future
+        assert not started
+
+    asyncio.run(scenario())
+
+
+def test_infeasible_deadline_is_rejected_at_enqueue(tmp_path):
+    async def scenario():
+        scheduler = _scheduler(tmp_path)
+        release, block = _blocker()
+        running = scheduler.enqueue(block, cost=60.0)
+        with pytest.raises(DeadlineExceededError):
+            scheduler.enqueue(lambda: None, cost=1.0, deadline=time.monotonic() + 5)
+        release.set()
+        await running.future
+
+    asyncio.run(scenario())
+
+
+def test_queue_full_retry_after_follows_running_job(tmp_path):
+    async def scenario():
+        scheduler = _scheduler(tmp_path, max_queue=1)
+        release, block = _blocker()
+        running = scheduler.enqueue(block, cost=30.0)
+        scheduler.enqueue(lambda: None, cost=1.0)
+        with pytest.raises(QueueFullError) as error:
+            scheduler.check_admission()
+        assert 25 < error.value.retry_after <= 30
+        release.set()
+        await running.future
+
+    asyncio.run(scenario())
+
+
+def test_interactive_overtakes_bulk_backlog(tmp_path):
+    async def scenario():
+        scheduler = _scheduler(tmp_path)
+        release, block = _blocker()
+        running = scheduler.enqueue(block, cost=1.0)
+
+        order = []
+        bulk = [scheduler.enqueue(lambda i=i: order.append(f"bulk{i}"), lane=BULK, cost=1.0) for i in range(8)]
+        interactive = [scheduler.enqueue(lambda: order.append("interactive"), lane=INTERACTIVE, cost=1.0) for _ in range(4)]
+
+        release.set()
+        await asyncio.gather(running.future, *(job.future for job in bulk + interactive))
+        # With lane weights 8:1 all interactive jobs run before the second bulk job
+        last_interactive = max(i for i, name in enumerate(order) if name == "interactive")
+        assert last_interactive < order.index("bulk1")
+
+    asyncio.run(scenario())
+
+
+def test_tenant_cap_limits_concurrent_jobs(tmp_path):
+    async def scenario():
+        scheduler = _scheduler(tmp_path, workers=2, default_tenant_cap=1)
+        release, block = _blocker()
+        first = scheduler.enqueue(block, tenant="acme", cost=1.0)
+        second = scheduler.enqueue(lambda: None, tenant="acme", cost=1.0)
+        other = scheduler.enqueue(lambda: None, tenant="globex", cost=1.0)
+
+        await other.future
+        assert not second.future.done()
+        release.set()
+        await asyncio.gather(first.future, second.future)
+
+    asyncio.run(scenario())
@@ -0,0 +1,41 @@
+import json
+
+import torch
+from safetensors.torch import save_file
+
+from app.controlnet import CONTROLNET_MODEL_ID, ControlNetProcessor
+from app.snapshot import SNAPSHOT_MANIFEST, check_snapshot_manifest, mmap_safetensors
+
+BASE_MODEL_ID = "stabilityai/stable-diffusion-xl-base-1.0"
+
+
+def _manifest(**overrides):
+    manifest = {"baseModelId": BASE_MODEL_ID, "controlnetId": CONTROLNET_MODEL_ID, "dtype": "torch.float16"}
+    manifest.update(overrides)
+    return manifest
+
+
+def test_matching_manifest_is_accepted():
+    assert check_snapshot_manifest(_manifest(), BASE_MODEL_ID, CONTROLNET_MODEL_ID, torch.float16) is None
+
+
+def test_mismatched_manifest_is_refused():
+    assert "dtype" in check_snapshot_manifest(_manifest(), BASE_MODEL_ID, CONTROLNET_MODEL_ID, torch.float32)
+    assert "baseModelId" in check_snapshot_manifest(_manifest(baseModelId="other/sdxl"), BASE_MODEL_ID, CONTROLNET_MODEL_ID, torch.float16)
+    assert "controlnetId" in check_snapshot_manifest(_manifest(controlnetId="other/cn"), BASE_MODEL_ID, CONTROLNET_MODEL_ID, torch.float16)
+
+
+def test_fp16_snapshot_is_not_loaded_on_fp32_host(tmp_path):
+    (tmp_path / SNAPSHOT_MANIFEST).write_text(json.dumps(_manifest()))
+    processor = ControlNetProcessor(device="cpu", torch_dtype=torch.float32, autotune=False)
+    assert processor.load_from_snapshot(str(tmp_path), BASE_MODEL_ID) is False
+    assert processor.pipeline is None
+
+
+def test_mmap_safetensors_round_trip(tmp_path):
+    tensors = {"weight": torch.arange(12, dtype=torch.float16).reshape(3, 4), "bias": torch.ones(4)}
+    path = str(tmp_path / "model.safetensors")
+    save_file(tensors, path)
+    loaded = mmap_safetensors(path)
+    assert torch.equal(loaded["weight"], tensors["weight"])
+    assert torch.equal(loaded["bias"], tensors["bias"])
@@ -0,0 +1,118 @@
+import hashlib
+import os
+
+import pytest
+
+from app.upload_store import UploadStore, decode_image_file
+from tests.conftest import make_png
+
+
+@pytest.fixture
+def store(tmp_path):
+    root = tmp_path / "uploads"
+    root.mkdir()
+    return UploadStore(str(root))
+
+
+def _write(path, data, mtime_ns=None):
+    path.write_bytes(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_resolve_path_stays_inside_the_root(store, tmp_path):
+    root = tmp_path / "uploads"
+    _write(root / "a.png", make_png())
+    (tmp_path / "secret.png").write_bytes(make_png())
+    os.symlink(tmp_path / "secret.png", root / "link.png")
+
+    assert store.resolve_path("a.png") == str(root / "a.png")
+    for ref in ("../secret.png", str(tmp_path / "secret.png"), "link.png", "a.png\0", ""):
+        with pytest.raises(ValueError):
+            store.resolve_path(ref)
+    with pytest.raises(FileNotFoundError):
+        store.resolve_path("missing.png")
+
+
+def test_resolve_hash_finds_uploads_and_rejects_bad_digests(store, tmp_path):
+    digest = _write(tmp_path / "uploads" / "a.png", make_png())
+    assert store.resolve_hash(digest.upper()) == str(tmp_path / "uploads" / "a.png")
+    with pytest.raises(ValueError):
+        store.resolve_hash("not-a-digest")
+    with pytest.raises(FileNotFoundError):
+        store.resolve_hash("0" * 64)
+
+
+def test_resolve_hash_never_returns_overwritten_content(store, tmp_path):
+    path = tmp_path / "uploads" / "a.png"
+    old_digest = _write(path, make_png(color=(255, 0, 0)), mtime_ns=1_000_000_000)
+    assert store.resolve_hash(old_digest) == str(path)
+
+    new_digest = _write(path, make_png(color=(0, 0, 255)), mtime_ns=2_000_000_000)
+    with pytest.raises(FileNotFoundError):
+        store.resolve_hash(old_digest)
+    assert store.resolve_hash(new_digest) == str(path)
+
+
+def test_resolve_hash_ignores_symlinks(store, tmp_path):
+    digest = _write(tmp_path / "outside.png", make_png())
+    os.symlink(tmp_path / "outside.png", tmp_path / "uploads" / "link.png")
+    with pytest.raises(FileNotFoundError):
+        store.resolve_hash(digest)
+
+
+def test_decode_image_file(tmp_path):
+    _write(tmp_path / "a.png", make_png(size=32))
+    assert decode_image_file(str(tmp_path / "a.png")).size == (32, 32)
+    (tmp_path / "empty.png").write_bytes(b"")
+    with pytest.raises(ValueError):
+        decode_image_file(str(tmp_path / "empty.png"))
+    (tmp_path / "text.png").write_bytes(b"not an image")
+    with pytest.raises(ValueError):
+        decode_image_file(str(tmp_path / "text.png"))
+
+
+def test_unknown_digests_rescan_at_most_once_per_interval(store, tmp_path, monkeypatch):
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: scans.append(path) or scandir(path))
+    store.refresh_interval = 3600
+
+    for _ in range(5):
+        with pytest.raises(FileNotFoundError):
+            store.resolve_hash("0" * 64)
+    assert len(scans) == 1
+
+    digest = _write(tmp_path / "uploads" / "a.png", make_png())
+    with pytest.raises(FileNotFoundError):
+        store.resolve_hash(digest)
+    store._last_refresh -= 3600
+    assert store.resolve_hash(digest) == str(tmp_path / "uploads" / "a.png")
+
+
+def test_scans_hash_newest_uploads_first_within_budget(store, tmp_path):
+    root = tmp_path / "uploads"
+    digests = [_write(root / f"{i}.png", make_png(color=(i, 0, 0)), mtime_ns=(i + 1) * 10 ** 9) for i in range(3)]
+    store.max_hash_bytes = (root / "0.png").stat().st_size
+    store.refresh_interval = 3600
+
+    # One file per scan; unfinished scans resume on the next lookup
+    assert store.resolve_hash(digests[2]) == str(root / "2.png")
+    with pytest.raises(FileNotFoundError):
+        store.resolve_hash(digests[0])
+    assert store.resolve_hash(digests[0]) == str(root / "0.png")
+    assert store._index_complete
+
+
+def test_decode_image_file_matches_uploaded_images(tmp_path):
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotate 90 degrees on display
+    Image.new("RGB", (40, 20)).save(tmp_path / "rotated.jpg", "JPEG", exif=exif)
+    assert decode_image_file(str(tmp_path / "rotated.jpg")).size == (40, 20)
+
+    Image.new("RGB", (8, 8)).save(tmp_path / "a.tiff", "TIFF")
+    with pytest.raises(ValueError):
+        decode_image_file(str(tmp_path / "a.tiff"))